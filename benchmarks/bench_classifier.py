@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+قياس أداء مصنّف الرسائل مقابل الطريقة القديمة (is_economic_data + any() على الكلمات).
+
+الاستخدام:
+    python benchmarks/bench_classifier.py [--corpus benchmarks/headlines.txt] [--repeat 200]
+
+يعرض: متوسط/أقصى تكلفة لكل رسالة على مجموعة عناوين حقيقية،
+نسبة التطابق مع التصنيف القديم، وسلوك المدخلات الطويلة الأسوأ حالًا.
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier import MessageClassifier, CATEGORY_ECONOMIC, CATEGORY_MACRO, CATEGORY_KEYWORD  # noqa: E402
+
+KEYWORDS_LIST = ["JUST IN", "MACRO", "$MACRO", "marco", "FEDERAL", "POWELL", "powell", "TRUMP", "FED'S", "FED", "🔴"]
+
+# النمط القديم كما كان في bot.py (للمقارنة فقط)
+LEGACY_PATTERN = r"""
+    (?:
+        \b(?:ACT(?:UAL)?|FORECAST|EST(?:IMATED)?|PREV(?:IOUS)?|REVISED?)\b
+        [:=;]?\s*[-+]?\d+(?:\.\d+)?%?(?:[MBK]|MILLION|BILLION|THOUSAND)?|
+        [-+]?\d+(?:\.\d+)?%?\s+(?:VS|VERSUS|VS\.)\s+[-+]?\d+(?:\.\d+)?%?|
+        \([^)]*(?:ACT(?:UAL)?|FORECAST|EST|PREV|REVISED?)[^)]*\d[^)]*\)|
+        \b(?:PMI|ISM|JOLTS|CPI|GDP|NFP|NONFARM|JOBS?|ORDERS?|DURABLE|FACTORY|IVES?|PRICES?|EMPLOYMENT|NEW\s+ORDERS?)\b
+        .{0,50}?(?:\d+(?:\.\d+)?%?|[-+]\d+(?:\.\d+)?%?)|
+        \b\d+(?:\.\d+)?[MBK](?:ILLION|ILLION)?\b
+    )
+    .*?
+    (?:
+        (?:ACT(?:UAL)?|FORECAST|EST|PREV|REVISED?)|
+        \d+(?:\.\d+)?%?|
+        [MBK]
+    )
+"""
+
+
+def legacy_classify(text: str) -> str:
+    if re.search(LEGACY_PATTERN, text, re.IGNORECASE | re.VERBOSE):
+        return CATEGORY_ECONOMIC
+    text_lower = text.lower()
+    if any(keyword.lower() in text_lower for keyword in KEYWORDS_LIST):
+        return CATEGORY_MACRO if "MACRO" in text.upper() else CATEGORY_KEYWORD
+    return "other"
+
+
+def clean(text: str) -> str:
+    text = re.sub(r"http\S+|www\.\S+", "", text)
+    text = re.sub(r"\$", "", text)
+    return text.strip()
+
+
+def time_per_call(func, text: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(text)
+    return (time.perf_counter() - start) / repeat
+
+
+def worst_case_inputs(size: int) -> dict:
+    return {
+        "unclosed-parens": "(ACT " * (size // 5),
+        "indicators-no-digits": "CPI PMI GDP JOBS " * (size // 17),
+        "fields-no-digits": "ACTUAL FORECAST PREV " * (size // 21),
+        "numbers-no-tail": ("1 " * (size // 2)) + "\n" + "x" * 10,
+        "plain-words": "markets wait for the decision " * (size // 30),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "headlines.txt"))
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [clean(line) for line in f if line.strip()]
+
+    classifier = MessageClassifier(KEYWORDS_LIST)
+    classify = classifier.classify
+
+    agree = 0
+    for text in corpus:
+        if classify(text).category == legacy_classify(text):
+            agree += 1
+        else:
+            print(f"  ≠ {legacy_classify(text):8} -> {classify(text).category:8} | {text[:70]}")
+    print(f"التطابق مع التصنيف القديم: {agree}/{len(corpus)}")
+
+    new_costs = [time_per_call(classify, t, args.repeat) for t in corpus]
+    old_costs = [time_per_call(legacy_classify, t, args.repeat) for t in corpus]
+    print(f"\nالمجموعة ({len(corpus)} عنوانًا):")
+    print(f"  الجديد: متوسط {sum(new_costs) / len(new_costs) * 1e6:7.1f} µs | أقصى {max(new_costs) * 1e6:7.1f} µs")
+    print(f"  القديم: متوسط {sum(old_costs) / len(old_costs) * 1e6:7.1f} µs | أقصى {max(old_costs) * 1e6:7.1f} µs")
+
+    print("\nمدخلات طويلة (أسوأ حالة) — التكلفة لكل KB يجب أن تبقى ثابتة تقريبًا مع الحجم:")
+    for size in (1_000, 4_000, 16_000):
+        for name, text in worst_case_inputs(size).items():
+            new_cost = time_per_call(classify, text, 3)
+            line = f"  {name:22} {size // 1000:>3}KB  الجديد {new_cost * 1e3:8.2f} ms ({new_cost * 1e6 / (len(text) / 1000):7.1f} µs/KB)"
+            if size <= 4_000:
+                old_cost = time_per_call(legacy_classify, text, 1)
+                line += f" | القديم {old_cost * 1e3:9.2f} ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+أداة إعادة تشغيل دون اتصال لقياس أداء EcoPulse.
+
+تشغّل منطق bot.py الحقيقي (handle_source / publisher / generate_hourly_summary)
+على عميل Telegram وهمي داخل العملية (رسائل، مشاهدات، حقن FloodWait)
+وخادم LLM محلي متوافق مع OpenAI بزمن استجابة ونسبة أخطاء قابلة للضبط.
+
+الاستخدام:
+    python benchmarks/replay_harness.py --rate 20 --messages 300 --llm-latency 0.8 --llm-error-rate 0.05
+
+المدخلات: ملف JSONL بحقول {"source": "source1|source2|analyst|hourly", "text": "..."}
+أو ملف نصي (عنوان في كل سطر) يوزَّع على المصادر.
+المخرجات: الإنتاجية، مئينات زمن الطرف للطرف، طلبات LLM، وذروة الذاكرة.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TARGET_ID, ANALYST_TARGET_ID, HOURLY_TARGET_ID = -1001, -1002, -1003
+SOURCE_IDS = {"source1": -2001, "source2": -2002, "analyst": -2003, "hourly": -2004}
+
+
+# ---------------- خادم LLM محلي ----------------
+class StubLLMServer:
+    """خادم HTTP بسيط يحاكي /v1/chat/completions (مع البث SSE) بزمن ونسبة أخطاء محددة."""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, rate_limit_share: float,
+                 chunk_delay: float = 0.0):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_share = rate_limit_share
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode("latin-1").split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                status, headers, payload = await self._respond(body)
+                if body.get("stream") and status.startswith("200"):
+                    await self._stream(writer, payload)
+                    break
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                extra = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n{extra}"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, body):
+        self.requests += 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            self.errors += 1
+            if random.random() < self.rate_limit_share:
+                return "429 Too Many Requests", {"retry-after": "1"}, {
+                    "error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            return "500 Internal Server Error", {}, {"error": {"message": "stub failure", "type": "server_error"}}
+
+        messages = body.get("messages", [])
+        user = messages[-1]["content"] if messages else ""
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            items = json.loads(user)
+            content = json.dumps({"items": [
+                {"id": item["id"], "impact": "🟢 تأثير إيجابي", "translation": f"ترجمة: {item['text'][:80]}"}
+                for item in items
+            ]}, ensure_ascii=False)
+        else:
+            content = f"🟢 تأثير إيجابي ### ترجمة: {user[:120]}"
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 3
+        return "200 OK", {}, {
+            "id": f"chatcmpl-{self.requests}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 3,
+                      "total_tokens": prompt_tokens + len(content) // 3},
+        }
+
+    async def _stream(self, writer, payload):
+        """بث الإجابة كأحداث SSE (أجزاء صغيرة بفاصل chunk_delay) ثم إغلاق الاتصال."""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n")
+        content = payload["choices"][0]["message"]["content"]
+        base = {"id": payload["id"], "object": "chat.completion.chunk", "created": payload["created"],
+                "model": payload["model"]}
+        for start in range(0, len(content), 12):
+            chunk = dict(base, choices=[{"index": 0, "delta": {"content": content[start:start + 12]}, "finish_reason": None}])
+            writer.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await writer.drain()
+            await asyncio.sleep(self.chunk_delay)
+        done = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        writer.write(f"data: {json.dumps(done)}\n\n".encode())
+        writer.write(f"data: {json.dumps(dict(base, choices=[], usage=payload['usage']))}\n\ndata: [DONE]\n\n".encode())
+        await writer.drain()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+# ---------------- عميل Telegram وهمي ----------------
+class FakeMessage:
+    __slots__ = ("id", "chat_id", "message", "action", "date", "media", "grouped_id", "views", "sent_at")
+
+    def __init__(self, message_id, chat_id, text):
+        self.id = message_id
+        self.chat_id = chat_id
+        self.message = text
+        self.action = None
+        self.date = datetime.now(timezone.utc)
+        self.media = None
+        self.grouped_id = None
+        self.views = 0
+        self.sent_at = time.monotonic()
+
+
+class FakeEvent:
+    __slots__ = ("message", "chat_id", "raw_text")
+
+    def __init__(self, message):
+        self.message = message
+        self.chat_id = message.chat_id
+        self.raw_text = message.message
+
+    async def reply(self, text):
+        return None
+
+
+class FakeTelegramClient:
+    """
+    يحاكي send_message / send_file / get_messages / edit_message مع نمو المشاهدات وحقن FloodWait.
+    views_failure_rate: نسبة طلبات get_messages التي تفشل (لاختبار تجاوز البوابة عند تعذر الجلب).
+    """
+
+    def __init__(self, views_per_second: float, flood_rate: float, flood_seconds: int, send_latency: float,
+                 views_failure_rate: float = 0.0):
+        self.views_per_second = views_per_second
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.send_latency = send_latency
+        self.views_failure_rate = views_failure_rate
+        self.views_failures = 0
+        self.posts = {}
+        self.sent_by_chat = {}
+        self.floods = 0
+        self.edits = 0
+        self._ids = itertools.count(1)
+
+    async def _maybe_flood(self):
+        from telethon.errors import FloodWaitError
+        await asyncio.sleep(self.send_latency)
+        if random.random() < self.flood_rate:
+            self.floods += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+
+    async def send_message(self, entity, message, **kwargs):
+        await self._maybe_flood()
+        post = FakeMessage(next(self._ids), entity, message)
+        self.posts[post.id] = post
+        self.sent_by_chat[entity] = self.sent_by_chat.get(entity, 0) + 1
+        return post
+
+    async def send_file(self, entity, file, caption=None, **kwargs):
+        # مثل Telethon: قائمة وسائط = ألبوم يعيد قائمة رسائل، والتعليق على الأولى
+        files = file if isinstance(file, list) else [file]
+        posts = []
+        for index, media in enumerate(files):
+            post = await self.send_message(entity, (caption or "") if index == 0 else "")
+            post.media = media
+            posts.append(post)
+        return posts if isinstance(file, list) else posts[0]
+
+    async def edit_message(self, entity, message, text=None, **kwargs):
+        await self._maybe_flood()
+        self.edits += 1
+        post = self.posts.get(getattr(message, "id", message))
+        if post is not None:
+            post.message = text
+        return post
+
+    async def get_messages(self, entity, ids=None, **kwargs):
+        if random.random() < self.views_failure_rate:
+            self.views_failures += 1
+            raise ConnectionError("stub views fetch failure")
+        now = time.monotonic()
+
+        def lookup(post_id):
+            post = self.posts.get(post_id)
+            if post is not None:
+                post.views = int((now - post.sent_at) * self.views_per_second)
+            return post
+
+        if isinstance(ids, (list, tuple)):
+            return [lookup(post_id) for post_id in ids]
+        return lookup(ids)
+
+    async def get_me(self):
+        return FakeMessage(0, 0, "")
+
+
+# ---------------- المدخلات ----------------
+def load_corpus(path: str):
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                entries.append((record.get("source", "source2"), record["text"]))
+            else:
+                entries.append((None, line))
+    return entries
+
+
+def pick_source(declared, mix):
+    if declared:
+        return declared
+    roll = random.random()
+    for name, share in mix:
+        if roll < share:
+            return name
+        roll -= share
+    return "source2"
+
+
+def percentiles(samples):
+    if not samples:
+        return "—"
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return f"p50={pick(0.5):.2f}s p95={pick(0.95):.2f}s p99={pick(0.99):.2f}s (n={len(ordered)})"
+
+
+def counter_totals(metrics, name: str, *labels) -> dict:
+    """مجموع عداد من bot.metrics لكل تركيبة من الوسوم المطلوبة (مفتاحها القيم مفصولة بـ /)."""
+    totals = {}
+    for (counter, counter_labels), value in metrics.counters.items():
+        if counter == name:
+            label_map = dict(counter_labels)
+            key = "/".join(str(label_map.get(label, "")) for label in labels)
+            totals[key] = totals.get(key, 0) + int(value)
+    return totals
+
+
+# ---------------- التشغيل ----------------
+async def run(args) -> dict:
+    """يشغّل إعادة التشغيل ويطبع النتائج ويعيدها كقاموس (تستخدمه الاختبارات)."""
+    random.seed(args.seed)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    stub = StubLLMServer(args.llm_latency, args.llm_jitter, args.llm_error_rate, args.rate_limit_share,
+                         args.llm_chunk_delay)
+    port = await stub.start()
+
+    # إعدادات البيئة قبل استيراد البوت: مفاتيح وهمية، خادم LLM محلي، بدون تخزين دائم
+    os.environ.update({
+        "API_ID": os.environ.get("API_ID", "1"),
+        "API_HASH": os.environ.get("API_HASH", "offline"),
+        "OPENAI_API_KEYS": ",".join(f"sk-stub-{i}" for i in range(args.keys)),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "LLM_CACHE_PATH": "",
+        "QUEUE_DB_PATH": "",
+        "ENTITY_CACHE_PATH": "",
+        "ROUTES_PATH": "",
+        "METRICS_PORT": "0",
+        "LLM_MAX_CONCURRENCY": str(args.concurrency),
+        "LLM_BATCH_ENABLED": "1" if args.batch else "0",
+        "LLM_STREAM_ENABLED": "1" if args.stream else "0",
+        "STREAM_EDIT_INTERVAL": str(args.stream_edit_interval),
+        "SEND_MIN_INTERVAL": str(args.send_min_interval),
+        "VIEWS_WAIT_TIMEOUT": str(args.views_wait_timeout),
+    })
+    import bot
+
+    fake = FakeTelegramClient(args.views_per_second, args.flood_rate, args.flood_seconds, args.send_latency,
+                              args.views_failure_rate)
+    bot.client = fake
+    bot.init_runtime()
+    bot.bot_active = True
+    bot.TARGET_CHANNEL_ID = TARGET_ID
+    bot.ANALYST_TARGET_ID = ANALYST_TARGET_ID
+    bot.HOURLY_TARGET_ID = HOURLY_TARGET_ID
+    bot.routing_table.install([
+        bot.Route(SOURCE_IDS["source1"], bot.PIPELINE_IMMEDIATE, TARGET_ID, bot.EMOJI_IMMEDIATE, bot.GATE_VIEWS),
+        bot.Route(SOURCE_IDS["source2"], bot.PIPELINE_SCHEDULED, TARGET_ID, bot.EMOJI_SCHEDULED, bot.GATE_VIEWS),
+        bot.Route(SOURCE_IDS["analyst"], bot.PIPELINE_ANALYST, ANALYST_TARGET_ID, bot.EMOJI_ALERT, bot.GATE_VIEWS),
+        bot.Route(SOURCE_IDS["hourly"], bot.PIPELINE_HOURLY, HOURLY_TARGET_ID, bot.EMOJI_HOURLY, bot.GATE_VIEWS),
+    ])
+    bot.MIN_VIEWS_FOR_NEXT = args.min_views
+    bot.PUBLISHER_SEND_INTERVAL = args.publisher_interval
+    bot.views_tracker.poll_interval = args.views_poll
+    bot.views_tracker.freshness = args.views_poll * 3
+
+    corpus = load_corpus(args.corpus)
+    mix = [("source1", args.mix_source1), ("analyst", args.mix_analyst), ("hourly", args.mix_hourly)]
+
+    tracemalloc.start()
+    background = [
+        asyncio.create_task(bot.publisher()),
+        asyncio.create_task(bot.prefetcher()),
+        asyncio.create_task(bot.views_tracker.run()),
+    ]
+    handler_tasks = []
+    message_ids = itertools.count(1)
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    started = time.monotonic()
+    for index in range(args.messages):
+        declared, text = corpus[index % len(corpus)]
+        if index >= len(corpus):
+            text = f"{text} #{index // len(corpus)}"  # تجنب حجب التكرار عند الدوران على المجموعة
+        source = pick_source(declared, mix)
+        message = FakeMessage(next(message_ids), SOURCE_IDS[source], text)
+        handler_tasks.append(asyncio.create_task(bot.dispatch_message(FakeEvent(message))))
+        if interval:
+            await asyncio.sleep(interval)
+    ingest_seconds = time.monotonic() - started
+
+    await asyncio.gather(*handler_tasks, return_exceptions=True)
+    deadline = time.monotonic() + args.drain_timeout
+    while bot.translation_queue and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+
+    hourly_started = time.monotonic()
+    await bot.generate_hourly_summary(manual=True)
+    hourly_seconds = time.monotonic() - hourly_started
+    total_seconds = time.monotonic() - started
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await bot.openai_manager.close()
+    stub.close()
+
+    e2e = {}
+    for (name, labels), histogram in bot.metrics.histograms.items():
+        label_map = dict(labels)
+        if name == bot.METRIC_STAGE_SECONDS and label_map.get("stage") == "e2e":
+            e2e[label_map.get("path", "?")] = list(histogram.samples)
+
+    posts = sum(fake.sent_by_chat.values())
+    report = {
+        "messages": args.messages,
+        "ingest_seconds": round(ingest_seconds, 2),
+        "total_seconds": round(total_seconds, 2),
+        "ingest_rate": round(args.messages / ingest_seconds, 1) if ingest_seconds else None,
+        "posts": posts,
+        "posts_per_second": round(posts / total_seconds, 2) if total_seconds else None,
+        "left_in_queue": len(bot.translation_queue),
+        "llm_requests": stub.requests,
+        "llm_errors_injected": stub.errors,
+        "flood_waits_injected": fake.floods,
+        "views_failures_injected": fake.views_failures,
+        "posts_by_target": {str(chat): count for chat, count in fake.sent_by_chat.items()},
+        "categories": counter_totals(bot.metrics, "ecopulse_messages_total", "category"),
+        "duplicates": counter_totals(bot.metrics, "ecopulse_duplicates_total", "scope"),
+        "gate": counter_totals(bot.metrics, "ecopulse_gate_decisions_total", "gate", "result"),
+        "edits": fake.edits,
+        "hourly_summary_seconds": round(hourly_seconds, 2),
+        "peak_traced_mb": round(peak_traced / 1e6, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stats": dict(bot.stats),
+    }
+    print("\n📊 نتائج إعادة التشغيل")
+    for key, value in report.items():
+        print(f"  {key:24} {value}")
+    print("  زمن الطرف للطرف:")
+    for path, samples in sorted(e2e.items()):
+        print(f"    {path:12} {percentiles(samples)}")
+    print("\n⏱️ المراحل:")
+    print(bot.metrics.percentiles_report())
+    if args.output:
+        report["e2e"] = {path: percentiles(samples) for path, samples in e2e.items()}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "benchmarks", "headlines.txt"))
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=10.0, help="رسائل في الثانية (0 = دفعة واحدة)")
+    parser.add_argument("--mix-source1", type=float, default=0.4, help="نسبة المصدر الفوري عند ملف نصي")
+    parser.add_argument("--mix-analyst", type=float, default=0.05)
+    parser.add_argument("--mix-hourly", type=float, default=0.25)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-share", type=float, default=0.7, help="نسبة أخطاء 429 من الأخطاء المحقونة")
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch", action="store_true", help="تفعيل LLM_BATCH_ENABLED")
+    parser.add_argument("--stream", action="store_true", help="تفعيل LLM_STREAM_ENABLED (نشر مبكر ثم تعديل)")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.05, help="ثوانٍ بين أجزاء البث (12 حرفًا لكل جزء)")
+    parser.add_argument("--stream-edit-interval", type=float, default=3.0)
+    parser.add_argument("--views-per-second", type=float, default=200.0)
+    parser.add_argument("--views-poll", type=float, default=0.5)
+    parser.add_argument("--views-failure-rate", type=float, default=0.0, help="نسبة طلبات المشاهدات الفاشلة")
+    parser.add_argument("--views-wait-timeout", type=float, default=30 * 60, help="VIEWS_WAIT_TIMEOUT بالثواني")
+    parser.add_argument("--min-views", type=int, default=800)
+    parser.add_argument("--publisher-interval", type=float, default=0.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--flood-seconds", type=int, default=2)
+    parser.add_argument("--send-latency", type=float, default=0.05)
+    parser.add_argument("--send-min-interval", type=float, default=1.0, help="SEND_MIN_INTERVAL لكل قناة")
+    parser.add_argument("--drain-timeout", type=float, default=120.0,
+                        help="أقصى انتظار لتفريغ المكدس؛ مع البوابة الافتراضية (800 مشاهدة بـ200/ث) يستغرق كل منشور مجدول ~4 ث")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="حفظ النتائج بصيغة JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+اختبارات انحدار تشغّل replay_harness.py بمعاملات صغيرة وتتحقق من تقريره:
+تفريغ المكدس، بوابة المشاهدات (الحجز، المهلة، فشل الجلب)، حجب التكرار والتصنيف.
+
+    python -m pytest benchmarks -q
+
+كل حالة تعمل في عملية منفصلة: bot.py يقرأ إعداداته (ومنفذ خادم LLM المحلي) عند الاستيراد.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+HARNESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay_harness.py")
+
+SCHEDULED = [
+    "Copper inventories fall at LME warehouses in London",
+    "Shipping rates on Asia-Europe routes rise for third week",
+    "Coffee futures slide as Brazil harvest outlook improves",
+    "Lithium prices steady after months of declines",
+]
+
+# معاملات سريعة: LLM شبه فوري، تباعد إرسال قصير، وبوابة مشاهدات صغيرة
+FAST = [
+    "--rate", "0", "--llm-latency", "0.02", "--llm-jitter", "0", "--send-latency", "0.01",
+    "--send-min-interval", "0.05", "--views-poll", "0.1", "--min-views", "10",
+]
+
+
+def replay(tmp_path, corpus, *flags):
+    corpus_path = tmp_path / "corpus.jsonl"
+    corpus_path.write_text(
+        "\n".join(json.dumps({"source": source, "text": text}, ensure_ascii=False) for source, text in corpus),
+        encoding="utf-8",
+    )
+    output = tmp_path / "report.json"
+    subprocess.run(
+        [sys.executable, HARNESS, "--corpus", str(corpus_path), "--messages", str(len(corpus)),
+         "--output", str(output), *FAST, *flags],
+        check=True, timeout=120, capture_output=True,
+    )
+    return json.loads(output.read_text(encoding="utf-8"))
+
+
+def test_drains_queue_dedups_and_classifies(tmp_path):
+    corpus = [
+        ("source2", "🇺🇸 Nonfarm Payrolls ACT: 256K EST: 165K PREV: 212K"),
+        ("source1", "MACRO: Bond yields climb as traders price fewer cuts"),
+        ("source1", "Powell says the Fed is in no hurry to cut rates"),
+        *(("source2", text) for text in SCHEDULED),
+        ("source1", SCHEDULED[0]),                                     # نفس الهدف: مكرر
+        ("analyst", "Powell says the Fed is in no hurry to cut rates"),  # ورد من مصادر الأخبار
+        ("hourly", "Oil jumps after OPEC announces a surprise output cut"),
+        ("hourly", "Oil jumps after OPEC announces a surprise output cut"),
+    ]
+    report = replay(tmp_path, corpus, "--drain-timeout", "30")
+
+    assert report["left_in_queue"] == 0
+    assert report["categories"] == {"economic": 1, "macro": 1, "keyword": 1, "other": 4}
+    assert report["duplicates"] == {"news": 1, "hourly": 1}
+    assert report["posts_by_target"] == {"-1001": 7, "-1003": 1}  # لا منشور تحليلي، وموجز ساعة واحد
+
+
+def test_views_gate_holds_scheduled_posts(tmp_path):
+    # المشاهدات لا تنمو والمهلة طويلة: الأول يُنشر والباقي ينتظر البوابة
+    corpus = [("source2", text) for text in SCHEDULED]
+    report = replay(tmp_path, corpus, "--views-per-second", "0", "--drain-timeout", "2")
+
+    assert report["posts_by_target"] == {"-1001": 1}
+    assert report["left_in_queue"] == len(SCHEDULED) - 1  # الناشر ينتظر البوابة قبل سحب الرأس
+    assert not report["gate"]
+
+
+def test_views_gate_times_out(tmp_path):
+    corpus = [("source2", text) for text in SCHEDULED]
+    report = replay(tmp_path, corpus, "--views-per-second", "0", "--views-wait-timeout", "0.3",
+                    "--drain-timeout", "30")
+
+    assert report["left_in_queue"] == 0
+    assert report["posts_by_target"] == {"-1001": len(SCHEDULED)}
+    assert report["gate"].get("views/timeout", 0) >= len(SCHEDULED) - 1
+
+
+def test_views_gate_opens_when_fetch_fails(tmp_path):
+    # تعذر جلب المشاهدات لا يحبس النشر (وإن كانت مهلة البوابة 30 دقيقة)
+    corpus = [("source2", text) for text in SCHEDULED]
+    report = replay(tmp_path, corpus, "--views-per-second", "0", "--views-failure-rate", "1",
+                    "--drain-timeout", "30")
+
+    assert report["views_failures_injected"] > 0
+    assert report["left_in_queue"] == 0
+    assert report["posts_by_target"] == {"-1001": len(SCHEDULED)}
+    assert report["gate"].get("views/fetch_error", 0) >= len(SCHEDULED) - 1
+    assert "views/timeout" not in report["gate"]
@@ -10,30 +10,70 @@ EcoPulse Bot — النسخة النهائية المستقرة مع دعم مو
 """
 
 import asyncio
+import contextlib
+import functools
 import os
 import logging
+import logging.handlers
 import re
 import time
+import hashlib
+import itertools
+import json
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import atexit
+import gc
+import gzip
+import queue
+import shutil
+import tracemalloc
+import unicodedata
 from datetime import datetime, timedelta
 from collections import deque
 from collections import defaultdict
+from collections import OrderedDict
+from collections import namedtuple
 
-from telethon import TelegramClient, events
-from telethon.errors import FloodWaitError
+from telethon import TelegramClient, events, utils
+from telethon.errors import FloodWaitError, RPCError
+from telethon.extensions import markdown
 from telethon.sessions import StringSession
+from telethon.tl.types import (
+    InputPeerChannel, InputPeerChat, InputPeerUser, MessageMediaDocument, MessageMediaPhoto, PeerChannel, PeerChat, PeerUser,
+)
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AuthenticationError,
+    PermissionDeniedError,
+    RateLimitError,
+)
+
+from classifier import (
+    MessageClassifier,
+    CATEGORY_ECONOMIC,
+    CATEGORY_MACRO,
+    CATEGORY_KEYWORD,
+)
+from releases import parse_release, render_release
+
+STARTED_AT = time.monotonic()  # بداية التشغيل لقياس زمن الوصول إلى أول رسالة
 
 # ---------------- تحميل الإعدادات ----------------
 load_dotenv()
 
-API_ID = int(os.getenv("API_ID"))
-API_HASH = os.getenv("API_HASH")
-SESSION_STRING = os.getenv("SESSION_STRING")
-
-if not SESSION_STRING or SESSION_STRING == "":
-    logging.critical("❌ SESSION_STRING مفقود في .env — لا يمكن تشغيل البوت على الخادم!")
-    exit(1)
+API_ID = int(os.getenv("API_ID") or 0)
+API_HASH = os.getenv("API_HASH", "")
+SESSION_STRING = os.getenv("SESSION_STRING", "")
+# جلسة منفصلة (تسجيل دخول ثانٍ لنفس الحساب) لعملية الناشر؛ تسجيل الدخول المشترك يبقى لعملية الاستقبال وحدها
+PUBLISHER_SESSION_STRING = os.getenv("PUBLISHER_SESSION_STRING", "")
 
 # --- القنوات من .env (ثابتة) ---
 SOURCE_CHANNEL = os.getenv("SOURCE_CHANNEL", "me")
@@ -44,21 +84,144 @@ CONTROL_CHANNEL = os.getenv("CONTROL_CHANNEL", "me")
 ANALYST_SOURCE = os.getenv("ANALYST_SOURCE", "")
 HOURLY_SOURCE = os.getenv("HOURLY_SOURCE", "")  # ← جديد
 HOURLY_TARGET = os.getenv("HOURLY_TARGET", "")  # ← جديد
+ENTITY_CACHE_PATH = os.getenv("ENTITY_CACHE_PATH", "entities.json")  # معرفات القنوات المحلولة (فارغ للتعطيل)
+ROUTES_PATH = os.getenv("ROUTES_PATH", "routes.json")  # جدول المسارات؛ إن لم يوجد تُبنى المسارات من المتغيرات أعلاه
+ROUTES_RELOAD_INTERVAL = float(os.getenv("ROUTES_RELOAD_INTERVAL", "30"))  # ثوانٍ بين فحوص تعديل الملف
 
-ANALYST_SOURCE_ID = None
 ANALYST_TARGET_ID = None
-HOURLY_SOURCE_ID = None
 HOURLY_TARGET_ID = None
 
 # ---------------- إعدادات النشر ----------------
 IMMEDIATE_MIN_VIEWS = 600
 IMMEDIATE_TIMEOUT = 8 * 60
 MIN_VIEWS_FOR_NEXT = int(os.getenv("MIN_VIEWS_FOR_NEXT", "800"))
+PUBLISHER_PREFETCH_DEPTH = int(os.getenv("PUBLISHER_PREFETCH_DEPTH", "2"))  # عدد العناصر المنسّقة مسبقًا
+PUBLISHER_SEND_INTERVAL = 10
+VIEWS_POLL_INTERVAL = int(os.getenv("VIEWS_POLL_INTERVAL", "30"))  # ثوانٍ بين دفعات جلب المشاهدات
+VIEWS_FRESHNESS = VIEWS_POLL_INTERVAL * 3  # أقصى عمر مقبول لقيمة مخزنة
+VIEWS_WAIT_TIMEOUT = float(os.getenv("VIEWS_WAIT_TIMEOUT", str(30 * 60)))  # أقصى انتظار لبوابة المشاهدات ثم النشر
+MEDIA_PASSTHROUGH = os.getenv("MEDIA_PASSTHROUGH", "1").lower() in ("1", "true", "yes")  # إعادة نشر صور/فيديو المصدر بمرجعها
+MEDIA_CAPTION_LIMIT = int(os.getenv("MEDIA_CAPTION_LIMIT", "1024"))  # حد تعليق الوسائط (2048 لحسابات Premium)
+ALBUM_WAIT = float(os.getenv("ALBUM_WAIT", "0.6"))  # ثوانٍ لتجميع عناصر الألبوم الواحد (نفس grouped_id)
 
 # ---------------- مفاتيح OpenAI ----------------
-API_KEYS = os.getenv("OPENAI_API_KEYS", "").split(",")
-if not API_KEYS or API_KEYS == [""]:
-    raise ValueError("❌ لم يتم العثور على مفاتيح OpenAI في ملف .env")
+API_KEYS = os.getenv("OPENAI_API_KEYS", "").split(",")  # يُتحقق منها في init_runtime()
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5-nano")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))  # أقصى عدد طلبات متزامنة
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+OPENAI_KEY_RPM = int(os.getenv("OPENAI_KEY_RPM", "500"))        # حد الطلبات في الدقيقة لكل مفتاح
+OPENAI_KEY_TPM = int(os.getenv("OPENAI_KEY_TPM", "200000"))     # حد الرموز في الدقيقة لكل مفتاح
+LLM_EXPECTED_OUTPUT_TOKENS = 400  # تقدير رموز الإخراج لحجز الميزانية قبل الطلب
+LLM_BACKOFF_BASE = 1.0   # ثوانٍ
+LLM_BACKOFF_CAP = 30.0   # ثوانٍ
+
+# ذاكرة الترجمة الدائمة (اتركه فارغًا لتعطيلها)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # ثوانٍ
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_FLUSH_INTERVAL = float(os.getenv("LLM_CACHE_FLUSH_INTERVAL", "2.0"))  # ثوانٍ بين دفعات الكتابة على القرص
+LLM_CACHE_VERSION = "1"  # غيّره عند تعديل طريقة استخدام المخرجات
+
+# تجميع طلبات الترجمة للمكدس في طلب JSON واحد (اختياري)
+LLM_BATCH_ENABLED = os.getenv("LLM_BATCH_ENABLED", "0").lower() in ("1", "true", "yes")
+LLM_BATCH_MAX_ITEMS = int(os.getenv("LLM_BATCH_MAX_ITEMS", "8"))
+LLM_BATCH_WAIT_MS = int(os.getenv("LLM_BATCH_WAIT_MS", "300"))
+
+# بث مخرجات LLM للنشر الفوري: نشر مبكر ثم تعديل المنشور حتى يكتمل النص (اختياري)
+LLM_STREAM_ENABLED = os.getenv("LLM_STREAM_ENABLED", "0").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "3"))  # ثوانٍ بين تعديلين لنفس المنشور
+STREAM_MIN_SENTENCE_CHARS = int(os.getenv("STREAM_MIN_SENTENCE_CHARS", "25"))  # أقصر جملة أولى تستحق النشر
+
+# البيانات الاقتصادية: تنسيق محلي دون LLM (releases.py)، وLLM احتياطي عند ضعف الاستخراج
+ECONOMIC_LOCAL_FORMAT = os.getenv("ECONOMIC_LOCAL_FORMAT", "1").lower() in ("1", "true", "yes")
+ECONOMIC_LLM_NOTE = os.getenv("ECONOMIC_LLM_NOTE", "0").lower() in ("1", "true", "yes")  # تعليق ≤ 9 كلمات يضاف بتعديل المنشور
+
+# مهلة كل مسار (ثوانٍ): بعدها يُنشر بديل محلي فورًا ويُستبدل بنتيجة LLM عبر تعديل المنشور حين تصل
+SLO_DEADLINES = {
+    "immediate": float(os.getenv("SLO_IMMEDIATE_SECONDS", "6")),
+    "economic": float(os.getenv("SLO_ECONOMIC_SECONDS", "3")),
+    "scheduled": float(os.getenv("SLO_SCHEDULED_SECONDS", "30")),
+    "analyst": float(os.getenv("SLO_ANALYST_SECONDS", "15")),
+    "hourly": float(os.getenv("SLO_HOURLY_SECONDS", "90")),
+}
+SLO_BACKFILL_MAX_AGE = float(os.getenv("SLO_BACKFILL_MAX_AGE", "900"))  # أقصى عمر منشور بديل يُستبدل لاحقًا
+
+# قاطع الدائرة: عند تجاوز نسبة الأخطاء أو p95 يتجه الكل مباشرة إلى البديل المحلي لمدة التهدئة
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "40"))            # آخر N طلب LLM
+BREAKER_MIN_SAMPLES = int(os.getenv("BREAKER_MIN_SAMPLES", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_P95_SECONDS = float(os.getenv("BREAKER_P95_SECONDS", "20"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "60"))
+
+# ---------------- ميزانية الذاكرة ----------------
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "64"))          # مجموع تقديري لكل المخازن في الذاكرة
+MEMORY_RSS_LIMIT_MB = float(os.getenv("MEMORY_RSS_LIMIT_MB", "0"))     # 0 للتعطيل؛ فوقه تُقلَّص المخازن إلى نصف حصصها
+MEMORY_CHECK_INTERVAL = float(os.getenv("MEMORY_CHECK_INTERVAL", "15"))  # ثوانٍ بين فحوص الميزانية
+MEMORY_TRACEMALLOC = os.getenv("MEMORY_TRACEMALLOC", "0").lower() in ("1", "true", "yes")  # تتبع التخصيصات من الإقلاع
+TRACEMALLOC_TOP = 10
+# حصة كل مخزن من الميزانية؛ ترتيبها هو ترتيب التقليص عند تجاوز المجموع (الأرخص فقدانًا أولاً)
+MEMORY_SHARES = {
+    "llm_cache": 0.20,          # طبقة الذاكرة فقط؛ المدخلات باقية على القرص
+    "dedup": 0.10,
+    "hourly": 0.20,
+    "translation_queue": 0.25,
+    "send_lanes": 0.10,         # لا تُقلَّص: رسائل تنتظر الإرسال
+    "prefetch": 0.05,
+    "views": 0.05,
+}
+
+# ---------------- تعليمات النماذج ----------------
+PROMPT_TRANSLATE = (
+    "أنت محلل اقتصادي ومترجم محترف في عام 2026 حيث ترامب هو رئيس امريكا. "
+    "حلّل الخبر، ثم أعد صياغته بالعربية بأسلوب اقتصادي مختصر. "
+    "أولاً، قدم تقييمًا للتأثير من كلمتين إلى أربع. "
+    "ثم ضع ### ثم أعد الصياغة بالعربية."
+)
+PROMPT_TRANSLATE_BATCH = (
+    "أنت محلل اقتصادي ومترجم محترف في عام 2026 حيث ترامب هو رئيس امريكا. "
+    "ستصلك قائمة أخبار بصيغة JSON: [{\"id\": رقم, \"text\": نص}]. "
+    "لكل خبر: حلّله ثم أعد صياغته بالعربية بأسلوب اقتصادي مختصر، "
+    "وقدم تقييمًا للتأثير من كلمتين إلى أربع. "
+    "أعد JSON فقط بالشكل: {\"items\": [{\"id\": رقم, \"impact\": نص, \"translation\": نص}]}"
+)
+PROMPT_ECONOMIC = (
+    "أنت محرر أخبار اقتصادية محترف. "
+    "استخرج البيانات واعرضها بالقالب:\n"
+    "🔴 صدر الآن :\n\n"
+    "💠 {الدولة}\n"
+    "🔵 {المؤشر}\n\n"
+    "🕒 السابق :\n"
+    "🕒 التقدير :\n"
+    "🕓 الحالي :\n\n"
+    "👈 النتيجة : تحليل ≤ 9 كلمات."
+)
+PROMPT_ECONOMIC_NOTE = "أنت محلل اقتصادي. علّق على البيان الاقتصادي التالي بالعربية في ≤ 9 كلمات دون تكرار الأرقام."
+PROMPT_MACRO = "أنت محلل اقتصادي حيث ترامب هو الرئيس الحالي لامريكا. قم بتحليل الخبر بالعربية ≤ 10 كلمات."
+PROMPT_HOURLY = (
+    "أنت محرر اقتصادي محترف في عام 2026. حيث ترمب هو رئيس اميركا"
+    "لخص الأخبار التالية في موجز ساعة اقتصادي شامل بالعربية. "
+    "ركز على التأثيرات الرئيسية، المؤشرات، وتصريحات المسؤولين. "
+    "الخبر المسبوق بـ [×N] تكرر N مرة في المصادر: قدّم الأكثر تكرارًا. "
+    "اجعله جذابًا ومختصرًا (لا يتجاوز 120 كلمة). "
+    "ابدأ بعنوان جذاب مثل: '📊 موجز الساعة الاقتصادية'."
+)
+PROMPT_HOURLY_MAP = (
+    "أنت محرر اقتصادي محترف في عام 2026. حيث ترمب هو رئيس اميركا. "
+    "لخص الأخبار التالية في نقاط قصيرة بالعربية (لا تتجاوز 80 كلمة)، "
+    "مع الإبقاء على الأرقام والمؤشرات وأسماء المسؤولين. "
+    "الخبر المسبوق بـ [×N] تكرر N مرة في المصادر: قدّم الأكثر تكرارًا وأبقِ العدد."
+)
+# اسم المسار لكل تعليمات (للقياسات)
+PROMPT_PATHS = {
+    PROMPT_TRANSLATE: "translate",
+    PROMPT_TRANSLATE_BATCH: "translate_batch",
+    PROMPT_ECONOMIC: "economic",
+    PROMPT_ECONOMIC_NOTE: "economic_note",
+    PROMPT_MACRO: "macro",
+    PROMPT_HOURLY: "hourly",
+    PROMPT_HOURLY_MAP: "hourly_map",
+}
 
 # ---------------- إعدادات عامة ----------------
 KEYWORDS_LIST = ["JUST IN", "MACRO", "$MACRO", "marco", "FEDERAL", "POWELL", "powell", "TRUMP", "FED'S", "FED", "🔴"]
@@ -69,12 +232,277 @@ EMOJI_HOURLY = "⏰"
 CHANNEL_WATERMARK = " "
 HOURLY_SIGNATURE = os.getenv("HOURLY_SIGNATURE", "— موجز الساعة")  # ← جديد
 
+# ---------------- تخزين دائم للمكدسات ----------------
+QUEUE_DB_PATH = os.getenv("QUEUE_DB_PATH", "queues.sqlite3")  # اتركه فارغًا للعمل في الذاكرة فقط
+QUEUE_FLUSH_INTERVAL = float(os.getenv("QUEUE_FLUSH_INTERVAL", "1.0"))  # ثوانٍ بين دفعات الكتابة
+
+class QueueRecord:
+    """سجل مضغوط لرسالة في المكدس بدلاً من كائن event كامل."""
+
+    __slots__ = ("chat_id", "message_id", "text", "emoji", "enqueued_at", "priority", "media_ids")
+
+    def __init__(self, chat_id, message_id, text, emoji="", enqueued_at=None, priority="", media_ids=()):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.emoji = emoji
+        self.enqueued_at = enqueued_at if enqueued_at is not None else time.time()
+        self.priority = priority
+        self.media_ids = tuple(media_ids)  # رسائل المصدر التي تحمل وسائط تُعاد معها (ألبوم أو رسالة واحدة)
+
+    @property
+    def id(self):
+        # يسمح بتمرير السجل مكان الرسالة إلى forward_or_send
+        return self.message_id
+
+    @property
+    def key(self):
+        return (self.chat_id, self.message_id)
+
+class QueueStore:
+    """
+    سجل دائم للمكدسات في SQLite (WAL). التعديلات تتجمع في الذاكرة
+    وتُكتب في معاملة واحدة كل QUEUE_FLUSH_INTERVAL ثانية، وتُستعاد عند التشغيل.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = None
+        self._pending = []
+        self._lock = threading.Lock()  # الحفظ يجري في خيط (run) وقد يتزامن مع close أو load
+
+    def open(self):
+        if not self.path or self.db is not None:
+            return
+        path = self.path
+        try:
+            self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS queue_records ("
+                "queue TEXT NOT NULL, chat_id INTEGER, message_id INTEGER, text TEXT NOT NULL, "
+                "emoji TEXT, enqueued_at REAL NOT NULL, priority TEXT, media TEXT DEFAULT '', "
+                "PRIMARY KEY (queue, chat_id, message_id))"
+            )
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(queue_records)")}
+            if "media" not in columns:  # سجل من نسخة سابقة
+                self.db.execute("ALTER TABLE queue_records ADD COLUMN media TEXT DEFAULT ''")
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ تعذر فتح تخزين المكدسات ({path}): {e} — المكدسات في الذاكرة فقط")
+            self.db = None
+
+    def add(self, queue_name: str, record: QueueRecord):
+        if self.db is not None:
+            self._pending.append(("add", queue_name, record))
+
+    def remove(self, queue_name: str, record: QueueRecord):
+        if self.db is not None:
+            self._pending.append(("remove", queue_name, record))
+
+    def clear(self, queue_name: str):
+        if self.db is not None:
+            self._pending.append(("clear", queue_name, None))
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self.db is None or not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            with self.db:
+                self.db.execute("BEGIN")
+                for op, queue_name, record in pending:
+                    if op == "add":
+                        self.db.execute(
+                            "INSERT OR REPLACE INTO queue_records VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (queue_name, record.chat_id, record.message_id, record.text,
+                             record.emoji, record.enqueued_at, record.priority,
+                             ",".join(map(str, record.media_ids)))
+                        )
+                    elif op == "remove":
+                        self.db.execute(
+                            "DELETE FROM queue_records WHERE queue = ? AND chat_id = ? AND message_id = ?",
+                            (queue_name, record.chat_id, record.message_id)
+                        )
+                    else:
+                        self.db.execute("DELETE FROM queue_records WHERE queue = ?", (queue_name,))
+        except sqlite3.Error as e:
+            # المعاملة أُلغيت كاملة: تعود العمليات إلى مقدمة الدفعة التالية بترتيبها
+            self._pending[:0] = pending
+            logging.warning(f"⚠️ فشل حفظ المكدسات ({len(pending)} عملية مؤجلة للمحاولة التالية): {e}")
+
+    def load(self, queue_name: str) -> list:
+        if self.db is None:
+            return []
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT chat_id, message_id, text, emoji, enqueued_at, priority, media FROM queue_records "
+                "WHERE queue = ? ORDER BY enqueued_at",
+                (queue_name,)
+            ).fetchall()
+        return [
+            QueueRecord(*row[:6], media_ids=[int(i) for i in row[6].split(",") if i] if row[6] else ())
+            for row in rows
+        ]
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.flush)  # commit مع fsync لا يوقف حلقة الأحداث
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+queue_store = QueueStore(QUEUE_DB_PATH)
+
+class HourlyQueue(deque):
+    """مكدس موجز الساعة مع تسجيل دائم لكل إضافة ومسح."""
+
+    def __init__(self, journal: QueueStore, name: str = "hourly"):
+        super().__init__()
+        self.journal = journal
+        self.name = name
+
+    def append(self, record: QueueRecord, persist: bool = True):
+        super().append(record)
+        if persist:
+            self.journal.add(self.name, record)
+
+    def popleft(self) -> QueueRecord:
+        record = super().popleft()
+        self.journal.remove(self.name, record)
+        return record
+
+    def clear(self):
+        super().clear()
+        self.journal.clear(self.name)
+
+# ---------------- مكدس الترجمة بالأولويات ----------------
+QUEUE_CLASS_DEFERRED = "deferred"  # كلمات مفتاحية أُجّلت بسبب شروط النشر الفوري
+QUEUE_CLASS_NORMAL = "normal"      # باقي الأخبار
+QUEUE_CLASS_LABELS = {QUEUE_CLASS_DEFERRED: "مؤجل فوري", QUEUE_CLASS_NORMAL: "عادي"}
+QUEUE_CAPACITY = int(os.getenv("QUEUE_CAPACITY", "200"))
+QUEUE_MAX_AGE_DEFERRED = int(os.getenv("QUEUE_MAX_AGE_DEFERRED", str(30 * 60)))  # ثوانٍ
+QUEUE_MAX_AGE_NORMAL = int(os.getenv("QUEUE_MAX_AGE_NORMAL", str(3 * 3600)))      # ثوانٍ
+QUEUE_SHED_POLICY = os.getenv("QUEUE_SHED_POLICY", "drop").lower()  # drop | digest
+
+class PriorityTranslationQueue:
+    """
+    مكدس ترجمة بأولويات: العناصر الفورية المؤجلة تُنشر قبل العادية.
+    لكل فئة عمر أقصى تنتهي بعده العناصر، وللمكدس سعة قصوى
+    يُتخلّص عند تجاوزها من أقدم عنصر في أدنى فئة غير فارغة.
+    """
+
+    def __init__(self, classes, capacity: int, journal: QueueStore = None, name: str = "translation"):
+        # classes: قائمة (اسم الفئة، أقصى عمر بالثواني) مرتبة من الأعلى أولوية
+        self.classes = [name for name, _ in classes]
+        self.max_age = dict(classes)
+        self.capacity = max(1, capacity)
+        self._queues = {name: deque() for name in self.classes}  # (وقت الإضافة، العنصر)
+        self.shed = defaultdict(int)
+        self.expired = defaultdict(int)
+        self.journal = journal
+        self.name = name
+
+    def _forget(self, item):
+        if self.journal is not None:
+            self.journal.remove(self.name, item)
+
+    # العدّ والمرور يُسقطان المنتهي أولاً، فيتفق الطول (حالة، تخلّص، مقاييس) مع ما سيُعالَج فعلاً
+    def __len__(self):
+        self._expire(time.time())
+        return sum(len(q) for q in self._queues.values())
+
+    def __bool__(self):
+        self._expire(time.time())
+        return any(self._queues.values())
+
+    def __iter__(self):
+        """العناصر الصالحة بترتيب النشر."""
+        now = time.time()
+        self._expire(now)
+        for name in self.classes:
+            max_age = self.max_age[name]
+            for enqueued_at, item in self._queues[name]:
+                if now - enqueued_at <= max_age:
+                    yield item
+
+    def depth(self, name: str) -> int:
+        self._expire(time.time())
+        return len(self._queues[name])
+
+    def _expire(self, now: float):
+        for name in self.classes:
+            queue, max_age = self._queues[name], self.max_age[name]
+            while queue and now - queue[0][0] > max_age:
+                self._forget(queue.popleft()[1])
+                self.expired[name] += 1
+                logging.info("⌛ انتهت صلاحية عنصر من فئة %s", QUEUE_CLASS_LABELS.get(name, name), extra={"stage": "queue"})
+
+    def append(self, item, queue_class: str, enqueued_at: float = None, persist: bool = True) -> list:
+        """يضيف العنصر ويعيد قائمة العناصر التي تم التخلص منها لتجاوز السعة."""
+        now = time.time()
+        self._expire(now)
+        self._queues[queue_class].append((enqueued_at or now, item))
+        if persist and self.journal is not None:
+            self.journal.add(self.name, item)
+        shed = []
+        while len(self) > self.capacity:
+            shed.append(self.shed_oldest())
+        return shed
+
+    def shed_oldest(self):
+        """يتخلص من أقدم عنصر في أدنى فئة غير فارغة ويعيده."""
+        for name in reversed(self.classes):
+            if self._queues[name]:
+                dropped = self._queues[name].popleft()[1]
+                self._forget(dropped)
+                self.shed[name] += 1
+                return dropped
+        raise IndexError("shed from an empty queue")
+
+    def popleft(self):
+        self._expire(time.time())
+        for name in self.classes:
+            if self._queues[name]:
+                item = self._queues[name].popleft()[1]
+                self._forget(item)
+                return item
+        raise IndexError("pop from an empty queue")
+
+    def clear(self):
+        for queue in self._queues.values():
+            queue.clear()
+        if self.journal is not None:
+            self.journal.clear(self.name)
+
+    def describe(self) -> str:
+        return " | ".join(
+            f"{QUEUE_CLASS_LABELS.get(name, name)}: {self.depth(name)} "
+            f"(متخلّص منه {self.shed[name]}، منتهي {self.expired[name]})"
+            for name in self.classes
+        )
+
 # ---------------- التهيئة ----------------
-client = TelegramClient(StringSession(SESSION_STRING), API_ID, API_HASH)
-translation_queue = deque()
-hourly_queue = deque()  # ← جديد: مكدس أخبار موجز الساعة
-posted_texts = set()
+# العميل ومدير OpenAI وقواعد SQLite تُبنى في init_runtime() عند التشغيل لا عند الاستيراد
+client = None
+translation_queue = PriorityTranslationQueue(
+    [(QUEUE_CLASS_DEFERRED, QUEUE_MAX_AGE_DEFERRED), (QUEUE_CLASS_NORMAL, QUEUE_MAX_AGE_NORMAL)],
+    QUEUE_CAPACITY,
+    journal=queue_store
+)
+hourly_queue = HourlyQueue(queue_store)  # ← جديد: مكدس أخبار موجز الساعة
 MAX_POSTED_HISTORY = 100
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "5000"))
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", str(6 * 3600)))  # ثوانٍ
 
 # === متغيرات التحكم ===
 bot_active = False
@@ -85,9 +513,8 @@ publish_scheduled = True      # الناشر المجدول
 publish_hourly = True         # ← جديد: موجز الساعة
 dry_run_mode = os.getenv("DRY_RUN", "0").lower() in ("1", "true", "yes")
 
-# متغيرات التحكم في النشر الفوري
-last_immediate_post_id = None
-last_immediate_post_time = datetime.now()
+# متغيرات التحكم في النشر الفوري: قناة الهدف -> (آخر منشور فوري، وقت نشره)
+immediate_posts = {}
 
 # إحصاءات
 stats = {
@@ -100,67 +527,834 @@ stats = {
     "flood_waits": 0
 }
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("bot_activity.log", "a", encoding="utf-8")]
-)
+# ---------------- السجلات ----------------
+LOG_FILE = os.getenv("LOG_FILE", "bot_activity.log")                      # فارغ = الطرفية فقط
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()                      # text | json (سطر JSON لكل سجل)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))    # حجم التدوير
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")                        # مثل midnight أو H: تدوير زمني بدل الحجم
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1").lower() in ("1", "true", "yes")
+LOG_TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+class JsonLogFormatter(logging.Formatter):
+    """سطر JSON لكل سجل، مع message_id و stage عند تمريرهما عبر extra."""
+
+    FIELDS = ("message_id", "stage", "path")
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def _log_file_handler(path: str):
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, "a", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+        )
+    if LOG_COMPRESS:
+        handler.namer = lambda name: f"{name}.gz"
+        handler.rotator = _gzip_rotator
+    return handler
+
+log_listener = None
+
+def setup_logging(log_file: str = LOG_FILE):
+    """
+    حلقة asyncio تضع السجل في طابور فقط (QueueHandler)، والكتابة على القرص
+    والتدوير والضغط تتم في خيط QueueListener مستقل. في وضع العمليات المتعددة
+    لكل عملية ملفها حتى لا تتعارض عمليات التدوير.
+    """
+    global log_listener
+    if log_listener is not None:
+        return log_listener
+    formatter = JsonLogFormatter() if LOG_FORMAT == "json" else logging.Formatter(LOG_TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(_log_file_handler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # تفريغ الطابور قبل الخروج
+    return log_listener
+
+# ---------------- القياسات ----------------
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 لتعطيل نقطة القياسات
+METRIC_STAGE_SECONDS = "ecopulse_stage_seconds"
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+class Histogram:
+    """مدرج تراكمي بصيغة Prometheus + عينة حديثة لحساب المئينات."""
+
+    __slots__ = ("counts", "total", "count", "samples")
+
+    def __init__(self, sample_size: int = 2048):
+        self.counts = [0] * len(HISTOGRAM_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=sample_size)
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        self.samples.append(value)
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Metrics:
+    """سجل قياسات داخلي: مدرجات زمنية، عدادات، ومقاييس لحظية (أعماق المكدسات)."""
+
+    def __init__(self):
+        self.histograms = {}             # (الاسم، الوسوم) -> Histogram
+        self.counters = defaultdict(float)
+        self.gauges = {}                 # الاسم -> دالة تعيد [(الوسوم، القيمة)]
+
+    @staticmethod
+    def _labels(labels: dict) -> tuple:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, self._labels(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        self.counters[(name, self._labels(labels))] += amount
+
+    def gauge(self, name: str, func):
+        self.gauges[name] = func
+
+    @contextlib.contextmanager
+    def timer(self, stage: str, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(METRIC_STAGE_SECONDS, time.monotonic() - started, stage=stage, **labels)
+
+    @staticmethod
+    def _format_labels(labels) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (hist_name, labels), histogram in self.histograms.items():
+                if hist_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(HISTOGRAM_BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{self._format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {histogram.total}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (counter_name, labels), value in self.counters.items():
+                if counter_name == name:
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for name, func in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                for labels, value in func():
+                    lines.append(f"{name}{self._format_labels(self._labels(labels))} {value}")
+            except Exception as e:
+                logging.debug("فشل قراءة المقياس %s: %s", name, e)
+        return "\n".join(lines) + "\n"
+
+    def percentiles_report(self) -> str:
+        rows = []
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name != METRIC_STAGE_SECONDS or not histogram.count:
+                continue
+            label_map = dict(labels)
+            stage = label_map.pop("stage", "?")
+            label = stage + (f" ({', '.join(label_map.values())})" if label_map else "")
+            rows.append(
+                f"• {label}: n={histogram.count} | p50={histogram.percentile(0.5) * 1000:.0f} | "
+                f"p95={histogram.percentile(0.95) * 1000:.0f} | p99={histogram.percentile(0.99) * 1000:.0f} ms"
+            )
+        return "\n".join(rows) or "لا توجد قياسات بعد"
+
+metrics = Metrics()
+
+def timed(stage: str):
+    """مزخرف لقياس زمن دالة غير متزامنة كمرحلة."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with metrics.timer(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+async def _metrics_handler(reader, writer):
+    try:
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+        body = metrics.render_prometheus().encode("utf-8")
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logging.debug("طلب قياسات غير صالح: %s", e)
+    finally:
+        writer.close()
+
+async def start_metrics_server():
+    if METRICS_PORT <= 0:
+        return None
+    try:
+        server = await asyncio.start_server(_metrics_handler, METRICS_HOST, METRICS_PORT)
+        logging.info(f"📈 نقطة القياسات (Prometheus): http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        return server
+    except OSError as e:
+        logging.warning(f"⚠️ تعذر تشغيل نقطة القياسات: {e}")
+        return None
 
 # ---------------- إدارة مفاتيح OpenAI ----------------
+def estimate_tokens(text: str) -> int:
+    # تقدير تقريبي دون مكتبة رموز: ~3 أحرف لكل رمز (عربي/إنجليزي مختلط)
+    return len(text) // 3 + 1
+
+class TokenBucket:
+    """دلو رموز: سعة قصوى تمتلئ بمعدل ثابت في الثانية."""
+
+    __slots__ = ("capacity", "rate", "level", "updated")
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, float(per_minute))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """الثواني اللازمة حتى يتوفر المقدار المطلوب (0 = متوفر الآن)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def utilization(self) -> float:
+        self._refill()
+        return max(0.0, 1.0 - self.level / self.capacity)
+
+class KeyState:
+    """حالة مفتاح واحد: عميله، دلوا الطلبات والرموز، والتهدئة."""
+
+    __slots__ = ("key", "client", "requests", "tokens", "in_flight", "available_at", "benched", "last_error")
+
+    def __init__(self, key: str, rpm: int, tpm: int):
+        self.key = key
+        self.client = None
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = 0
+        self.available_at = 0.0  # monotonic
+        self.benched = False     # تعطيل طويل (مصادقة/رصيد)
+        self.last_error = ""
+
+    @property
+    def label(self) -> str:
+        return f"{self.key[:5]}..."
+
+# تصنيف أخطاء OpenAI
+ERROR_RATE_LIMIT = "rate_limit"   # 429 مؤقت: احترام retry-after
+ERROR_AUTH = "auth"               # مفتاح غير صالح/محظور: تعطيل طويل
+ERROR_QUOTA = "quota"             # رصيد منتهٍ: تعطيل طويل
+ERROR_TRANSIENT = "transient"     # مهلة، اتصال، 5xx: إعادة المحاولة فقط
+ERROR_OTHER = "other"
+
+def _retry_after_seconds(error) -> float:
+    """ثواني retry-after من ترويسات الاستجابة، أو 0.0 إن لم تُرسل."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return 0.0
+
+def classify_openai_error(error):
+    """يعيد (نوع الخطأ، ثواني retry-after أو 0.0)."""
+    if isinstance(error, RateLimitError):
+        if getattr(error, "code", None) == "insufficient_quota" or "insufficient_quota" in str(error):
+            return ERROR_QUOTA, 0.0
+        return ERROR_RATE_LIMIT, _retry_after_seconds(error)
+    if isinstance(error, (AuthenticationError, PermissionDeniedError)):
+        return ERROR_AUTH, 0.0
+    if isinstance(error, (APITimeoutError, APIConnectionError, asyncio.TimeoutError)):
+        return ERROR_TRANSIENT, 0.0
+    if isinstance(error, APIStatusError) and getattr(error, "status_code", 0) >= 500:
+        return ERROR_TRANSIENT, _retry_after_seconds(error)
+    return ERROR_OTHER, 0.0
+
+class CircuitOpenError(Exception):
+    """قاطع الدائرة مفتوح: لا طلبات LLM جديدة حتى انتهاء التهدئة."""
+
+class CircuitBreaker:
+    """
+    يراقب آخر طلبات LLM (نجاح/فشل + الزمن)؛ عند تجاوز نسبة الأخطاء أو p95 للعتبة
+    يُفتح لمدة التهدئة ثم يصبح نصف مفتوح: يمرّ طلب اختبار واحد فقط، نجاحه (ضمن عتبة p95)
+    يغلق القاطع بنافذة فارغة وفشله يعيد فتحه فورًا.
+    """
+
+    def __init__(self, window: int, min_samples: int, error_rate: float, p95_seconds: float, cooldown: float):
+        self.samples = deque(maxlen=max(1, window))  # (نجح؟، الثواني)
+        self.min_samples = max(1, min_samples)
+        self.error_rate = error_rate
+        self.p95_seconds = p95_seconds
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self.half_open = False  # انتهت التهدئة ولم ينجح طلب اختبار بعد
+        self.probing = False    # طلب الاختبار جارٍ الآن
+        self.trips = 0
+        self.reason = ""
+
+    @property
+    def is_open(self) -> bool:
+        """مفتوح أثناء التهدئة وأثناء طلب الاختبار (لا يمرّ غيره)."""
+        return self.probing or time.monotonic() < self.open_until
+
+    def admit(self) -> bool:
+        """يرفع CircuitOpenError إن كان مفتوحًا؛ يعيد True إن كان هذا الطلب هو طلب الاختبار."""
+        if self.is_open:
+            raise CircuitOpenError(self.reason)
+        if self.half_open:
+            self.probing = True
+            return True
+        return False
+
+    def release(self, probe: bool):
+        """يحرر طلب الاختبار إن انتهى دون تسجيل نتيجة (إلغاء/إغلاق مبكر للبث)."""
+        if probe:
+            self.probing = False
+
+    def _stats(self):
+        errors = sum(1 for ok, _ in self.samples if not ok)
+        durations = sorted(seconds for _, seconds in self.samples)
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))] if durations else 0.0
+        return errors / len(self.samples) if self.samples else 0.0, p95
+
+    def record(self, ok: bool, seconds: float, probe: bool = False):
+        if probe:
+            self.probing = False
+            if ok and seconds <= self.p95_seconds:
+                self.half_open = False
+                self.samples.clear()
+                logging.info("🔌 قاطع LLM مغلق بعد نجاح طلب الاختبار (%.1fث)", seconds, extra={"stage": "llm"})
+            else:
+                self.trip(f"فشل طلب الاختبار ({seconds:.1f}ث)" if not ok else f"طلب الاختبار بطيء ({seconds:.1f}ث)")
+            return
+        if self.is_open or self.half_open:
+            return  # طلبات بدأت قبل الفتح لا تقرر مصير القاطع
+        self.samples.append((ok, seconds))
+        if len(self.samples) < self.min_samples:
+            return
+        error_rate, p95 = self._stats()
+        if error_rate > self.error_rate or p95 > self.p95_seconds:
+            self.trip(f"أخطاء {error_rate * 100:.0f}% | p95 {p95:.1f}ث")
+
+    def trip(self, reason: str):
+        self.open_until = time.monotonic() + self.cooldown
+        self.half_open = True
+        self.probing = False
+        self.samples.clear()
+        self.trips += 1
+        self.reason = reason
+        metrics.inc("ecopulse_llm_breaker_trips_total")
+        logging.warning("🔌 قاطع LLM مفتوح لمدة %.0f ثانية (%s) — النشر عبر البديل المحلي", self.cooldown, reason, extra={"stage": "llm"})
+
+    def describe(self) -> str:
+        if time.monotonic() < self.open_until:
+            return f"🔌 قاطع LLM: مفتوح {self.open_until - time.monotonic():.0f}ث ({self.reason}) | مرات الفتح: {self.trips}"
+        if self.half_open:
+            state = "طلب الاختبار جارٍ" if self.probing else "بانتظار طلب اختبار"
+            return f"🔌 قاطع LLM: نصف مفتوح ({state}) | مرات الفتح: {self.trips}"
+        error_rate, p95 = self._stats()
+        return f"🔌 قاطع LLM: مغلق | أخطاء {error_rate * 100:.0f}% | p95 {p95:.1f}ث | مرات الفتح: {self.trips}"
+
+llm_breaker = CircuitBreaker(BREAKER_WINDOW, BREAKER_MIN_SAMPLES, BREAKER_ERROR_RATE, BREAKER_P95_SECONDS, BREAKER_COOLDOWN)
+
 class OpenAIManager:
-    def __init__(self, keys):
+    def __init__(self, keys, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 rpm: int = OPENAI_KEY_RPM, tpm: int = OPENAI_KEY_TPM):
         self.keys = [k.strip() for k in keys if k.strip()]
         if not self.keys:
             raise ValueError("❌ لا توجد مفاتيح OpenAI صالحة")
-        self.index = 0
+        self.states = [KeyState(key, rpm, tpm) for key in self.keys]
         self.failed_keys = {}
         self.failure_cooldown = 3600
+        self.rate_limit_cooldown = 20  # عند غياب retry-after
         self.usage_stats = defaultdict(int)
-        logging.info(f"Intialized OpenAIManager with {len(self.keys)} keys")
+        self.error_stats = defaultdict(int)
+        self.max_concurrency = max(1, max_concurrency)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        logging.info(f"Intialized OpenAIManager with {len(self.keys)} keys (concurrency={self.max_concurrency})")
 
     def _get_usable_keys(self):
-        now = time.time()
-        usable = []
-        for key in self.keys:
-            fail_time = self.failed_keys.get(key)
-            if not fail_time or (now - fail_time) > self.failure_cooldown:
-                usable.append(key)
-        return usable
-
-    def get_client(self):
-        usable_keys = self._get_usable_keys()
-        if not usable_keys:
-            logging.warning("⚠️ جميع المفاتيح معطّلة — إعادة تفعيل الجميع")
-            self.failed_keys.clear()
-            usable_keys = self.keys
-
-        key = usable_keys[self.index % len(usable_keys)]
-        self.index += 1
-        self.usage_stats[key] += 1
-        logging.debug(f"🔑 استخدام مفتاح: {key[:5]}... (الاستخدام: {self.usage_stats[key]})")
-        return OpenAI(api_key=key)
+        now = time.monotonic()
+        return [state.key for state in self.states if state.available_at <= now]
+
+    def _client_for(self, state: KeyState):
+        # عميل غير متزامن واحد طويل العمر لكل مفتاح (إعادة استخدام اتصالات HTTP)
+        if state.client is None:
+            state.client = AsyncOpenAI(api_key=state.key, timeout=LLM_REQUEST_TIMEOUT, max_retries=0)
+        return state.client
+
+    async def _acquire(self, tokens: int) -> KeyState:
+        """اختيار المفتاح الأقل حملاً الذي يملك ميزانية طلبات ورموز كافية (أو الانتظار)."""
+        while True:
+            now = time.monotonic()
+            candidates = [state for state in self.states if state.available_at <= now]
+            if not candidates:
+                if all(state.benched for state in self.states):
+                    logging.warning("⚠️ جميع المفاتيح معطّلة — إعادة تفعيل الجميع")
+                    for state in self.states:
+                        state.available_at = 0.0
+                        state.benched = False
+                    self.failed_keys.clear()
+                    continue
+                wait = min(state.available_at for state in self.states) - now
+                await asyncio.sleep(min(max(wait, 0.05), 30))
+                continue
+
+            ready = [
+                state for state in candidates
+                if state.requests.wait_time(1) == 0 and state.tokens.wait_time(tokens) == 0
+            ]
+            if ready:
+                state = min(ready, key=lambda st: (st.in_flight, max(st.requests.utilization(), st.tokens.utilization())))
+                state.requests.take(1)
+                state.tokens.take(tokens)
+                return state
+
+            wait = min(max(st.requests.wait_time(1), st.tokens.wait_time(tokens)) for st in candidates)
+            await asyncio.sleep(min(max(wait, 0.05), 5))
+
+    def _record_error(self, state: KeyState, error: Exception):
+        kind, retry_after = classify_openai_error(error)
+        self.error_stats[kind] += 1
+        state.last_error = f"{kind}: {str(error)[:80]}"
+        if kind in (ERROR_AUTH, ERROR_QUOTA):
+            self.mark_failed(state.key, str(error))
+        elif kind == ERROR_RATE_LIMIT:
+            delay = retry_after or self.rate_limit_cooldown
+            state.available_at = max(state.available_at, time.monotonic() + delay)
+            logging.warning("⏳ 429 على المفتاح %s — تهدئة %.1f ثانية", state.label, delay, extra={"stage": "llm"})
+        elif kind == ERROR_TRANSIENT and retry_after:
+            state.available_at = max(state.available_at, time.monotonic() + retry_after)
+        return kind
+
+    async def complete(self, system_prompt: str, user_text: str, model: str = None, stage: str = None,
+                       response_format: dict = None) -> str:
+        """طلب إكمال غير متزامن عبر المفتاح الأقل حملاً، مع سقف للتوازي؛ يعيد رفع الخطأ عند الفشل."""
+        probe = llm_breaker.admit()
+        estimated = estimate_tokens(system_prompt) + estimate_tokens(user_text) + LLM_EXPECTED_OUTPUT_TOKENS
+        path = PROMPT_PATHS.get(system_prompt, "other")
+        waited = time.monotonic()
+        try:
+            async with self.semaphore:
+                state = await self._acquire(estimated)
+                started = time.monotonic()
+                metrics.observe(METRIC_STAGE_SECONDS, started - waited, stage="llm_wait", path=path)
+                client_ai = self._client_for(state)
+                self.usage_stats[state.key] += 1
+                logging.debug("🔑 استخدام مفتاح: %s (الاستخدام: %d)", state.label, self.usage_stats[state.key])
+                state.in_flight += 1
+                self.in_flight += 1
+                try:
+                    extra = {"response_format": response_format} if response_format else {}
+                    response = await client_ai.chat.completions.create(
+                        model=model or OPENAI_MODEL,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_text}
+                        ],
+                        **extra
+                    )
+                except Exception as e:
+                    state.tokens.give_back(estimated)
+                    kind = self._record_error(state, e)
+                    metrics.inc("ecopulse_llm_errors_total", kind=kind, key=state.label, path=path)
+                    llm_breaker.record(False, time.monotonic() - started, probe)
+                    raise
+                else:
+                    llm_breaker.record(True, time.monotonic() - started, probe)
+                finally:
+                    state.in_flight -= 1
+                    self.in_flight -= 1
+                    metrics.observe(METRIC_STAGE_SECONDS, time.monotonic() - started, stage="llm", path=path, key=state.label)
+        finally:
+            llm_breaker.release(probe)
+        self._settle_usage(state, estimated, getattr(response, "usage", None), stage)
+        return (response.choices[0].message.content or "").strip()
+
+    async def stream(self, system_prompt: str, user_text: str, model: str = None, stage: str = None):
+        """مثل complete لكن يُخرج أجزاء النص فور وصولها (stream=True)؛ يعيد رفع الخطأ عند الفشل.
+        المفتاح والتوازي محجوزان حتى ينتهي البث، فيجب إغلاق المولّد عند التوقف المبكر (contextlib.aclosing)."""
+        probe = llm_breaker.admit()
+        estimated = estimate_tokens(system_prompt) + estimate_tokens(user_text) + LLM_EXPECTED_OUTPUT_TOKENS
+        path = PROMPT_PATHS.get(system_prompt, "other")
+        waited = time.monotonic()
+        usage = None
+        try:
+            async with self.semaphore:
+                state = await self._acquire(estimated)
+                started = time.monotonic()
+                metrics.observe(METRIC_STAGE_SECONDS, started - waited, stage="llm_wait", path=path)
+                client_ai = self._client_for(state)
+                self.usage_stats[state.key] += 1
+                logging.debug("🔑 استخدام مفتاح (بث): %s (الاستخدام: %d)", state.label, self.usage_stats[state.key])
+                state.in_flight += 1
+                self.in_flight += 1
+                try:
+                    response = await client_ai.chat.completions.create(
+                        model=model or OPENAI_MODEL,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_text}
+                        ],
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    )
+                    async for chunk in response:
+                        if getattr(chunk, "usage", None) is not None:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                except Exception as e:
+                    state.tokens.give_back(estimated)
+                    kind = self._record_error(state, e)
+                    metrics.inc("ecopulse_llm_errors_total", kind=kind, key=state.label, path=path)
+                    llm_breaker.record(False, time.monotonic() - started, probe)
+                    raise
+                else:
+                    llm_breaker.record(True, time.monotonic() - started, probe)
+                finally:
+                    state.in_flight -= 1
+                    self.in_flight -= 1
+                    metrics.observe(METRIC_STAGE_SECONDS, time.monotonic() - started, stage="llm", path=path, key=state.label)
+        finally:
+            llm_breaker.release(probe)
+        self._settle_usage(state, estimated, usage, stage)
+
+    def _settle_usage(self, state: KeyState, estimated: int, usage, stage: str = None):
+        if usage is None:
+            return
+        # تصحيح الحجز المقدّر بالاستهلاك الفعلي
+        actual = (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+        if actual < estimated:
+            state.tokens.give_back(estimated - actual)
+        else:
+            state.tokens.take(actual - estimated)
+        if stage:
+            logging.info("🧮 %s: رموز الإدخال=%d | رموز الإخراج=%d", stage, usage.prompt_tokens, usage.completion_tokens, extra={"stage": "llm"})
+
+    def backoff_delay(self, attempt: int, base: float = LLM_BACKOFF_BASE) -> float:
+        """تراجع أسي مع عشوائية كاملة (full jitter)."""
+        return random.uniform(0, min(LLM_BACKOFF_CAP, base * (2 ** attempt)))
 
     def mark_failed(self, key: str, error: str = ""):
         self.failed_keys[key] = time.time()
-        logging.warning(f"🚫 مفتاح معطّل: {key[:5]}... — {error}")
+        for state in self.states:
+            if state.key == key:
+                state.benched = True
+                state.available_at = time.monotonic() + self.failure_cooldown
+        logging.warning("🚫 مفتاح معطّل: %s... — %s", key[:5], error)
         usable = self._get_usable_keys()
-        logging.info(f"📊 حالة المفاتيح: {len(usable)}/{len(self.keys)} نشطة")
+        logging.info("📊 حالة المفاتيح: %s/%s نشطة", len(usable), len(self.keys))
 
     def get_status(self) -> str:
+        now = time.monotonic()
         usable = self._get_usable_keys()
-        failed = [k for k in self.keys if k not in usable]
+        lines = [
+            f"🔑 المفاتيح: {len(self.keys)} | نشطة: {len(usable)} | معطّلة: {len(self.keys) - len(usable)}",
+            f"⚙️ طلبات جارية: {self.in_flight}/{self.max_concurrency}",
+            f"❗ الأخطاء: {dict(self.error_stats) or 'لا يوجد'}",
+        ]
+        for state in self.states:
+            if state.available_at > now:
+                condition = f"{'⛔ معطّل' if state.benched else '⏳ تهدئة'} {state.available_at - now:.0f}ث"
+            else:
+                condition = "✅"
+            lines.append(
+                f"• {state.label} {condition} | جارية: {state.in_flight} | "
+                f"طلبات: {state.requests.utilization() * 100:.0f}% | رموز: {state.tokens.utilization() * 100:.0f}% | "
+                f"الاستخدام: {self.usage_stats[state.key]}"
+            )
+        return "\n".join(lines)
+
+    async def close(self):
+        for state in self.states:
+            if state.client is not None:
+                try:
+                    await state.client.close()
+                except Exception:
+                    pass
+                state.client = None
+
+openai_manager = None  # يُنشأ في init_runtime()
+
+# ---------------- ذاكرة الترجمة الدائمة ----------------
+_CACHE_SPACE_RE = re.compile(r"\s+")
+CACHE_ENTRY_BYTES = 200  # مفتاح 20 بايت + صف (القيمة، الوقت) + عقدة OrderedDict (تقديري)
+
+class TranslationCache:
+    """
+    ذاكرة دائمة لمخرجات LLM في SQLite مع طبقة LRU في الذاكرة.
+    المفتاح = بصمة (الإصدار + النموذج + التعليمات + النص الموحّد)،
+    الإخلاء حسب آخر استخدام عند تجاوز الحجم، وكل مدخل له صلاحية TTL.
+    الإصابة من الذاكرة لا تلمس القرص: المدخلات الجديدة وأوقات الاستخدام تتجمع
+    وتُكتب في معاملة واحدة كل LLM_CACHE_FLUSH_INTERVAL في خيط منفصل (run)،
+    وقراءة القرص عند الإخفاق في الذاكرة تتم عبر asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl: float, memory_entries: int = 512):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.memory_entries = max(1, memory_entries)
+        self._memory = OrderedDict()  # مفتاح -> (القيمة، وقت الإنشاء)
+        self._touched = set()         # مفاتيح استُخدمت ولم يُحدَّث وقتها في القرص بعد
+        self._pending = {}            # مفتاح -> (القيمة، وقت الإنشاء) لم يُكتب بعد
+        self._lock = threading.Lock()  # يسلسل الاتصال بين خيوط القراءة والكتابة
+        self.rows = 0                 # عدد صفوف القرص (يُحدَّث عند كل كتابة بدل COUNT)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db = None
+
+    def open(self):
+        if not self.path or self.db is not None:
+            return
+        path = self.path
+        try:
+            self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key BLOB PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed)")
+            self.db.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl,))
+            self.rows = self.db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            logging.info("🗄️ ذاكرة الترجمة: %d مدخل من %s", self.rows, path)
+        except sqlite3.Error as e:
+            logging.warning("⚠️ تعذر فتح ذاكرة الترجمة (%s): %s — سيتم العمل بدونها على القرص", path, e)
+            self.db = None
+
+    @staticmethod
+    def make_key(system_prompt: str, text: str, model: str) -> bytes:
+        normalized = _CACHE_SPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+        material = "\x00".join((LLM_CACHE_VERSION, model, system_prompt, normalized))
+        return hashlib.blake2b(material.encode("utf-8"), digest_size=20).digest()
+
+    def size(self) -> int:
+        if self.db is None:
+            return len(self._memory)
+        return self.rows + len(self._pending)
+
+    def _remember(self, key: bytes, value: str, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read(self, key: bytes):
+        with self._lock:
+            return self.db.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+
+    async def get(self, key: bytes):
+        now = time.time()
+        entry = self._memory.get(key) or self._pending.get(key)
+        if entry is not None:
+            value, created = entry
+            if now - created <= self.ttl:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                self._touched.add(key)
+                self.hits += 1
+                return value
+            self._memory.pop(key, None)
+
+        if self.db is not None:
+            try:
+                row = await asyncio.to_thread(self._read, key)
+                if row and now - row[1] <= self.ttl:
+                    self._touched.add(key)
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+            except sqlite3.Error as e:
+                logging.warning("⚠️ خطأ في قراءة ذاكرة الترجمة: %s", e)
+
+        self.misses += 1
+        return None
+
+    def put(self, key: bytes, value: str):
+        now = time.time()
+        self._remember(key, value, now)
+        if self.db is not None:
+            self._pending[key] = (value, now)
+            self._touched.discard(key)
+
+    def flush(self):
+        """يكتب المدخلات الجديدة وأوقات الاستخدام المؤجلة في معاملة واحدة ويُخلي الأقدم إن تجاوز الحد."""
+        if self.db is None or not (self._pending or self._touched):
+            return
+        pending, self._pending = self._pending, {}
+        touched, self._touched = self._touched, set()
+        now = time.time()
+        rows = [(key, value, created, created) for key, (value, created) in pending.items()]
+        try:
+            with self._lock, self.db:
+                self.db.execute("BEGIN")
+                if touched:
+                    self.db.executemany("UPDATE llm_cache SET accessed = ? WHERE key = ?", [(now, k) for k in touched])
+                inserted = self.db.executemany(
+                    "INSERT OR IGNORE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)", rows
+                ).rowcount
+                if inserted < len(rows):  # مدخل منتهٍ أُعيد توليده
+                    self.db.executemany(
+                        "UPDATE llm_cache SET value = ?, created = ?, accessed = ? WHERE key = ?",
+                        [(value, created, accessed, key) for key, value, created, accessed in rows]
+                    )
+                count = self.rows + inserted
+                excess = count - self.max_entries
+                if excess > 0:
+                    count -= self.db.execute(
+                        "DELETE FROM llm_cache WHERE key IN "
+                        "(SELECT key FROM llm_cache ORDER BY accessed LIMIT ?)",
+                        (excess,)
+                    ).rowcount
+            self.rows = count
+        except sqlite3.Error as e:
+            # المعاملة أُلغيت: تعود المدخلات للدفعة التالية (ما وصل بعدها أحدث فيبقى)
+            for key, entry in pending.items():
+                self._pending.setdefault(key, entry)
+            self._touched |= touched
+            logging.warning("⚠️ خطأ في كتابة ذاكرة الترجمة (%d مدخل مؤجل): %s", len(pending), e)
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.flush)
+
+    def memory_bytes(self) -> int:
+        return sum(sys.getsizeof(value) for value, _ in self._memory.values()) + len(self._memory) * CACHE_ENTRY_BYTES
+
+    def shrink_memory(self, excess: int) -> int:
+        """يُخلي مدخلات LRU من طبقة الذاكرة حتى يتحرر ~excess بايت (القرص لا يتأثر)."""
+        freed = evicted = 0
+        while freed < excess and self._memory:
+            key, (value, _) = self._memory.popitem(last=False)
+            self._touched.discard(key)
+            freed += sys.getsizeof(value) + CACHE_ENTRY_BYTES
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        self._memory.clear()
+        self._touched.clear()
+        self._pending.clear()
+        if self.db is not None:
+            with self._lock:
+                self.db.execute("DELETE FROM llm_cache")
+            self.rows = 0
+
+    def get_status(self) -> str:
+        total = self.hits + self.misses
+        ratio = (self.hits / total * 100) if total else 0.0
         return (
-            f"🔑 المفاتيح: {len(self.keys)} | نشطة: {len(usable)} | معطّلة: {len(failed)}\n"
-            f"📈 الاستخدام: {dict(self.usage_stats)}\n"
-            f"❌ المعطّلة: {[k[:5]+'...' for k in failed]}"
+            f"🗄️ ذاكرة الترجمة: {self.size()} مدخل | "
+            f"إصابة: {self.hits} (قرص: {self.disk_hits}) | إخفاق: {self.misses} | نسبة: {ratio:.0f}%"
         )
 
-openai_manager = OpenAIManager(API_KEYS)
+    def close(self):
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+llm_cache = TranslationCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL, LLM_CACHE_MEMORY_ENTRIES)
+
+async def cached_complete(system_prompt: str, text: str, model: str = None, stage: str = None) -> str:
+    """نفس openai_manager.complete لكن عبر ذاكرة الترجمة؛ الإصابة لا ترسل أي طلب."""
+    model = model or OPENAI_MODEL
+    key = TranslationCache.make_key(system_prompt, text, model)
+    cached = await llm_cache.get(key)
+    metrics.inc("ecopulse_llm_cache_total", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached
+    result = await openai_manager.complete(system_prompt, text, model=model, stage=stage)
+    if result:
+        llm_cache.put(key, result)
+    return result
 
 # ---------------- أدوات مساعدة ----------------
 def log_activity(task: str, message_id: int):
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    logging.info(f"[{now}] ({task}) -> نشر رسالة ID={message_id}")
+    logging.info("(%s) -> نشر رسالة ID=%s", task, message_id, extra={"message_id": message_id, "stage": "send"})
     if "اقتصادي" in task:
         stats["economic"] += 1
     elif "فوري" in task and "اقتصادي" not in task:
@@ -192,238 +1386,1262 @@ def is_meaningful_text(text: str) -> bool:
     cleaned = re.sub(r"\s+", " ", cleaned).strip()
     return len(cleaned) >= 10 and len(cleaned.split()) >= 2
 
-# ---------------- حل معرفات القنوات ----------------
-async def resolve_channel(channel_input: str):
-    try:
-        channel_input = channel_input.strip()
-        if channel_input == "me":
-            me = await client.get_me()
-            return me.id
-        elif channel_input.startswith('@'):
-            entity = await client.get_entity(channel_input)
-            return entity.id
-        elif channel_input.lstrip('-').isdigit():
-            return int(channel_input)
-        else:
-            entity = await client.get_entity(channel_input)
-            return entity.id
-    except Exception as e:
-        raise ValueError(f"قناة غير صالحة '{channel_input}': {str(e)[:100]}")
+# ---------------- منع التكرار (بصمة المحتوى) ----------------
+_FP_PUNCT_RE = re.compile(r"[^\w\s]")
+_FP_SPACE_RE = re.compile(r"\s+")
 
-# ---------------- كشف البيانات الاقتصادية ----------------
-def is_economic_data(text: str) -> bool:
-    pattern = r"""
-        (?:
-            \b(?:ACT(?:UAL)?|FORECAST|EST(?:IMATED)?|PREV(?:IOUS)?|REVISED?)\b
-            [:=;]?\s*[-+]?\d+(?:\.\d+)?%?(?:[MBK]|MILLION|BILLION|THOUSAND)?|
-            [-+]?\d+(?:\.\d+)?%?\s+(?:VS|VERSUS|VS\.)\s+[-+]?\d+(?:\.\d+)?%?|
-            \([^)]*(?:ACT(?:UAL)?|FORECAST|EST|PREV|REVISED?)[^)]*\d[^)]*\)|
-            \b(?:PMI|ISM|JOLTS|CPI|GDP|NFP|NONFARM|JOBS?|ORDERS?|DURABLE|FACTORY|IVES?|PRICES?|EMPLOYMENT|NEW\s+ORDERS?)\b
-            .{0,50}?(?:\d+(?:\.\d+)?%?|[-+]\d+(?:\.\d+)?%?)|
-            \b\d+(?:\.\d+)?[MBK](?:ILLION|ILLION)?\b
-        )
-        .*?
-        (?:
-            (?:ACT(?:UAL)?|FORECAST|EST|PREV|REVISED?)|
-            \d+(?:\.\d+)?%?|
-            [MBK]
-        )
-    """
-    return bool(re.search(pattern, text, re.IGNORECASE | re.VERBOSE))
+def normalize_for_fingerprint(text: str) -> str:
+    """توحيد النص قبل أخذ البصمة: حالة الأحرف، الفراغات، علامات الترقيم (الأرقام تبقى)."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _FP_PUNCT_RE.sub(" ", text)
+    return _FP_SPACE_RE.sub(" ", text).strip()
 
-# ---------------- التحقق من شروط النشر الفوري ----------------
-async def can_publish_immediate() -> bool:
-    global last_immediate_post_id, last_immediate_post_time
-    
-    if last_immediate_post_id is None:
-        return True
-    
-    try:
-        post = await client.get_messages(TARGET_CHANNEL_ID, ids=last_immediate_post_id)
-        views = post.views or 0
-        if views >= IMMEDIATE_MIN_VIEWS:
-            logging.info(f"✅ مشاهدات كافية ({views} ≥ {IMMEDIATE_MIN_VIEWS})")
-            return True
-    except Exception as e:
-        logging.warning(f"فشل جلب المشاهدات: {e}")
-    
-    elapsed = (datetime.now() - last_immediate_post_time).total_seconds()
-    if elapsed >= IMMEDIATE_TIMEOUT:
-        logging.info(f"✅ مرور الوقت الكافي ({elapsed:.0f} ثانية ≥ {IMMEDIATE_TIMEOUT})")
-        return True
-    
-    logging.info(f"⏳ لا توجد شروط نشر فوري بعد: {views} مشاهدة، {elapsed:.0f} ثانية")
-    return False
+def content_fingerprint(text: str, scope: str = "") -> bytes:
+    normalized = normalize_for_fingerprint(text)
+    return hashlib.blake2b(f"{scope}\x00{normalized}".encode("utf-8"), digest_size=16).digest()
 
-# ---------------- متغيرات معرفات القنوات (بعد التحويل) ----------------
-SOURCE_CHANNEL_ID = None
-SOURCE_CHANNEL_2_ID = None
-TARGET_CHANNEL_ID = None
-ANALYST_TARGET_ID = None
-CONTROL_CHANNEL_ID = None
+class FingerprintIndex:
+    """فهرس بصمات محدود الحجم: إخلاء LRU حقيقي + صلاحية TTL، وبحث O(1)."""
 
-# ---------------- تحليل وترجمة ----------------
-async def analyze_and_translate(text: str, target_lang: str, max_retries: int = 6, retry_delay: int = 5) -> dict:
-    if not text:
-        return {"impact": "⚪ تأثير محايد", "translation": ""}
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries = OrderedDict()  # بصمة -> وقت أول ظهور (الأقل استخدامًا أولاً)
+        self.duplicates = 0
 
-    attempt = 0
-    while attempt < max_retries:
-        client_ai = openai_manager.get_client()
-        try:
-            response = client_ai.chat.completions.create(
-               # model="gpt-4o-mini",
-                model="gpt-5-nano",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "أنت محلل اقتصادي ومترجم محترف في عام 2026 حيث ترامب هو رئيس امريكا. "
-                            "حلّل الخبر، ثم أعد صياغته بالعربية بأسلوب اقتصادي مختصر. "
-                            "أولاً، قدم تقييمًا للتأثير من كلمتين إلى أربع. "
-                            "ثم ضع ### ثم أعد الصياغة بالعربية."
-                        )
-                    },
-                    {"role": "user", "content": text}
-                ]
-                #temperature=0.3,
-            )
+    def __len__(self):
+        return len(self._entries)
 
-            content = response.choices[0].message.content.strip()
-            parts = content.split("###", 1)
-            impact = parts[0].strip() if parts else "⚪ تأثير محايد"
-            translation = parts[1].strip() if len(parts) > 1 else text
-            return {"impact": impact, "translation": translation}
-        except Exception as e:
-            error_str = str(e)
-            logging.warning(f"❌ محاولة {attempt + 1} فشلت: {error_str[:100]}...")
-            if 'client_ai' in locals() and hasattr(client_ai, 'api_key'):
-                openai_manager.mark_failed(client_ai.api_key, error_str)
-            if attempt < max_retries - 1:
-                await asyncio.sleep(retry_delay)
-            else:
-                logging.error("⚠️ فشل التحليل بعد جميع المحاولات.")
-                return {"impact": "⚪ تأثير محايد", "translation": text}
-            attempt += 1
+    def _expire(self, now: float):
+        entries = self._entries
+        while entries:
+            key, seen_at = next(iter(entries.items()))
+            if now - seen_at <= self.ttl:
+                break
+            entries.popitem(last=False)
 
-# ---------------- تنسيق المنشور ----------------
-async def format_final_text(text: str, emoji: str, signature: str = None, attention=False) -> str:
-    if signature is None:
-        signature = os.getenv("SIGNATURE", "— EcoPulse")
+    def seen(self, key) -> bool:
+        """
+        يعيد True إذا كانت البصمة مكررة دون تسجيلها.
+        التكرار يحدّث موضع LRU فقط: وقت الإدراج الأصلي يبقى فلا تنزلق الصلاحية
+        ولا يُحجب خبر يتكرر أسرع من TTL إلى الأبد.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        entries = self._entries
+        seen_at = entries.get(key)
+        if seen_at is None:
+            return False
+        if now - seen_at > self.ttl:
+            # نُقل إلى آخر الترتيب بتكرار سابق فلم يصله _expire
+            del entries[key]
+            return False
+        entries.move_to_end(key)
+        self.duplicates += 1
+        return True
 
-    cleaned = clean_text(text)
-    if not is_meaningful_text(cleaned):
-        logging.debug("🗑️ تم تجاهل نص غير ذي معنى في التنسيق")
-        return ""
+    def add(self, key):
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+            return
+        entries[key] = time.monotonic()
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
 
-    client_ai = openai_manager.get_client()
+    def check_and_add(self, key) -> bool:
+        """يعيد True إذا كانت البصمة مكررة؛ وإلا يسجّلها ويعيد False."""
+        if self.seen(key):
+            return True
+        self.add(key)
+        return False
 
-    if is_economic_data(text):
-        logging.info("📡 كشف بيانات اقتصادية")
+    def evict(self, count: int) -> int:
+        """يُخلي أقدم count بصمة ويعيد عدد ما أُخلي."""
+        entries = self._entries
+        count = min(count, len(entries))
+        for _ in range(count):
+            entries.popitem(last=False)
+        return count
+
+    def clear(self):
+        self._entries.clear()
+
+# بصمات المصادر (قبل استدعاء LLM) وبصمات النصوص المنشورة
+source_fingerprints = FingerprintIndex(DEDUP_MAX_ENTRIES, DEDUP_TTL)
+posted_texts = FingerprintIndex(MAX_POSTED_HISTORY, DEDUP_TTL)
+
+def is_duplicate_source(text: str, scope: str = "news") -> bool:
+    """فحص فقط؛ remember_source تسجّل البصمة حين يُعالج الخبر فعلاً."""
+    return source_fingerprints.seen(content_fingerprint(text, scope))
+
+def remember_source(text: str, scope: str = "news"):
+    source_fingerprints.add(content_fingerprint(text, scope))
+
+def is_duplicate_analysis(text: str, target) -> bool:
+    """
+    نص المحلل يُقارن ببصمات هدفه وببصمات كل أهداف الأخبار: ما وصل من مصادر الأخبار
+    لا يُعاد نشره تحليلاً. بصمات الأخبار تبقى لكل هدف حتى لا يحجب مسارٌ مسارًا آخر لنفس الخبر.
+    """
+    scopes = {f"news:{target}"}
+    scopes.update(f"news:{news_target}" for news_target in routing_table.news_targets)
+    return any(is_duplicate_source(text, scope) for scope in scopes)
+
+# ---------------- تجميع الأخبار شبه المكررة (MinHash) ----------------
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16             # 16 حزمة × 4 صفوف: احتمال المرشح يقفز قرب تشابه ~0.5
+MINHASH_SHINGLE = 5            # مقاطع أحرف بطول 5 تتحمل تغيير كلمة في عنوان قصير
+_MERSENNE_PRIME = (1 << 61) - 1
+_minhash_rng = random.Random(1)
+_MINHASH_PARAMS = [
+    (_minhash_rng.randrange(1, _MERSENNE_PRIME), _minhash_rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+def minhash_signature(text: str) -> tuple:
+    normalized = normalize_for_fingerprint(text)[:600]
+    if len(normalized) <= MINHASH_SHINGLE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + MINHASH_SHINGLE] for i in range(len(normalized) - MINHASH_SHINGLE + 1)}
+    values = [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        for shingle in shingles
+    ]
+    return tuple(min((a * value + b) % _MERSENNE_PRIME for value in values) for a, b in _MINHASH_PARAMS)
+
+class NearDuplicateIndex:
+    """
+    فهرس LSH على توقيعات MinHash: يجد المجموعة التي يشبهها النص (تشابه Jaccard تقديري ≥ العتبة)
+    بمقارنة المرشحين من الحزم فقط بدل مقارنة كل الأخبار السابقة.
+    """
+
+    def __init__(self, threshold: float, bands: int = MINHASH_BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = MINHASH_PERMUTATIONS // bands
+        self._signatures = []          # (التوقيع، رقم المجموعة)
+        self._buckets = defaultdict(list)
+
+    def _keys(self, signature: tuple):
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def match(self, signature: tuple):
+        """يعيد رقم المجموعة الأقرب أو None."""
+        best, best_score = None, self.threshold
+        seen = set()
+        for key in self._keys(signature):
+            for position in self._buckets.get(key, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                candidate, cluster = self._signatures[position]
+                score = sum(x == y for x, y in zip(signature, candidate)) / MINHASH_PERMUTATIONS
+                if score >= best_score:
+                    best, best_score = cluster, score
+        return best
+
+    def insert(self, signature: tuple, cluster: int):
+        position = len(self._signatures)
+        self._signatures.append((signature, cluster))
+        for key in self._keys(signature):
+            self._buckets[key].append(position)
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def compact(self) -> int:
+        """يبقي أول توقيع لكل مجموعة ويعيد بناء الحزم؛ يعيد عدد التوقيعات المحذوفة."""
+        kept, seen = [], set()
+        for signature, cluster in self._signatures:
+            if cluster not in seen:
+                seen.add(cluster)
+                kept.append((signature, cluster))
+        dropped = len(self._signatures) - len(kept)
+        if dropped:
+            self._signatures = []
+            self._buckets = defaultdict(list)
+            for signature, cluster in kept:
+                self.insert(signature, cluster)
+        return dropped
+
+def _minhash_entry_bytes() -> int:
+    """
+    كلفة خبر واحد في NearDuplicateIndex، مقيسة بـ sys.getsizeof على توقيع حقيقي:
+    صف التوقيع وأعداده، مدخل (التوقيع، المجموعة) وخانته في القائمة، ولكل حزمة مفتاحها
+    (صف الحزمة وشريحة التوقيع؛ أعدادها مشتركة مع التوقيع) وقائمة مواقعها ومدخل القاموس
+    (أسوأ حالة: حزمة جديدة لكل خبر).
+    """
+    index = NearDuplicateIndex(1.0)
+    signature = minhash_signature("Oil prices jump after OPEC announces a surprise output cut")
+    size = sys.getsizeof(signature) + sum(sys.getsizeof(value) for value in signature)
+    size += sys.getsizeof((signature, 0)) + 8
+    for key in index._keys(signature):
+        size += sys.getsizeof(key) + sys.getsizeof(key[1]) + sys.getsizeof([0]) + 3 * 8  # مدخل القاموس: تجزئة + مفتاح + قيمة
+    return size
+
+MINHASH_SIGNATURE_BYTES = _minhash_entry_bytes()
+
+# ---------------- ذاكرة معرفات القنوات ----------------
+PEER_TYPES = {"channel": InputPeerChannel, "user": InputPeerUser, "chat": InputPeerChat}
+
+class EntityCache:
+    """
+    ذاكرة دائمة (JSON) لمعرفات القنوات المحلولة مع access_hash.
+    عند الإقلاع تُعتمد القيم المخزنة فورًا وتُزرع في جلسة Telethon
+    (فلا حاجة لـ get_entity قبل الإرسال)، ثم تُحدَّث في الخلفية.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}  # مدخل .env -> {"id", "peer", "peer_id", "access_hash"}
+        self.dirty = False
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
         try:
-            response = client_ai.chat.completions.create(
-                model="gpt-5-nano",
-                messages=[
-                    {
-                        "role": "system",
-                        "content":(
-                            "أنت محرر أخبار اقتصادية محترف. "
-                            "استخرج البيانات واعرضها بالقالب:\n"
-                            "🔴 صدر الآن :\n\n"
-                            "💠 {الدولة}\n"
-                            "🔵 {المؤشر}\n\n"
-                            "🕒 السابق :\n"
-                            "🕒 التقدير :\n"
-                            "🕓 الحالي :\n\n"
-                            "👈 النتيجة : تحليل ≤ 9 كلمات."
-                        )
-                    },
-                    {"role": "user", "content": text}
-                ]
-                #temperature=0.5,
-            )
-            translation = response.choices[0].message.content.strip()
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"⚠️ تعذر قراءة ذاكرة القنوات ({self.path}): {e}")
+            self.entries = {}
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as e:
+            logging.warning(f"⚠️ تعذر حفظ ذاكرة القنوات ({self.path}): {e}")
+
+    def get(self, channel_input: str):
+        entry = self.entries.get(channel_input)
+        return entry["id"] if entry else None
+
+    def put(self, channel_input: str, entity_id: int, entity=None):
+        entry = {"id": entity_id}
+        if entity is not None:
+            try:
+                peer = utils.get_input_peer(entity, allow_self=False)
+            except TypeError:
+                peer = None
+            for name, peer_type in PEER_TYPES.items():
+                if isinstance(peer, peer_type):
+                    entry["peer"] = name
+                    entry["peer_id"] = getattr(peer, f"{name}_id")
+                    entry["access_hash"] = getattr(peer, "access_hash", 0)
+        if self.entries.get(channel_input) != entry:
+            self.entries[channel_input] = entry
+            self.dirty = True
+
+    def input_peers(self):
+        peers = []
+        for entry in self.entries.values():
+            peer_type = PEER_TYPES.get(entry.get("peer"))
+            if peer_type is InputPeerChat:
+                peers.append(InputPeerChat(entry["peer_id"]))
+            elif peer_type is not None:
+                peers.append(peer_type(entry["peer_id"], entry["access_hash"]))
+        return peers
+
+    def seed(self, session):
+        """زرع access_hash المخزنة في جلسة Telethon (StringSession لا تحفظها)."""
+        peers = self.input_peers()
+        if peers:
+            session.process_entities(peers)
+        return len(peers)
+
+entity_cache = EntityCache(ENTITY_CACHE_PATH)
+
+# ---------------- حل معرفات القنوات ----------------
+async def resolve_channel(channel_input: str, fresh: bool = False):
+    channel_input = channel_input.strip()
+    if not fresh:
+        cached = entity_cache.get(channel_input)
+        if cached is not None:
+            return cached
+    try:
+        if channel_input == "me":
+            entity = await client.get_me()
+        elif channel_input.lstrip('-').isdigit():
+            if not fresh:
+                return int(channel_input)
+            entity = await client.get_entity(int(channel_input))
+            entity_cache.put(channel_input, int(channel_input), entity)
+            return int(channel_input)
+        else:
+            entity = await client.get_entity(channel_input)
+    except Exception as e:
+        raise ValueError(f"قناة غير صالحة '{channel_input}': {str(e)[:100]}")
+    entity_cache.put(channel_input, entity.id, entity)
+    return entity.id
+
+async def resolve_channels(channel_inputs: dict, fresh: bool = False) -> dict:
+    """حل جميع القنوات بالتوازي: {الاسم: مدخل .env} -> {الاسم: المعرف}."""
+    names = [name for name, value in channel_inputs.items() if value]
+    results = await asyncio.gather(*(resolve_channel(channel_inputs[name], fresh) for name in names))
+    return dict(zip(names, results))
+
+async def refresh_entity_cache(channel_inputs: dict):
+    """تحديث المعرفات المخزنة من الشبكة في الخلفية بعد الإقلاع."""
+    cached = {name: entity_cache.get(value.strip()) for name, value in channel_inputs.items() if value}
+    names = list(cached)
+    results = await asyncio.gather(
+        *(resolve_channel(channel_inputs[name], fresh=True) for name in names),
+        return_exceptions=True
+    )
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            logging.warning("⚠️ تعذر تحديث القناة %s: %s", name, result)
+        elif cached[name] is not None and cached[name] != result:
+            logging.warning("⚠️ تغيّر معرف القناة %s: %s → %s — أعد التشغيل لاعتماده", name, cached[name], result)
+    entity_cache.save()
+
+# ---------------- زمن الإقلاع ----------------
+first_message_at = None
+
+def note_first_message(path: str):
+    global first_message_at
+    if first_message_at is not None:
+        return
+    first_message_at = time.monotonic()
+    elapsed = first_message_at - STARTED_AT
+    metrics.observe(METRIC_STAGE_SECONDS, elapsed, stage="first_message")
+    logging.info("⏱️ أول رسالة (%s) بعد %.2f ث من التشغيل", path, elapsed)
+
+# ---------------- جدول المسارات ----------------
+PIPELINE_IMMEDIATE = "immediate"   # أخبار: الاقتصادي والكلمات المفتاحية فورًا، والباقي للمكدس
+PIPELINE_SCHEDULED = "scheduled"   # مثل immediate مع رمز المجدول (سلوك SOURCE_CHANNEL_2)
+PIPELINE_ANALYST = "analyst"
+PIPELINE_HOURLY = "hourly"
+PIPELINE_EMOJIS = {
+    PIPELINE_IMMEDIATE: EMOJI_IMMEDIATE,
+    PIPELINE_SCHEDULED: EMOJI_SCHEDULED,
+    PIPELINE_ANALYST: EMOJI_ALERT,
+    PIPELINE_HOURLY: EMOJI_HOURLY,
+}
+NEWS_PIPELINES = (PIPELINE_IMMEDIATE, PIPELINE_SCHEDULED)
+GATE_VIEWS = "views"  # انتظار مشاهدات آخر منشور في الهدف (أو المهلة)
+GATE_NONE = "none"    # نشر دون بوابة
+
+Route = namedtuple("Route", "source pipeline target emoji gate")
+
+def chat_keys(chat_id: int) -> tuple:
+    """مفاتيح event.chat_id المطابقة لمعرف محلول (المعرف الموجب قد يكون مستخدمًا أو مجموعة أو قناة)."""
+    if chat_id < 0:
+        return (chat_id,)
+    return tuple(utils.get_peer_id(peer(chat_id)) for peer in (PeerUser, PeerChat, PeerChannel))
+
+def legacy_route_specs() -> list:
+    """المسارات المكافئة لمتغيرات .env (عند غياب ملف المسارات)."""
+    specs = [
+        {"source": SOURCE_CHANNEL, "pipeline": PIPELINE_IMMEDIATE, "target": TARGET_CHANNEL},
+        {"source": SOURCE_CHANNEL_2, "pipeline": PIPELINE_SCHEDULED, "target": TARGET_CHANNEL},
+    ]
+    if ANALYST_SOURCE and ANALYST_TARGET:
+        specs.append({"source": ANALYST_SOURCE, "pipeline": PIPELINE_ANALYST, "target": ANALYST_TARGET})
+    if HOURLY_SOURCE:
+        specs.append({"source": HOURLY_SOURCE, "pipeline": PIPELINE_HOURLY, "target": HOURLY_TARGET})
+    return specs
+
+class RoutingTable:
+    """
+    جدول مسارات تصريحي: قناة مصدر -> مسار أو أكثر (خط المعالجة، الهدف، الرمز، البوابة).
+    الموزّع يبحث بمعرف المحادثة في قاموس O(1)، والجدول يُستبدل كاملًا عند إعادة التحميل.
+
+    صيغة routes.json:
+        {"routes": [{"source": "@feed", "pipeline": "immediate", "target": "@channel",
+                     "emoji": "🚨", "gate": "views"}, ...]}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.routes = {}   # event.chat_id -> tuple(Route)
+        self.route_list = []
+        self.news_targets = ()  # أهداف مسارات الأخبار (لمقارنة نصوص المحلل بمصادر الأخبار)
+        self.inputs = {}   # مدخلات القنوات المستخدمة (لتحديث ذاكرة المعرفات)
+        self.mtime = None
+        self.loaded_from = None
+
+    def _read_specs(self) -> list:
+        if not self.path or not os.path.exists(self.path):
+            self.mtime = None
+            self.loaded_from = ".env"
+            return legacy_route_specs()
+        self.mtime = os.path.getmtime(self.path)
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        specs = data.get("routes", []) if isinstance(data, dict) else data
+        for spec in specs:
+            if spec.get("pipeline") not in PIPELINE_EMOJIS:
+                raise ValueError(f"خط معالجة غير معروف: {spec.get('pipeline')!r}")
+            if not spec.get("source"):
+                raise ValueError(f"مسار بدون مصدر: {spec}")
+            if spec.get("gate", GATE_VIEWS) not in (GATE_VIEWS, GATE_NONE):
+                raise ValueError(f"بوابة غير معروفة: {spec.get('gate')!r}")
+        self.loaded_from = self.path
+        return specs
+
+    def install(self, routes):
+        table = defaultdict(list)
+        for route in routes:
+            for key in chat_keys(route.source):
+                table[key].append(route)
+        self.routes = {key: tuple(items) for key, items in table.items()}
+        self.route_list = list(routes)
+        self.news_targets = tuple({route.target for route in routes if route.pipeline in NEWS_PIPELINES and route.target})
+
+    async def load(self):
+        """قراءة المواصفات وحل جميع القنوات بالتوازي ثم استبدال الجدول دفعة واحدة."""
+        global HOURLY_TARGET_ID
+        specs = self._read_specs()
+        inputs = {}
+        for spec in specs:
+            for field in ("source", "target"):
+                value = str(spec.get(field) or "").strip()
+                if value:
+                    inputs[value] = value
+        resolved = await resolve_channels(inputs)
+        routes = []
+        for spec in specs:
+            pipeline = spec["pipeline"]
+            target = resolved.get(str(spec.get("target") or "").strip())
+            routes.append(Route(
+                resolved[str(spec["source"]).strip()],
+                pipeline,
+                target,
+                spec.get("emoji") or PIPELINE_EMOJIS[pipeline],
+                spec.get("gate", GATE_VIEWS),
+            ))
+            if pipeline == PIPELINE_HOURLY and target:
+                HOURLY_TARGET_ID = target  # موجز الساعة واحد: هدفه هدف مسار hourly
+        self.install(routes)
+        self.inputs = inputs
+        entity_cache.save()
+        sources = len({route.source for route in routes})
+        logging.info("🧭 جدول المسارات: %s مسار من %s مصدر (%s)", len(routes), sources, self.loaded_from)
+
+    async def reload(self) -> bool:
+        try:
+            await self.load()
+            return True
+        except Exception as e:
+            logging.warning("⚠️ تعذر إعادة تحميل المسارات: %s — الإبقاء على الجدول الحالي", e)
+            return False
+
+    async def watch(self, interval: float):
+        """إعادة التحميل تلقائيًا عند تعديل ملف المسارات (دون إعادة تشغيل)."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                mtime = os.path.getmtime(self.path) if self.path and os.path.exists(self.path) else None
+            except OSError:
+                continue
+            if mtime != self.mtime:
+                await self.reload()
+
+    def news_routes(self, source):
+        """مسارات الأخبار لمصدر ما (للناشر المجدول)، مع الهدف الافتراضي للسجلات اليتيمة."""
+        routes = [route for route in self.routes.get(source, ()) if route.pipeline in NEWS_PIPELINES and route.target]
+        return routes or [Route(source, PIPELINE_SCHEDULED, TARGET_CHANNEL_ID, EMOJI_SCHEDULED, GATE_VIEWS)]
+
+    def describe(self) -> str:
+        if not self.route_list:
+            return "لا توجد مسارات"
+        return "\n".join(
+            f"  • `{route.source}` → {route.pipeline} → `{route.target or '—'}` ({route.emoji}، {route.gate})"
+            for route in self.route_list
+        )
+
+routing_table = RoutingTable(ROUTES_PATH)
+
+# ---------------- تصنيف الرسائل ----------------
+# مصنّف واحد مترجم مسبقًا: بيانات اقتصادية / MACRO / كلمة مفتاحية / أخرى
+message_classifier = MessageClassifier(KEYWORDS_LIST)
+classify_message = message_classifier.classify
+
+def is_economic_data(text: str) -> bool:
+    return message_classifier.is_economic_data(text)
+
+# ---------------- متتبع المشاهدات ----------------
+class ViewsTracker:
+    """
+    مهمة واحدة تجلب مشاهدات جميع المنشورات المراقبة (الفوري والمجدول)
+    في طلب get_messages واحد دوريًا، وتخزنها مع نافذة صلاحية.
+    البوابات تقرأ من الذاكرة فقط دون أي طلب شبكة.
+    """
+
+    MISSING = -1  # المنشور حُذف أو لم يعد موجودًا
+
+    def __init__(self, poll_interval: float, freshness: float):
+        self.poll_interval = poll_interval
+        self.freshness = freshness
+        self.watched = defaultdict(set)  # قناة -> معرفات المنشورات
+        self._views = {}  # (قناة، معرف المنشور) -> (المشاهدات، وقت الجلب)
+        self._watched_at = {}  # (قناة، معرف المنشور) -> بداية المراقبة (لمهلة البوابة)
+        self.failing = {}  # قناة -> وقت آخر فشل جلب (يُمسح عند أول نجاح)
+        self._updated = asyncio.Condition()
+        self.fetches = 0
+
+    def watch(self, post_id: int, channel=None):
+        if post_id:
+            channel = channel or TARGET_CHANNEL_ID
+            self.watched[channel].add(post_id)
+            self._watched_at.setdefault((channel, post_id), time.monotonic())
+
+    def unwatch(self, post_id: int, channel=None):
+        channel = channel or TARGET_CHANNEL_ID
+        self.watched[channel].discard(post_id)
+        self._views.pop((channel, post_id), None)
+        self._watched_at.pop((channel, post_id), None)
+
+    def get(self, post_id: int, channel=None):
+        """يعيد المشاهدات المخزنة إذا كانت حديثة، وإلا None."""
+        entry = self._views.get((channel or TARGET_CHANNEL_ID, post_id))
+        if entry is None or time.monotonic() - entry[1] > self.freshness:
+            return None
+        return entry[0]
+
+    def gate_passed(self, post_id: int, min_views: int, channel=None) -> bool:
+        """
+        بوابة المشاهدات: بلغ المنشور الحد (أو حُذف). وكما في السابق لا تحبس البوابة النشر
+        إن تعذر جلب مشاهدات القناة (حظر، قناة محذوفة، مهلة) أو طال الانتظار أكثر من VIEWS_WAIT_TIMEOUT.
+        """
+        channel = channel or TARGET_CHANNEL_ID
+        views = self.get(post_id, channel)
+        if views is not None and (views == self.MISSING or views >= min_views):
+            return True
+        if channel in self.failing:
+            metrics.inc("ecopulse_gate_decisions_total", gate="views", result="fetch_error")
+            logging.info("⚠️ تعذر جلب مشاهدات %s — تجاوز بوابة المشاهدات", channel, extra={"stage": "gate"})
+            return True
+        waited = time.monotonic() - self._watched_at.get((channel, post_id), time.monotonic())
+        if waited > VIEWS_WAIT_TIMEOUT:
+            metrics.inc("ecopulse_gate_decisions_total", gate="views", result="timeout")
+            logging.info("⌛ انتهت مهلة بوابة المشاهدات (%.0f ثانية) — النشر", waited, extra={"stage": "gate"})
+            return True
+        return False
+
+    async def _fetch(self, channel, ids: list):
+        try:
+            posts = await asyncio.wait_for(client.get_messages(channel, ids=ids), timeout=max(5.0, self.poll_interval))
+        except Exception as e:
+            if channel not in self.failing:
+                logging.warning(f"فشل جلب المشاهدات من {channel}: {e}")
+            self.failing[channel] = time.monotonic()
+            return
+        self.failing.pop(channel, None)
+        now = time.monotonic()
+        for post_id, post in zip(ids, posts):
+            views = self.MISSING if post is None else (post.views or 0)
+            self._views[(channel, post_id)] = (views, now)
+
+    async def refresh(self):
+        # طلب get_messages واحد لكل قناة هدف، والقنوات بالتوازي؛ فشل قناة لا يوقف غيرها
+        batches = [(channel, sorted(ids)) for channel, ids in self.watched.items() if ids and channel is not None]
+        if not batches:
+            return
+        try:
+            await asyncio.gather(*(self._fetch(channel, ids) for channel, ids in batches))
+            self.fetches += 1
+        finally:
+            async with self._updated:
+                self._updated.notify_all()
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.warning(f"فشل جلب المشاهدات: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def wait_for_views(self, post_id: int, min_views: int, channel=None):
+        """ينتظر حتى تنفتح بوابة المشاهدات (gate_passed)؛ يعيد المشاهدات المخزنة أو None."""
+        self.watch(post_id, channel)
+        while not self.gate_passed(post_id, min_views, channel):
+            # إعادة الفحص كل دورة حتى دون إشعار (مهمة الجلب متوقفة) ليبقى الانتظار محدودًا بالمهلة
+            with contextlib.suppress(asyncio.TimeoutError):
+                async with self._updated:
+                    await asyncio.wait_for(self._updated.wait(), timeout=self.poll_interval)
+        return self.get(post_id, channel)
+
+views_tracker = ViewsTracker(VIEWS_POLL_INTERVAL, VIEWS_FRESHNESS)
+
+# ---------------- التحقق من شروط النشر الفوري ----------------
+def can_publish_immediate(target=None) -> bool:
+    target = target or TARGET_CHANNEL_ID
+    last_post = immediate_posts.get(target)
+    if last_post is None:
+        return True
+    last_immediate_post_id, last_immediate_post_time = last_post
+
+    views = views_tracker.get(last_immediate_post_id, target)
+    if views is not None and (views == ViewsTracker.MISSING or views >= IMMEDIATE_MIN_VIEWS):
+        logging.info("✅ مشاهدات كافية (%s ≥ %s)", views, IMMEDIATE_MIN_VIEWS, extra={"stage": "gate"})
+        return True
+
+    elapsed = (datetime.now() - last_immediate_post_time).total_seconds()
+    if elapsed >= IMMEDIATE_TIMEOUT:
+        logging.info("✅ مرور الوقت الكافي (%.0f ثانية ≥ %s)", elapsed, IMMEDIATE_TIMEOUT, extra={"stage": "gate"})
+        return True
+
+    logging.info("⏳ لا توجد شروط نشر فوري بعد: %s مشاهدة، %.0f ثانية", "?" if views is None else views, elapsed, extra={"stage": "gate"})
+    return False
+
+def note_immediate_post(sent, target=None):
+    """تسجيل آخر منشور فوري في قناة الهدف ونقل المراقبة إليه."""
+    target = target or TARGET_CHANNEL_ID
+    last_post = immediate_posts.get(target)
+    if last_post is not None:
+        views_tracker.unwatch(last_post[0], target)
+    immediate_posts[target] = (sent.id, datetime.now())
+    views_tracker.watch(sent.id, target)
+
+# ---------------- متغيرات معرفات القنوات (بعد التحويل) ----------------
+TARGET_CHANNEL_ID = None  # الهدف الافتراضي (TARGET_CHANNEL)
+ANALYST_TARGET_ID = None
+CONTROL_CHANNEL_ID = None
+
+# ---------------- تحليل وترجمة ----------------
+def parse_impact_translation(content: str, text: str) -> dict:
+    parts = content.split("###", 1)
+    impact = parts[0].strip() if parts else "⚪ تأثير محايد"
+    translation = parts[1].strip() if len(parts) > 1 else text
+    return {"impact": impact, "translation": translation}
+
+async def analyze_and_translate(text: str, target_lang: str, max_retries: int = 6, retry_delay: float = LLM_BACKOFF_BASE,
+                                batch: bool = False) -> dict:
+    if not text:
+        return {"impact": "⚪ تأثير محايد", "translation": ""}
+
+    if batch and LLM_BATCH_ENABLED:
+        return await translation_batcher.translate(text)
+
+    attempt = 0
+    while attempt < max_retries:
+        try:
+            content = await cached_complete(PROMPT_TRANSLATE, text)
+            return parse_impact_translation(content, text)
+        except CircuitOpenError:
+            # لا فائدة من إعادة المحاولة أثناء فتح القاطع
+            return {"impact": "⚪ تأثير محايد", "translation": text}
         except Exception as e:
             error_str = str(e)
-            logging.warning(f"⚠️ فشل في معالجة ACTUAL: {error_str[:100]}...")
-            if 'client_ai' in locals() and hasattr(client_ai, 'api_key'):
-                openai_manager.mark_failed(client_ai.api_key, error_str)
-            fallback = f"🔴 **بيانات اقتصادية**\n\n```{clean_text(text)[:200]}...```\n\n{signature}"
-            return fallback
+            logging.warning(f"❌ محاولة {attempt + 1} فشلت: {error_str[:100]}...")
+            if attempt < max_retries - 1:
+                # 429 يُهدّئ المفتاح نفسه؛ المحاولة التالية تختار مفتاحًا آخر أو تنتظر retry-after
+                await asyncio.sleep(openai_manager.backoff_delay(attempt, retry_delay))
+            else:
+                logging.error("⚠️ فشل التحليل بعد جميع المحاولات.")
+                return {"impact": "⚪ تأثير محايد", "translation": text}
+            attempt += 1
+
+# ---------------- تجميع طلبات الترجمة ----------------
+class TranslationBatcher:
+    """
+    يجمع حتى N طلب ترجمة (أو ينتظر T ميلي ثانية) ويرسلها في طلب JSON واحد
+    يعيد التأثير والترجمة لكل خبر. العناصر التي تفشل فقط تُعاد فرديًا.
+    """
+
+    def __init__(self, max_items: int, wait_ms: int):
+        self.max_items = max(1, max_items)
+        self.wait = max(0, wait_ms) / 1000
+        self._pending = []  # (النص، المستقبل)
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.retried = 0
+
+    async def translate(self, text: str) -> dict:
+        cached = await llm_cache.get(TranslationCache.make_key(PROMPT_TRANSLATE, text, OPENAI_MODEL))
+        if cached is not None:
+            return parse_impact_translation(cached, text)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        results = {}
+        if len(batch) > 1:
+            self.batches += 1
+            payload = json.dumps([{"id": i, "text": text} for i, (text, _) in enumerate(batch)], ensure_ascii=False)
+            try:
+                content = await openai_manager.complete(
+                    PROMPT_TRANSLATE_BATCH, payload,
+                    stage=f"دفعة ترجمة ({len(batch)})",
+                    response_format={"type": "json_object"}
+                )
+                for entry in json.loads(content).get("items", []):
+                    index = entry.get("id")
+                    translation = str(entry.get("translation") or "").strip()
+                    if isinstance(index, int) and 0 <= index < len(batch) and translation:
+                        impact = str(entry.get("impact") or "").strip() or "⚪ تأثير محايد"
+                        results[index] = {"impact": impact, "translation": translation}
+            except Exception as e:
+                logging.warning(f"⚠️ فشل طلب الدفعة ({len(batch)} خبر): {str(e)[:100]}...")
+
+        retry = []
+        for index, (text, future) in enumerate(batch):
+            result = results.get(index)
+            if result is None:
+                retry.append((text, future))
+                continue
+            llm_cache.put(
+                TranslationCache.make_key(PROMPT_TRANSLATE, text, OPENAI_MODEL),
+                f"{result['impact']}\n###\n{result['translation']}"
+            )
+            if not future.done():
+                future.set_result(result)
+
+        if retry:
+            if len(batch) > 1:
+                self.retried += len(retry)
+                logging.info(f"🔁 إعادة {len(retry)}/{len(batch)} خبر فرديًا بعد الدفعة")
+            retried = await asyncio.gather(*(analyze_and_translate(text, "ar") for text, _ in retry))
+            for (_, future), result in zip(retry, retried):
+                if not future.done():
+                    future.set_result(result)
+
+translation_batcher = TranslationBatcher(LLM_BATCH_MAX_ITEMS, LLM_BATCH_WAIT_MS)
+
+# ---------------- تنسيق المنشور ----------------
+@timed("format")
+async def format_final_text(text: str, emoji: str, signature: str = None, attention=False, category: str = None,
+                            batch: bool = False) -> str:
+    if signature is None:
+        signature = os.getenv("SIGNATURE", "— EcoPulse")
+
+    cleaned = clean_text(text)
+    if not is_meaningful_text(cleaned):
+        logging.debug("🗑️ تم تجاهل نص غير ذي معنى في التنسيق")
+        return ""
+
+    if category is None:
+        category = classify_message(text).category
+
+    if category == CATEGORY_ECONOMIC:
+        release = parse_release(text) if ECONOMIC_LOCAL_FORMAT else None
+        metrics.inc("ecopulse_economic_format_total", source="local" if release is not None else "llm")
+        if release is not None:
+            final_text = f"{render_release(release)}\n\n{signature}\n\n{CHANNEL_WATERMARK}"
+            return final_text[:4000]
+
+        logging.info("📡 كشف بيانات اقتصادية")
+        try:
+            translation = await cached_complete(PROMPT_ECONOMIC, text)
+        except Exception as e:
+            logging.warning(f"⚠️ فشل في معالجة ACTUAL: {str(e)[:100]}...")
+            return fallback_text(text, emoji, category, signature)
 
         final_text = f"{translation}\n\n{signature}\n\n{CHANNEL_WATERMARK}"
         return final_text[:4000]
 
-    elif "MACRO" in text.upper():
+    elif category == CATEGORY_MACRO:
         try:
-            response = client_ai.chat.completions.create(
-                model="gpt-5-nano",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "أنت محلل اقتصادي حيث ترامب هو الرئيس الحالي لامريكا. قم بتحليل الخبر بالعربية ≤ 10 كلمات."
-                        )
-                    },
-                    {"role": "user", "content": text}
-                ]
-                #temperature=0.7,
-            )
-            translation = response.choices[0].message.content.strip()
+            translation = await cached_complete(PROMPT_MACRO, text)
         except Exception as e:
-            error_str = str(e)
-            logging.warning(f"⚠️ فشل في التحليل (MACRO): {error_str[:100]}...")
-            if 'client_ai' in locals() and hasattr(client_ai, 'api_key'):
-                openai_manager.mark_failed(client_ai.api_key, error_str)
-            fallback = f"💡 **تحليل اقتصادي**\n\n```{clean_text(text)[:150]}...```\n\n{signature}"
-            return fallback
+            logging.warning(f"⚠️ فشل في التحليل (MACRO): {str(e)[:100]}...")
+            return fallback_text(text, emoji, category, signature)
 
         final_text = f"{translation}\n\n{signature}\n\n{CHANNEL_WATERMARK}"
         return final_text[:4000]
 
     else:
-        result = await analyze_and_translate(text, "ar")
-        header_attention = f"{EMOJI_ALERT} **إنتباه:**\n\n" if attention else ""
-        final_text = f"{header_attention}{result['impact']}\n\n{emoji} {result['translation']}\n\n{signature}\n\n{CHANNEL_WATERMARK}"
-        return final_text[:4000]
+        result = await analyze_and_translate(text, "ar", batch=batch)
+        return compose_news_text(result, emoji, signature, attention)
+
+def compose_news_text(result: dict, emoji: str, signature: str, attention=False) -> str:
+    header_attention = f"{EMOJI_ALERT} **إنتباه:**\n\n" if attention else ""
+    final_text = f"{header_attention}{result['impact']}\n\n{emoji} {result['translation']}\n\n{signature}\n\n{CHANNEL_WATERMARK}"
+    return final_text[:4000]
+
+def fallback_text(text: str, emoji: str, category: str = None, signature: str = None, attention=False,
+                  pending: bool = False) -> str:
+    """
+    المنشور البديل دون LLM، مطابق لما يعيده format_final_text عند فشل الطلب.
+    pending: بديل مهلة سيُستبدل لاحقًا، فيحمل علامة "قيد الإعداد" بدل حكم تأثير لم يصدر بعد.
+    """
+    if signature is None:
+        signature = os.getenv("SIGNATURE", "— EcoPulse")
+    if category is None:
+        category = classify_message(text).category
+    if category == CATEGORY_ECONOMIC:
+        return f"🔴 **بيانات اقتصادية**\n\n```{clean_text(text)[:200]}...```\n\n{signature}"
+    if category == CATEGORY_MACRO:
+        return f"💡 **تحليل اقتصادي**\n\n```{clean_text(text)[:150]}...```\n\n{signature}"
+    impact = "⏳ الترجمة قيد الإعداد" if pending else "⚪ تأثير محايد"
+    return compose_news_text({"impact": impact, "translation": text}, emoji, signature, attention)
+
+# ---------------- مجدول الإرسال (مسار لكل وجهة) ----------------
+SEND_MIN_INTERVAL = float(os.getenv("SEND_MIN_INTERVAL", "1.0"))      # ثوانٍ بين رسالتين لنفس القناة
+CONTROL_MIN_INTERVAL = 0.3
+SEND_MAX_FLOOD_RETRIES = 3
+
+class SendLane:
+    """
+    مسار إرسال مستقل لوجهة واحدة: طابور خاص، تباعد أدنى بين الرسائل،
+    وعند FloodWait يتوقف هذا المسار وحده بينما تواصل المسارات الأخرى الإرسال.
+    """
+
+    def __init__(self, name: str, min_interval: float):
+        self.name = name
+        self.min_interval = min_interval
+        self.queue = deque()  # [مصنع الطلب، المستقبل، عدد محاولات التجميد]
+        self.sent = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.flood_seconds = 0.0
+        self.parked_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._last_send = 0.0
+
+    def submit(self, factory) -> asyncio.Future:
+        """يضيف طلب إرسال ويعيد مستقبلاً بنتيجته دون انتظار."""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append([factory, future, 0, time.monotonic()])
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return future
+
+    async def _run(self):
+        while True:
+            if not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job = self.queue[0]
+            factory, future, _, submitted = job
+            if future.done():
+                self.queue.popleft()
+                continue
+            delay = self._last_send + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = time.monotonic()
+            try:
+                result = await factory()
+            except FloodWaitError as fe:
+                self.flood_waits += 1
+                stats["flood_waits"] += 1
+                metrics.inc("ecopulse_flood_wait_seconds_total", fe.seconds + 1, lane=self.name)
+                job[2] += 1
+                wait = fe.seconds + 1
+                self.flood_seconds += wait
+                self.parked_until = time.monotonic() + wait
+                if job[2] > SEND_MAX_FLOOD_RETRIES:
+                    # إسقاط المهمة لا ينهي الحظر: المسار يبقى متوقفًا حتى الموعد قبل المهمة التالية
+                    self.queue.popleft()
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(fe)
+                    logging.warning("🗑️ Flood wait على مسار %s: أُسقطت رسالة بعد %d محاولات، الانتظار %s ثانية...", self.name, SEND_MAX_FLOOD_RETRIES, fe.seconds, extra={"stage": "send"})
+                else:
+                    logging.warning("⏳ Flood wait على مسار %s: الانتظار %s ثانية (%d في الطابور)...", self.name, fe.seconds, len(self.queue), extra={"stage": "send"})
+                await asyncio.sleep(wait)
+                continue
+            except Exception as e:
+                self.queue.popleft()
+                self.failed += 1
+                metrics.inc("ecopulse_send_errors_total", lane=self.name)
+                self._last_send = time.monotonic()
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            self.queue.popleft()
+            self.sent += 1
+            self._last_send = time.monotonic()
+            metrics.observe(METRIC_STAGE_SECONDS, started - submitted, stage="send_queue", lane=self.name)
+            metrics.observe(METRIC_STAGE_SECONDS, self._last_send - started, stage="send", lane=self.name)
+            if not future.done():
+                future.set_result(result)
+
+    def describe(self) -> str:
+        parked = self.parked_until - time.monotonic()
+        state = f"⏳ {parked:.0f}ث" if parked > 0 else "✅"
+        return (
+            f"{self.name}: {state} | طابور: {len(self.queue)} | أُرسل: {self.sent} | فشل: {self.failed} | "
+            f"تجميد: {self.flood_waits} ({self.flood_seconds:.0f}ث)"
+        )
+
+class Outbox:
+    """مجدول الإرسال المركزي: مسار لكل وجهة (الهدف، التحليل، الموجز، التحكم)."""
+
+    def __init__(self):
+        self.lanes = {}
+
+    def lane(self, name: str) -> SendLane:
+        lane = self.lanes.get(name)
+        if lane is None:
+            interval = CONTROL_MIN_INTERVAL if name == "control" else SEND_MIN_INTERVAL
+            lane = self.lanes[name] = SendLane(name, interval)
+        return lane
+
+    def lane_for(self, channel_id) -> SendLane:
+        if channel_id == TARGET_CHANNEL_ID:
+            return self.lane("target")
+        if ANALYST_TARGET_ID and channel_id == ANALYST_TARGET_ID:
+            return self.lane("analyst")
+        if HOURLY_TARGET_ID and channel_id == HOURLY_TARGET_ID:
+            return self.lane("hourly")
+        return self.lane(f"chat:{channel_id}")
+
+    def describe(self) -> str:
+        if not self.lanes:
+            return "لا توجد مسارات بعد"
+        return "\n".join(f"  • {lane.describe()}" for lane in self.lanes.values())
+
+outbox = Outbox()
+
+async def control_reply(event, text: str):
+    """ردود التحكم عبر مسارها الخاص حتى لا يعطلها تجميد قنوات النشر."""
+    try:
+        return await outbox.lane("control").submit(lambda: event.reply(text))
+    except Exception:
+        logging.exception("Error while replying in control channel")
+
+# ---------------- الوسائط (تمرير دون تنزيل) ----------------
+# الصور والفيديو تُعاد بمرجع ملفها في Telegram (InputMedia) فلا تُنزَّل ولا تُرفع أي بايتات.
+_CAPTION_BREAK_RE = re.compile(r"[\n.!?؟…]")
+
+def message_media(message):
+    """وسائط الرسالة القابلة للتمرير (صورة أو ملف/فيديو)؛ معاينات الروابط والاستطلاعات لا."""
+    media = getattr(message, "media", None)
+    if MEDIA_PASSTHROUGH and isinstance(media, (MessageMediaPhoto, MessageMediaDocument)):
+        return media
+    return None
+
+def event_media(event):
+    """(الوسائط، معرفات رسائلها) لحدث رسالة أو ألبوم؛ الوسائط واحدة أو قائمة، و(None, ()) للنص فقط."""
+    messages = getattr(event, "album", None) or [event.message]
+    pairs = [(msg.id, message_media(msg)) for msg in messages]
+    pairs = [(msg_id, media) for msg_id, media in pairs if media is not None]
+    if not pairs:
+        return None, ()
+    media = [media for _, media in pairs]
+    return (media if len(media) > 1 else media[0]), tuple(msg_id for msg_id, _ in pairs)
+
+async def fetch_source_media(chat_id, message_ids):
+    """وسائط عنصر مؤجل بمراجع ملفات حديثة (طلب get_messages واحد)؛ ما حُذف من المصدر يُهمل."""
+    if not message_ids or not MEDIA_PASSTHROUGH:
+        return None
+    try:
+        messages = await client.get_messages(chat_id, ids=list(message_ids))
+    except Exception as e:
+        logging.warning("⚠️ تعذر جلب وسائط المصدر %s: %s", list(message_ids), str(e)[:100], extra={"stage": "media"})
+        return None
+    media = [m for m in (message_media(msg) for msg in messages if msg is not None) if m is not None]
+    if not media:
+        return None
+    return media if len(media) > 1 else media[0]
+
+def caption_length(text: str) -> int:
+    """الطول كما يحسبه Telegram: بعد إزالة تنسيق Markdown وبوحدات UTF-16."""
+    plain, _ = markdown.parse(text)
+    return len(plain.encode("utf-16-le")) // 2
+
+def clip_caption(text: str, limit: int = MEDIA_CAPTION_LIMIT) -> str:
+    """يقص النص ليتسع تعليقًا عند آخر نهاية سطر/جملة قبل الحد (للتعديلات اللاحقة على منشور وسائط)."""
+    if caption_length(text) <= limit:
+        return text
+    cut = text[:limit]
+    while cut and caption_length(cut + "…") > limit:
+        cut = cut[:-max(1, len(cut) // 20)]
+    breaks = [match.end() for match in _CAPTION_BREAK_RE.finditer(cut)]
+    if breaks and breaks[-1] > len(cut) // 2:
+        cut = cut[:breaks[-1]]
+    return cut.rstrip() + "…"
+
+def post_text_for(sent, text: str) -> str:
+    """النص المناسب لتعديل منشور: منشور يحمل وسائط يقبل تعليقًا حتى MEDIA_CAPTION_LIMIT فقط."""
+    return clip_caption(text) if getattr(sent, "media", None) is not None else text
+
+async def _send_with_media(target_channel, caption: str, media):
+    """
+    يرسل الوسائط بمراجعها الحالية مع التعليق ويعيد (الرسالة الأولى، هل حملت النص؟).
+    تعليق أطول من الحد: تُرسل الوسائط وحدها، ويرسل forward_or_send النص ردًا عليها كمهمة مستقلة في المسار.
+    تعذّر تمرير الوسائط (مرجع منتهٍ، قناة محمية): يُنشر النص وحده.
+    """
+    album = isinstance(media, list)
+    fits = caption_length(caption) <= MEDIA_CAPTION_LIMIT
+    try:
+        posted = await client.send_file(target_channel, media, caption=caption if fits else None)
+    except FloodWaitError:
+        raise
+    except RPCError as e:
+        metrics.inc("ecopulse_media_posts_total", result="text_only")
+        logging.warning("⚠️ تعذر تمرير الوسائط (%s) — نشر النص وحده", e, extra={"stage": "media"})
+        return await client.send_message(target_channel, caption, link_preview=False), True
+    first = posted[0] if album else posted
+    metrics.inc("ecopulse_media_posts_total", result=("album" if album else "single") if fits else "split")
+    return first, fits
 
 # ---------------- إرسال الرسائل ----------------
-async def forward_or_send(message, caption: str, task_name="", target_channel=None):
+async def forward_or_send(message, caption: str, task_name="", target_channel=None, media=None):
     if not caption or not caption.strip():
-        logging.debug(f"❌ تجاهل نشر رسالة فارغة ID={message.id}")
+        logging.debug("❌ تجاهل نشر رسالة فارغة ID=%s", message.id, extra={"message_id": message.id, "stage": "send"})
         return None
 
     if not target_channel:
         target_channel = TARGET_CHANNEL_ID
 
     if dry_run_mode:
-        logging.info(f"[🧪 DRY-RUN] {task_name}: {caption[:100]}...")
+        logging.info("[🧪 DRY-RUN] %s: %.100s...", task_name, caption, extra={"message_id": message.id, "stage": "send"})
         return type('obj', (), {'id': 999})()
 
-    text_signature = caption.strip()
-    if text_signature in posted_texts:
-        logging.info(f"❌ تم تجاهل الرسالة ID={message.id} لأنها مكررة")
+    if posted_texts.check_and_add(content_fingerprint(caption, str(target_channel))):
+        logging.info("❌ تم تجاهل الرسالة ID=%s لأنها مكررة", message.id, extra={"message_id": message.id, "stage": "send"})
         return
-    posted_texts.add(text_signature)
-    if len(posted_texts) > MAX_POSTED_HISTORY:
-        posted_texts.pop()
+    lane = outbox.lane_for(target_channel)
     try:
-        sent = await client.send_message(target_channel, caption, link_preview=False)
+        if media is not None:
+            sent, carried = await lane.submit(lambda: _send_with_media(target_channel, caption, media))
+            if not carried:
+                # الرد بالنص مهمة مستقلة بعد نشر الوسائط: FloodWait عليه يوقف المسار ويعيد المحاولة
+                # (SEND_MAX_FLOOD_RETRIES) دون إعادة إرسال الوسائط
+                media_post = sent
+                try:
+                    sent = await lane.submit(
+                        lambda: client.send_message(target_channel, caption, reply_to=media_post.id, link_preview=False)
+                    )
+                except Exception:
+                    logging.exception("Error while sending media caption")
+                    sent = media_post  # الوسائط نُشرت: تُتتبَّع بدل النص
+        else:
+            sent = await lane.submit(lambda: client.send_message(target_channel, caption, link_preview=False))
         log_activity(task_name, message.id)
         return sent
-    except FloodWaitError as fe:
-        stats["flood_waits"] += 1
-        logging.warning(f"⏳ Flood wait: الانتظار {fe.seconds} ثانية...")
-        await asyncio.sleep(fe.seconds + 1)
-        return await client.send_message(target_channel, caption, link_preview=False)
     except Exception:
         logging.exception("Error while sending message")
 
+# ---------------- النشر الفوري بالبث ----------------
+STREAM_CURSOR = " ▍"  # علامة تدل على أن المنشور ما زال يُكتب
+_SENTENCE_END_RE = re.compile(r"[.!?؟…\n]")
+
+def stream_ready(content: str) -> bool:
+    """سطر التأثير مكتمل (ظهر ###) وبعده جملة أولى مكتملة لا تقل عن STREAM_MIN_SENTENCE_CHARS."""
+    parts = content.split("###", 1)
+    if len(parts) < 2:
+        return False
+    return _SENTENCE_END_RE.search(parts[1].strip(), STREAM_MIN_SENTENCE_CHARS) is not None
+
+def submit_edit(target_channel, message_id: int, text: str) -> asyncio.Future:
+    """تعديل منشور عبر مسار وجهته (نفس التباعد ومعالجة FloodWait مثل الإرسال)."""
+    future = outbox.lane_for(target_channel).submit(
+        lambda: client.edit_message(target_channel, message_id, text, link_preview=False)
+    )
+    future.add_done_callback(_log_edit_failure)
+    return future
+
+def _log_edit_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        metrics.inc("ecopulse_stream_edits_total", result="error")
+        logging.warning("⚠️ فشل تعديل منشور البث: %s", future.exception(), extra={"stage": "stream"})
+
+async def stream_immediate_post(message, text: str, emoji: str, target_channel, received: float):
+    """
+    نشر فوري بالبث: يُنشر الخبر فور اكتمال سطر التأثير وأول جملة مفيدة،
+    ثم يُحدَّث المنشور بـ edit_message (تعديل واحد على الأكثر كل STREAM_EDIT_INTERVAL) حتى يكتمل النص.
+    الإصابة في ذاكرة الترجمة تُنشر مباشرة، والفشل قبل النشر يعود إلى المسار العادي.
+    """
+    if not is_meaningful_text(text):
+        logging.debug("🗑️ تم تجاهل نص غير ذي معنى في البث")
+        return None
+    signature = os.getenv("SIGNATURE", "— EcoPulse")
+    key = TranslationCache.make_key(PROMPT_TRANSLATE, text, OPENAI_MODEL)
+    cached = await llm_cache.get(key)
+    metrics.inc("ecopulse_llm_cache_total", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return await forward_or_send(message, compose_news_text(parse_impact_translation(cached, text), emoji, signature),
+                                     "نشر فوري", target_channel=target_channel)
+
+    content = ""
+    sent = None
+    edit = None
+    shown = ""
+    last_edit = 0.0
+    started = time.monotonic()
+    try:
+        async with contextlib.aclosing(openai_manager.stream(PROMPT_TRANSLATE, text, stage="نشر فوري (بث)")) as chunks:
+            async for chunk in chunks:
+                content += chunk
+                if sent is None:
+                    if not stream_ready(content):
+                        continue
+                    shown = compose_news_text(parse_impact_translation(content + STREAM_CURSOR, text), emoji, signature)
+                    sent = await forward_or_send(message, shown, "نشر فوري (بث)", target_channel=target_channel)
+                    if not sent:
+                        return None
+                    last_edit = time.monotonic()
+                    metrics.observe(METRIC_STAGE_SECONDS, last_edit - received, stage="first_visible", path="immediate")
+                    logging.info("📣 أول ظهور للمنشور بعد %.2f ثانية (البث مستمر) ID=%s", last_edit - received,
+                                 message.id, extra={"message_id": message.id, "stage": "stream"})
+                    continue
+                if dry_run_mode or (edit is not None and not edit.done()):
+                    continue
+                if time.monotonic() - last_edit < STREAM_EDIT_INTERVAL:
+                    continue
+                body = compose_news_text(parse_impact_translation(content + STREAM_CURSOR, text), emoji, signature)
+                if body != shown:
+                    edit = submit_edit(target_channel, sent.id, body)
+                    shown, last_edit = body, time.monotonic()
+                    metrics.inc("ecopulse_stream_edits_total", result="partial")
+    except Exception as e:
+        logging.warning("⚠️ انقطع البث ID=%s: %s", message.id, str(e)[:100], extra={"message_id": message.id, "stage": "stream"})
+        if sent is None:
+            final_text = await format_final_text(text, emoji, category=CATEGORY_KEYWORD)
+            return await forward_or_send(message, final_text, "نشر فوري", target_channel=target_channel)
+        # نُشر جزء من النص: إكمال المنشور من طلب عادي (بإعادة المحاولة) بدل تركه مبتورًا
+        final_text = compose_news_text(await analyze_and_translate(text, "ar"), emoji, signature)
+    else:
+        content = content.strip()
+        if content:
+            llm_cache.put(key, content)
+        final_text = compose_news_text(parse_impact_translation(content, text), emoji, signature)
+        if sent is None:
+            # اكتمل النص قبل أن تظهر جملة أولى (رد قصير): نشر عادي
+            return await forward_or_send(message, final_text, "نشر فوري", target_channel=target_channel)
+
+    generated = time.monotonic() - started
+    if not dry_run_mode and final_text != shown:
+        if edit is not None:
+            await asyncio.gather(edit, return_exceptions=True)
+        delay = last_edit + STREAM_EDIT_INTERVAL - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await asyncio.gather(submit_edit(target_channel, sent.id, final_text), return_exceptions=True)
+        metrics.inc("ecopulse_stream_edits_total", result="final")
+    posted_texts.check_and_add(content_fingerprint(final_text, str(target_channel)))
+    logging.info("✅ اكتمل منشور البث ID=%s: التوليد %.2f ثانية | الإجمالي %.2f ثانية", message.id, generated,
+                 time.monotonic() - received, extra={"message_id": message.id, "stage": "stream"})
+    return sent
+
+# ---------------- مهل زمن الاستجابة (SLO) ----------------
+background_tasks = set()  # مهام الخلفية الجارية (مرجع يمنع جمعها قبل انتهائها)
+
+def spawn_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def _after_breaker(produce, max_age: float = SLO_BACKFILL_MAX_AGE) -> str:
+    """ينتظر إغلاق قاطع LLM ثم ينفذ التنسيق؛ يعيد "" إن طال الفتح أكثر من max_age."""
+    give_up = time.monotonic() + max_age
+    while llm_breaker.is_open:
+        remaining = give_up - time.monotonic()
+        if remaining <= 0:
+            return ""
+        await asyncio.sleep(min(5.0, remaining, max(0.5, llm_breaker.open_until - time.monotonic())))
+    return await produce()
+
+async def await_within_slo(path: str, produce, fallback: str, started: float = None, task: asyncio.Task = None):
+    """
+    ينتظر نص LLM حتى مهلة المسار (من started). يعيد (النص، مهمة متأخرة):
+    المهمة المتأخرة = None إن وصل النص في وقته، وإلا يعاد البديل ومهمةٌ تُمرَّر إلى backfill_posts بعد النشر.
+    produce: دالة بلا معاملات تعيد coroutine للنص؛ task: مهمة بدأت مسبقًا (تنسيق استباقي).
+    """
+    if llm_breaker.is_open:
+        if task is not None:
+            task.cancel()
+        metrics.inc("ecopulse_slo_total", path=path, result="breaker")
+        return fallback, spawn_background(_after_breaker(produce))
+    if task is None:
+        task = asyncio.ensure_future(produce())
+    started = started if started is not None else time.monotonic()
+    remaining = SLO_DEADLINES.get(path, LLM_REQUEST_TIMEOUT) - (time.monotonic() - started)
+    try:
+        result = await asyncio.wait_for(asyncio.shield(task), timeout=max(0.0, remaining))
+    except asyncio.TimeoutError:
+        metrics.inc("ecopulse_slo_total", path=path, result="deadline")
+        logging.warning("⏰ تجاوز مهلة المسار %s (%.0fث) — نشر البديل المحلي والاستبدال لاحقًا", path, SLO_DEADLINES.get(path, 0), extra={"stage": "slo"})
+        return fallback, task
+    except Exception as e:
+        metrics.inc("ecopulse_slo_total", path=path, result="error")
+        logging.warning("⚠️ فشل التنسيق في المسار %s: %s", path, str(e)[:100], extra={"stage": "slo"})
+        return fallback, None
+    metrics.inc("ecopulse_slo_total", path=path, result="ok")
+    return result, None
+
+async def backfill_posts(path: str, late: asyncio.Task, posts: list, fallback: str, started: float):
+    """يستبدل المنشورات البديلة [(القناة، المنشور)] بنص LLM حين يصل."""
+    try:
+        final_text = await late
+    except Exception as e:
+        logging.warning("⚠️ تعذر استبدال المنشور البديل (%s): %s", path, str(e)[:100], extra={"stage": "slo"})
+        return
+    if not final_text or final_text == fallback or dry_run_mode:
+        metrics.inc("ecopulse_slo_backfill_total", path=path, result="skipped")
+        return
+    await asyncio.gather(
+        *(submit_edit(target, sent.id, post_text_for(sent, final_text)) for target, sent in posts), return_exceptions=True
+    )
+    for target, _ in posts:
+        posted_texts.check_and_add(content_fingerprint(final_text, str(target)))
+    metrics.inc("ecopulse_slo_backfill_total", path=path, result="edited")
+    metrics.observe(METRIC_STAGE_SECONDS, time.monotonic() - started, stage="backfill", path=path)
+    logging.info("🔁 استُبدل المنشور البديل (%s) بعد %.1f ثانية", path, time.monotonic() - started, extra={"stage": "slo"})
+
+async def publish_within_slo(path: str, message, produce, fallback: str, task_name: str, target_channel,
+                             started: float = None, task: asyncio.Task = None, media=None):
+    """نشر برسالة واحدة تحت مهلة المسار: النص في وقته أو البديل فورًا مع استبداله لاحقًا."""
+    started = started if started is not None else time.monotonic()
+    final_text, late = await await_within_slo(path, produce, fallback, started, task)
+    sent = await forward_or_send(message, final_text, task_name, target_channel=target_channel, media=media)
+    if late is not None:
+        if sent:
+            spawn_background(backfill_posts(path, late, [(target_channel, sent)], fallback, started))
+        else:
+            late.cancel()  # لا منشور يُستبدل (مكرر، نص فارغ، وضع تجريبي): لا تبقى مهمة LLM يتيمة
+    return sent
+
+# ---------------- تعليق البيانات الاقتصادية ----------------
+
+async def annotate_release(sent, target_channel, text: str, release):
+    """يضيف تعليق LLM قصيرًا إلى منشور بيانات نُسّق محليًا، عبر تعديل المنشور بعد نشره."""
+    try:
+        note = await cached_complete(PROMPT_ECONOMIC_NOTE, text, stage="تعليق اقتصادي")
+    except Exception as e:
+        logging.warning("⚠️ تعذر تعليق البيان ID=%s: %s", sent.id, str(e)[:100], extra={"stage": "llm"})
+        return
+    note = note.strip().split("\n", 1)[0].strip() if note else ""
+    if not note:
+        return
+    signature = os.getenv("SIGNATURE", "— EcoPulse")
+    final_text = f"{render_release(release, note)}\n\n{signature}\n\n{CHANNEL_WATERMARK}"[:4000]
+    await asyncio.gather(submit_edit(target_channel, sent.id, post_text_for(sent, final_text)), return_exceptions=True)
+    posted_texts.check_and_add(content_fingerprint(final_text, str(target_channel)))
+
 # ---------------- معالجة التحكم (مرتبطة بقناة التحكم الثابتة) ----------------
-@client.on(events.NewMessage(chats=[]))  # سيتم ربطها في main()
 async def control_handler(event):
     global bot_active, publish_immediate, publish_economic, publish_analysis, publish_scheduled, publish_hourly, dry_run_mode
     
+    note_first_message("control")
     raw_text = event.raw_text.strip()
     if not raw_text:
         raw_text = "مساعدة"
@@ -434,73 +2652,80 @@ async def control_handler(event):
     if "تفعيل" in text:
         bot_active = True
         logging.info("✅ تم تفعيل البوت كاملاً.")
-        await event.reply("✅ تم تفعيل البوت كاملاً.")
+        await control_reply(event, "✅ تم تفعيل البوت كاملاً.")
     
     elif "ايقاف" in text:
         bot_active = False
         logging.info("⛔ تم إيقاف البوت كاملاً.")
-        await event.reply("⛔ تم إيقاف البوت كاملاً.")
+        await control_reply(event, "⛔ تم إيقاف البوت كاملاً.")
     
     # === التحكم الجزئي ===
     elif "نشر فوري on" in text:
         publish_immediate = True
         logging.info("✅ تم تفعيل النشر الفوري (غير الاقتصادي).")
-        await event.reply("✅ تم تفعيل النشر الفوري (غير الاقتصادي).")
+        await control_reply(event, "✅ تم تفعيل النشر الفوري (غير الاقتصادي).")
     
     elif "نشر فوري off" in text:
         publish_immediate = False
         logging.info("⛔ تم إيقاف النشر الفوري (غير الاقتصادي).")
-        await event.reply("⛔ تم إيقاف النشر الفوري (غير الاقتصادي).")
+        await control_reply(event, "⛔ تم إيقاف النشر الفوري (غير الاقتصادي).")
     
     elif "اقتصادي on" in text:
         publish_economic = True
         logging.info("✅ تم تفعيل معالجة البيانات الاقتصادية.")
-        await event.reply("✅ تم تفعيل معالجة البيانات الاقتصادية.")
+        await control_reply(event, "✅ تم تفعيل معالجة البيانات الاقتصادية.")
     
     elif "اقتصادي off" in text:
         publish_economic = False
         logging.info("⛔ تم إيقاف معالجة البيانات الاقتصادية.")
-        await event.reply("⛔ تم إيقاف معالجة البيانات الاقتصادية.")
+        await control_reply(event, "⛔ تم إيقاف معالجة البيانات الاقتصادية.")
     
     elif "تحليل on" in text:
         publish_analysis = True
         logging.info("✅ تم تفعيل قناة التحليل.")
-        await event.reply("✅ تم تفعيل قناة التحليل.")
+        await control_reply(event, "✅ تم تفعيل قناة التحليل.")
     
     elif "تحليل off" in text:
         publish_analysis = False
         logging.info("⛔ تم إيقاف قناة التحليل.")
-        await event.reply("⛔ تم إيقاف قناة التحليل.")
+        await control_reply(event, "⛔ تم إيقاف قناة التحليل.")
     
     elif "مجدول on" in text:
         publish_scheduled = True
         logging.info("✅ تم تفعيل الناشر المجدول.")
-        await event.reply("✅ تم تفعيل الناشر المجدول.")
+        await control_reply(event, "✅ تم تفعيل الناشر المجدول.")
     
     elif "مجدول off" in text:
         publish_scheduled = False
         logging.info("⛔ تم إيقاف الناشر المجدول.")
-        await event.reply("⛔ تم إيقاف الناشر المجدول.")
+        await control_reply(event, "⛔ تم إيقاف الناشر المجدول.")
     
     # === التحكم بموجز الساعة ===
     elif "موجز on" in text:
         publish_hourly = True
         logging.info("✅ تم تفعيل موجز الساعة.")
-        await event.reply("✅ تم تفعيل موجز الساعة.")
+        await control_reply(event, "✅ تم تفعيل موجز الساعة.")
     
     elif "موجز off" in text:
         publish_hourly = False
         logging.info("⛔ تم إيقاف موجز الساعة.")
-        await event.reply("⛔ تم إيقاف موجز الساعة.")
+        await control_reply(event, "⛔ تم إيقاف موجز الساعة.")
     
     elif "موجز الآن" in text:
         if not publish_hourly:
-            await event.reply("⚠️ موجز الساعة معطّل حاليًا. أرسل `موجز on` أولًا.")
+            await control_reply(event, "⚠️ موجز الساعة معطّل حاليًا. أرسل `موجز on` أولًا.")
+        elif BOT_ROLE == "ingest":
+            # مكدس الموجز في الناشر: يُرسل إليه الطلب بدل توليد موجز من مكدس هذه العملية الفارغ
+            job_store.put_command(COMMAND_HOURLY_NOW)
+            await control_reply(event, "📨 تم تحويل طلب موجز الساعة إلى الناشر.")
         else:
             await generate_hourly_summary(manual=True)
-            await event.reply("✅ تم طلب إنشاء موجز الساعة يدويًا.")
+            await control_reply(event, "✅ تم طلب إنشاء موجز الساعة يدويًا.")
 
     # === المراقبة ===
+    elif "حالة" in text and BOT_ROLE == "ingest":
+        await control_reply(event, jobs_status_report())
+
     elif "حالة" in text:
         status = (
             f"📊 **حالة البوت**\n"
@@ -510,31 +2735,70 @@ async def control_handler(event):
             f"- تحليل: {'✅' if publish_analysis else '⛔'}\n"
             f"- مجدول: {'✅' if publish_scheduled else '⛔'}\n"
             f"- موجز ساعة: {'✅' if publish_hourly else '⛔'}\n"  # ← جديد
-            f"- مكدس عادي: {len(translation_queue)}\n"
+            f"- مكدس عادي: {len(translation_queue)} ({translation_queue.describe()})\n"
             f"- مكدس ساعة: {len(hourly_queue)}\n"
-            f"- وضع تجربة: {'🧪' if dry_run_mode else '🚀'}"
+            f"- مكررات محجوبة: {source_fingerprints.duplicates}\n"
+            f"- وضع تجربة: {'🧪' if dry_run_mode else '🚀'}\n"
+            f"- مسارات الإرسال:\n{outbox.describe()}"
         )
-        await event.reply(status)
-    
-    elif "مفاتيح" in text:
-        status = openai_manager.get_status()
-        await event.reply(f"🔧 **حالة مفاتيح OpenAI**\n\n{status}")
+        await control_reply(event, status)
     
-    elif "مكدس" in text:
-        count1 = len(translation_queue)
-        count2 = len(hourly_queue)
-        msg = f"📥 **المكدس العادي**: {count1} رسالة\n"
+    elif "قياسات" in text:
+        await control_reply(event, f"⏱️ **زمن المراحل (p50 / p95 / p99)**{ingest_only_note()}\n\n{metrics.percentiles_report()}")
+
+    elif "ذاكرة تتبع off" in text:
+        if memory_budget.stop_tracing():
+            await control_reply(event, "🧠 تم إيقاف tracemalloc.")
+        else:
+            await control_reply(event, "🧠 tracemalloc لم يبدأ بأمر (مفعّل من الإقلاع أو معطّل) — لم يتغير شيء.")
+
+    elif "ذاكرة تتبع" in text:
+        if not tracemalloc.is_tracing():
+            memory_budget.start_tracing()
+            await control_reply(event, "🧠 بدأ tracemalloc — أرسل `ذاكرة تتبع` مجددًا لعرض أكبر مواضع النمو منذ الآن.")
+        else:
+            await control_reply(event, f"🧠 **أكبر {TRACEMALLOC_TOP} مواضع تخصيص**\n\n{memory_budget.trace_report()}")
+
+    elif "ذاكرة" in text:
+        await control_reply(event, f"🧠 **الذاكرة**{ingest_only_note()}\n{memory_budget.report()}")
+
+    elif "مفاتيح" in text and BOT_ROLE == "ingest":
+        await control_reply(
+            event,
+            f"🔧 **حالة مفاتيح OpenAI**\n\nالمفاتيح وقاطع LLM تعمل في عمليات العمال لا في عملية الاستقبال."
+            f"{ingest_only_note()}"
+        )
+
+    elif "مفاتيح" in text:
+        status = f"{openai_manager.get_status()}\n{llm_breaker.describe()}"
+        if LLM_BATCH_ENABLED:
+            status += f"\n📦 دفعات الترجمة: {translation_batcher.batches} | أُعيدت فرديًا: {translation_batcher.retried}"
+        await control_reply(event, f"🔧 **حالة مفاتيح OpenAI**\n\n{status}")
+    
+    elif "مكدس" in text and BOT_ROLE == "ingest":
+        await control_reply(event, jobs_queue_report())
+
+    elif "مكدس" in text:
+        count1 = len(translation_queue)
+        count2 = len(hourly_queue)
+        msg = f"📥 **المكدس العادي**: {count1}/{translation_queue.capacity} رسالة\n"
+        for name in translation_queue.classes:
+            msg += (
+                f"   • {QUEUE_CLASS_LABELS.get(name, name)}: {translation_queue.depth(name)} "
+                f"| متخلّص منه: {translation_queue.shed[name]} | منتهي: {translation_queue.expired[name]}\n"
+            )
         msg += f"🕗 **مكدس موجز الساعة**: {count2} رسالة\n\n"
         if count1 > 0:
-            preview1 = "\n".join([f"{i+1}. {item[0].message.message[:30]}..." for i, item in enumerate(list(translation_queue)[:3])])
+            preview1 = "\n".join([f"{i+1}. {item.text[:30]}..." for i, item in enumerate(itertools.islice(translation_queue, 3))])
             msg += f"**العادي**:\n{preview1}\n\n"
         if count2 > 0:
-            preview2 = "\n".join([f"{i+1}. {msg[:30]}..." for i, msg in enumerate(list(hourly_queue)[-3:])])
+            preview2 = "\n".join([f"{i+1}. {record.text[:30]}..." for i, record in enumerate(list(hourly_queue)[-3:])])
             msg += f"**موجز الساعة**:\n{preview2}"
-        await event.reply(msg)
+        await control_reply(event, msg)
     
     elif "إحصاء" in text:
-        await event.reply(
+        await control_reply(
+            event,
             f"📈 **إحصاءات النشر**\n"
             f"- المجموع: {stats['posts']}\n"
             f"- اقتصادي: {stats['economic']}\n"
@@ -542,42 +2806,54 @@ async def control_handler(event):
             f"- مجدول: {stats['scheduled']}\n"
             f"- تحليل: {stats['analysis']}\n"
             f"- موجز ساعة: {stats['hourly']}\n"  # ← جديد
-            f"- تجميد: {stats['flood_waits']}"
+            f"- تجميد: {stats['flood_waits']}\n"
+            f"- {llm_cache.get_status()}"
         )
     
+    elif "تحديث المسارات" in text:
+        if await routing_table.reload():
+            await control_reply(event, f"🧭 تم تحديث المسارات ({routing_table.loaded_from}):\n{routing_table.describe()}")
+        else:
+            await control_reply(event, "⚠️ تعذر تحديث المسارات — راجع السجل. الجدول الحالي باقٍ.")
+
     elif "قنوات" in text:
-        await event.reply(
+        await control_reply(
+            event,
             f"📡 **القنوات الحالية**\n"
-            f"- المصدر 1: `{SOURCE_CHANNEL_ID}`\n"
-            f"- المصدر 2: `{SOURCE_CHANNEL_2_ID}`\n"
-            f"- الهدف: `{TARGET_CHANNEL_ID}`\n"
-            f"- تحليل: `{ANALYST_TARGET_ID or 'غير مفعل'}`\n"
-            f"- موجز مصدر: `{HOURLY_SOURCE_ID or 'غير مفعل'}`\n"
+            f"- الهدف الافتراضي: `{TARGET_CHANNEL_ID}`\n"
             f"- موجز هدف: `{HOURLY_TARGET_ID or 'غير مفعل'}`\n"
-            f"- التحكم: `{CONTROL_CHANNEL_ID}`"
+            f"- التحكم: `{CONTROL_CHANNEL_ID}`\n"
+            f"🧭 **المسارات** ({routing_table.loaded_from}):\n{routing_table.describe()}"
         )
     
     # === الصيانة ===
+    elif "مسح المخزن" in text and BOT_ROLE == "ingest":
+        cleared = job_store.clear_queued()
+        job_store.put_command(COMMAND_CLEAR_HOURLY)
+        await control_reply(event, f"🧹 تم مسح {cleared} مهمة من الطابور، وطُلب من الناشر مسح مكدس موجز الساعة.")
+
     elif "مسح المخزن" in text:
         count1 = len(translation_queue)
         count2 = len(hourly_queue)
         translation_queue.clear()
         hourly_queue.clear()
-        await event.reply(f"🧹 تم مسح {count1 + count2} رسالة من المكدسين.")
+        reset_hourly_digest()
+        await control_reply(event, f"🧹 تم مسح {count1 + count2} رسالة من المكدسين.")
     
     elif "إعادة تعيين" in text:
-        before = len(posted_texts)
+        before = len(posted_texts) + len(source_fingerprints)
         posted_texts.clear()
-        await event.reply(f"♻️ تم مسح {before} سجل مؤقت.")
+        source_fingerprints.clear()
+        await control_reply(event, f"♻️ تم مسح {before} سجل مؤقت.")
     
     elif "وضع تجربة on" in text:
         dry_run_mode = True
         logging.info("🧪 تم تفعيل وضع التجربة.")
-        await event.reply("🧪 تم تفعيل وضع التجربة (لن يُنشر فعليًا).")
+        await control_reply(event, "🧪 تم تفعيل وضع التجربة (لن يُنشر فعليًا).")
     elif "وضع تجربة off" in text:
         dry_run_mode = False
         logging.info("🚀 تم إيقاف وضع التجربة.")
-        await event.reply("🚀 تم إيقاف وضع التجربة (النشر الفعلي نشط).")
+        await control_reply(event, "🚀 تم إيقاف وضع التجربة (النشر الفعلي نشط).")
     
     # === عرض المساعدة الكاملة ===
     elif "مساعدة" in text:
@@ -598,7 +2874,11 @@ async def control_handler(event):
             "مفاتيح\n"
             "مكدس\n"
             "إحصاء\n"
-            "قنوات\n\n"
+            "قياسات\n"
+            "ذاكرة\n"
+            "ذاكرة تتبع / ذاكرة تتبع off\n"
+            "قنوات\n"
+            "تحديث المسارات\n\n"
             "# الصيانة\n"
             "مسح المخزن\n"
             "إعادة تعيين\n"
@@ -606,7 +2886,7 @@ async def control_handler(event):
             "```\n"
             "💡 جميع الأوامر تعمل في قناة التحكم فقط."
         )
-        await event.reply(help_msg)
+        await control_reply(event, help_msg)
 
     # === المساعدة التلقائية ===
     else:
@@ -622,56 +2902,145 @@ async def control_handler(event):
             "• `موجز الآن`\n\n"
             "📌 أرسل **مساعدة** لعرض جميع الأوامر بالتفصيل."
         )
-        await event.reply(quick_help)
+        await control_reply(event, quick_help)
 
 # ---------------- معالجة المصادر ----------------
-async def handle_source(event, emoji):
-    global bot_active, last_immediate_post_id, last_immediate_post_time, publish_immediate, publish_economic
+async def handle_source(event, route: Route):
+    global bot_active, publish_immediate, publish_economic
     
+    note_first_message("source")
     if not bot_active:
         return
     message = event.message
     if message.action:
         return
+    received = time.monotonic()
+    if message.date:
+        delay = (datetime.now(message.date.tzinfo) - message.date).total_seconds()
+        metrics.observe(METRIC_STAGE_SECONDS, max(0.0, delay), stage="receive")
     text = message.message or ""
     cleaned = clean_text(text)
+    emoji, target = route.emoji, route.target
+    media, media_ids = event_media(event)
+    with metrics.timer("dedup"):
+        fingerprint = content_fingerprint(cleaned, f"news:{target}") if cleaned else None
+        duplicate = fingerprint is not None and source_fingerprints.seen(fingerprint)
+    if duplicate:
+        metrics.inc("ecopulse_duplicates_total", scope="news")
+        logging.info("♻️ تم تجاهل خبر مكرر من المصدر ID=%s", message.id, extra={"message_id": message.id, "stage": "dedup"})
+        return
     
+    with metrics.timer("classify"):
+        category = classify_message(cleaned).category
+    metrics.inc("ecopulse_messages_total", category=category)
+    # البصمة تُسجَّل لما سيُعالج فقط: خبر أُسقط ومساره متوقف لا يُحجب كمكرر بعد إعادة تشغيله
+    if fingerprint is not None and (category != CATEGORY_ECONOMIC or publish_economic):
+        source_fingerprints.add(fingerprint)
+
     # ✅ 1. البيانات الاقتصادية
-    if publish_economic and is_economic_data(cleaned):
-        final_text = await format_final_text(cleaned, emoji)
-        sent = await forward_or_send(message, final_text, "نشر فوري (اقتصادي)")
+    if category == CATEGORY_ECONOMIC:
+        # 🚫 بيانات اقتصادية لكن النشر الاقتصادي متوقف
+        if not publish_economic:
+            logging.info("🚫 تم تجاهل بيانات اقتصادية ID=%s", message.id, extra={"message_id": message.id, "stage": "classify"})
+            return
+        release = parse_release(cleaned) if ECONOMIC_LOCAL_FORMAT else None
+        if release is not None:
+            final_text = await format_final_text(cleaned, emoji, category=category)
+            sent = await forward_or_send(message, final_text, "نشر فوري (اقتصادي)", target_channel=target, media=media)
+        else:
+            sent = await publish_within_slo(
+                "economic", message, lambda: format_final_text(cleaned, emoji, category=category),
+                fallback_text(cleaned, emoji, category, pending=True), "نشر فوري (اقتصادي)", target, started=received, media=media
+            )
         if sent:
-            last_immediate_post_id = sent.id
-            last_immediate_post_time = datetime.now()
-        return
-    
-    # 🚫 بيانات اقتصادية لكن النشر الاقتصادي متوقف
-    if not publish_economic and is_economic_data(cleaned):
-        logging.info(f"🚫 تم تجاهل بيانات اقتصادية ID={message.id}")
+            note_immediate_post(sent, target)
+            metrics.observe(METRIC_STAGE_SECONDS, time.monotonic() - received, stage="e2e", path="economic")
+            if ECONOMIC_LLM_NOTE and release is not None and not dry_run_mode:
+                spawn_background(annotate_release(sent, target, cleaned, release))
         return
 
     # ✅ 2. النشر الفوري العادي
-    text_lower = cleaned.lower()
-    if publish_immediate and any(keyword.lower() in text_lower for keyword in KEYWORDS_LIST):
-        can_publish = await can_publish_immediate()
-        if can_publish:
-            final_text = await format_final_text(cleaned, emoji)
-            sent = await forward_or_send(message, final_text, "نشر فوري")
+    if publish_immediate and category in (CATEGORY_MACRO, CATEGORY_KEYWORD):
+        # منشور الوسائط لا يُبث: تعديلات البث قد تتجاوز حد التعليق
+        streaming = LLM_STREAM_ENABLED and category == CATEGORY_KEYWORD and media is None
+        # التنسيق يبدأ قبل قرار البوابة: النشر الفوري لا ينتظرهما على التوالي،
+        # والتأجيل يُرفق النتيجة بعنصر المكدس فلا يترجمه publisher() من جديد (لا تنسيق مسبق والقاطع مفتوح)
+        speculate = not streaming and not llm_breaker.is_open
+        formatting = asyncio.create_task(format_final_text(cleaned, emoji, category=category)) if speculate else None
+        if route.gate == GATE_NONE or can_publish_immediate(target):
+            metrics.inc("ecopulse_gate_decisions_total", gate="immediate", result="publish")
+            if streaming and not llm_breaker.is_open:
+                sent = await stream_immediate_post(message, cleaned, emoji, target, received)
+            else:
+                if formatting is not None:
+                    metrics.inc("ecopulse_speculative_total", result="published")
+                sent = await publish_within_slo(
+                    "immediate", message, lambda: format_final_text(cleaned, emoji, category=category),
+                    fallback_text(cleaned, emoji, category, pending=True), "نشر فوري", target, started=received, task=formatting,
+                    media=media
+                )
             if sent:
-                last_immediate_post_id = sent.id
-                last_immediate_post_time = datetime.now()
+                note_immediate_post(sent, target)
+                metrics.observe(METRIC_STAGE_SECONDS, time.monotonic() - received, stage="e2e", path="immediate")
         else:
-            translation_queue.append((event, emoji, None, None))
-            logging.info(f"⏳ تأجيل (لا تحقق شروط الفوري) ID={message.id}")
+            metrics.inc("ecopulse_gate_decisions_total", gate="immediate", result="defer")
+            record = enqueue_translation(event.chat_id, message.id, cleaned, emoji, QUEUE_CLASS_DEFERRED, media_ids)
+            if record is None:
+                if formatting is not None:
+                    formatting.cancel()
+                    metrics.inc("ecopulse_speculative_total", result="cancelled")
+            else:
+                if formatting is None and not llm_breaker.is_open:
+                    formatting = asyncio.create_task(_format_queue_item(record))
+                if formatting is not None:
+                    prefetched_texts[_queue_item_key(record)] = formatting
+                    metrics.inc("ecopulse_speculative_total", result="deferred")
+            logging.info("⏳ تأجيل (لا تحقق شروط الفوري) ID=%s", message.id, extra={"message_id": message.id, "stage": "gate"})
         return
 
     # ✅ 3. الباقي
-    translation_queue.append((event, emoji, None, None))
-    logging.info(f"📥 أُضيفت الرسالة ID={message.id} للمكدس")
+    enqueue_translation(event.chat_id, message.id, cleaned, emoji, QUEUE_CLASS_NORMAL, media_ids)
+    logging.info("📥 أُضيفت الرسالة ID=%s للمكدس", message.id, extra={"message_id": message.id, "stage": "queue"})
+
+def enqueue_translation(chat_id, message_id, cleaned, emoji, queue_class, media_ids=()):
+    """إضافة سجل مضغوط إلى مكدس الترجمة مع تطبيق سياسة التخلّص عند الامتلاء.
+    يعيد السجل إن بقي في المكدس، وNone إن كان هو نفسه ما تُخلّص منه."""
+    record = QueueRecord(chat_id, message_id, cleaned, emoji, time.time(), queue_class, media_ids)
+    shed = translation_queue.append(record, queue_class)
+    for dropped in shed:
+        dispose_shed(dropped)
+    return None if record in shed else record
+
+def dispose_shed(dropped: QueueRecord, reason: str = "المكدس ممتلئ"):
+    """تطبيق QUEUE_SHED_POLICY على عنصر تُخلّص منه (امتلاء السعة أو ميزانية الذاكرة)."""
+    if QUEUE_SHED_POLICY == "digest" and publish_hourly and HOURLY_TARGET_ID:
+        if is_meaningful_text(dropped.text):
+            add_hourly_record(QueueRecord(dropped.chat_id, dropped.message_id, dropped.text, EMOJI_HOURLY))
+        logging.info("🗜️ %s — دُمجت الرسالة ID=%s في موجز الساعة", reason, dropped.message_id, extra={"message_id": dropped.message_id, "stage": "queue"})
+    else:
+        logging.info("🗑️ %s — أُسقطت الرسالة ID=%s", reason, dropped.message_id, extra={"message_id": dropped.message_id, "stage": "queue"})
+
+def restore_queues():
+    """استعادة المكدسات من التخزين الدائم عند التشغيل."""
+    started = time.perf_counter()
+    restored = 0
+    for record in queue_store.load(translation_queue.name):
+        queue_class = record.priority if record.priority in translation_queue.classes else QUEUE_CLASS_NORMAL
+        translation_queue.append(record, queue_class, enqueued_at=record.enqueued_at, persist=False)
+        restored += 1
+    for record in queue_store.load(hourly_queue.name):
+        add_hourly_record(record, persist=False)
+        restored += 1
+    queue_store.flush()
+    logging.info(
+        "💾 استعادة المكدسات: %s سجل في %.0f ms (عادي: %s | ساعة: %s)",
+        restored, (time.perf_counter() - started) * 1000, len(translation_queue), len(hourly_queue)
+    )
 
 # ---------------- معالجة مصدر موجز الساعة ----------------
-async def handle_hourly_source(event):
+async def handle_hourly_source(event, route: Route = None):
     global bot_active, publish_hourly
+    note_first_message("hourly")
     if not bot_active or not publish_hourly:
         return
     message = event.message
@@ -680,17 +3049,31 @@ async def handle_hourly_source(event):
     text = message.message or ""
     cleaned = clean_text(text)
     if is_meaningful_text(cleaned):
-        hourly_queue.append(cleaned)
-        logging.info(f"🕗 أُضيفت رسالة إلى مكدس موجز الساعة ID={message.id}")
+        if is_duplicate_source(cleaned, scope="hourly") and hourly_digest.repeat(cleaned):
+            metrics.inc("ecopulse_duplicates_total", scope="hourly")
+            logging.info("♻️ تم تجاهل خبر مكرر في موجز الساعة ID=%s", message.id, extra={"message_id": message.id, "stage": "dedup"})
+            return
+        remember_source(cleaned, scope="hourly")
+        add_hourly_record(QueueRecord(event.chat_id, message.id, cleaned, EMOJI_HOURLY))
+        logging.info("🕗 أُضيفت رسالة إلى مكدس موجز الساعة ID=%s", message.id, extra={"message_id": message.id, "stage": "queue"})
 
 # ---------------- القناة التحليلية ----------------
 ANALYST_POST_INTERVAL = 900
-analyst_last_post_time = 0
+analyst_last_post_time = {}  # قناة الهدف -> وقت آخر تحليل
 
-async def analyst_handler(event):
-    global bot_active, analyst_last_post_time, publish_analysis
+async def format_analysis(text: str, emoji: str) -> str:
+    result = await analyze_and_translate(text, "ar")
+    return compose_analysis(result["translation"], emoji)
+
+def compose_analysis(translation: str, emoji: str) -> str:
+    signature = os.getenv("ANALYST_SIGNATURE", "— تحليل")
+    return f"{emoji} {translation}\n\n{signature}\n\n{CHANNEL_WATERMARK}"
+
+async def analyst_handler(event, route: Route):
+    global bot_active, publish_analysis
     
-    if not bot_active or not publish_analysis or not ANALYST_TARGET_ID:
+    note_first_message("analyst")
+    if not bot_active or not publish_analysis or not route.target:
         return
 
     message = event.message
@@ -698,22 +3081,234 @@ async def analyst_handler(event):
         return
 
     current_time = datetime.now().timestamp()
-    if current_time - analyst_last_post_time < ANALYST_POST_INTERVAL:
+    if current_time - analyst_last_post_time.get(route.target, 0) < ANALYST_POST_INTERVAL:
         return
 
     text = message.message or ""
     cleaned = clean_text(text)
-    result = await analyze_and_translate(cleaned, "ar")
-    signature = os.getenv("ANALYST_SIGNATURE", "— تحليل")
-    final_text = f"{EMOJI_ALERT} {result['translation']}\n\n{signature}\n\n{CHANNEL_WATERMARK}"
-    sent = await forward_or_send(message, final_text, "نشر تحليل", target_channel=ANALYST_TARGET_ID)
+    if cleaned and is_duplicate_analysis(cleaned, route.target):
+        logging.info("♻️ تم تجاهل تحليل مكرر ID=%s", message.id, extra={"message_id": message.id, "stage": "dedup"})
+        return
+    if cleaned:
+        remember_source(cleaned, scope=f"news:{route.target}")
+    sent = await publish_within_slo(
+        "analyst", message, lambda: format_analysis(cleaned, route.emoji),
+        compose_analysis(cleaned, route.emoji), "نشر تحليل", route.target
+    )
     
     if sent:
-        analyst_last_post_time = current_time
+        analyst_last_post_time[route.target] = current_time
+
+# ---------------- الموزّع ----------------
+ROUTE_HANDLERS = {
+    PIPELINE_IMMEDIATE: handle_source,
+    PIPELINE_SCHEDULED: handle_source,
+    PIPELINE_ANALYST: analyst_handler,
+    PIPELINE_HOURLY: handle_hourly_source,
+}
+
+class AlbumEvent:
+    """حدث مركّب لألبوم: message = العنصر الذي يحمل النص، وalbum = كل العناصر بالترتيب."""
+
+    __slots__ = ("chat_id", "message", "album")
+
+    def __init__(self, events):
+        album = sorted((event.message for event in events), key=lambda msg: msg.id)
+        self.chat_id = events[0].chat_id
+        self.message = next((msg for msg in album if msg.message), album[0])
+        self.album = album
+
+class AlbumCollector:
+    """
+    عناصر الألبوم (نفس grouped_id) تصل كأحداث منفصلة متتالية: أول عنصر ينتظر ALBUM_WAIT
+    ثم يعالج المجموعة كلها حدثًا واحدًا، وباقي العناصر تنضم إليه وتنتهي فورًا.
+    """
+
+    def __init__(self, wait: float):
+        self.wait = wait
+        self._pending = {}  # (المحادثة، grouped_id) -> الأحداث
+
+    async def collect(self, event):
+        """يعيد AlbumEvent لأول عنصر بعد مهلة التجميع، وNone لباقي العناصر."""
+        key = (event.chat_id, event.message.grouped_id)
+        group = self._pending.get(key)
+        if group is not None:
+            group.append(event)
+            return None
+        self._pending[key] = [event]
+        await asyncio.sleep(self.wait)
+        return AlbumEvent(self._pending.pop(key))
+
+album_collector = AlbumCollector(ALBUM_WAIT)
+
+async def dispatch_message(event):
+    """معالج واحد لكل المصادر: بحث O(1) بمعرف المحادثة في جدول المسارات."""
+    routes = routing_table.routes.get(event.chat_id)
+    if not routes:
+        return
+    if MEDIA_PASSTHROUGH and getattr(event.message, "grouped_id", None):
+        event = await album_collector.collect(event)
+        if event is None:
+            return
+    if len(routes) == 1:
+        route = routes[0]
+        await ROUTE_HANDLERS[route.pipeline](event, route)
+        return
+    results = await asyncio.gather(
+        *(ROUTE_HANDLERS[route.pipeline](event, route) for route in routes),
+        return_exceptions=True
+    )
+    for route, result in zip(routes, results):
+        if isinstance(result, Exception):
+            logging.error(f"❌ فشل مسار {route.pipeline} → {route.target}: {result}")
+
+# ---------------- موجز الساعة التراكمي (map-reduce) ----------------
+HOURLY_CHUNK_TOKENS = int(os.getenv("HOURLY_CHUNK_TOKENS", "1500"))  # ميزانية رموز كل دفعة
+HOURLY_CLUSTER_THRESHOLD = float(os.getenv("HOURLY_CLUSTER_THRESHOLD", "0.6"))  # تشابه يجعل خبرين قصة واحدة (1 = تطابق فقط)
+
+class RollingHourlyDigest:
+    """
+    يقسم أخبار الساعة إلى دفعات بميزانية رموز، ويلخص كل دفعة بالتوازي
+    فور امتلائها (map)، ثم تُجمع الملخصات الجزئية عند الدقيقة 00 في طلب قصير (reduce).
+    النسخ شبه المكررة تُجمع عند وصولها في قصة واحدة (ممثل + عدد الذكر) فلا تُرسل إلا مرة،
+    والعدد يظهر في التعليمات كـ [×N]؛ تكرار يصل بعد ختم دفعة قصته يُحسب ولا يغيّرها.
+    """
+
+    def __init__(self, chunk_tokens: int, threshold: float = HOURLY_CLUSTER_THRESHOLD):
+        self.chunk_tokens = max(100, chunk_tokens)
+        self.index = NearDuplicateIndex(threshold)
+        self.clusters = []  # [نص الممثل، عدد الذكر، خُتمت دفعته؟]
+        self._buffer = []   # أرقام مجموعات الدفعة الحالية
+        self._buffer_tokens = 0
+        self._maps = []
+        self.mentions = 0
+        self.raw_tokens = 0    # رموز كل النسخ كما وصلت
+        self.input_tokens = 0  # رموز ما أُرسل فعلاً بعد التجميع
+
+    @property
+    def map_count(self) -> int:
+        return len(self._maps)
+
+    def add(self, text: str):
+        text = text[:self.chunk_tokens * 3]
+        tokens = estimate_tokens(text)
+        self.mentions += 1
+        self.raw_tokens += tokens
+        signature = minhash_signature(text)
+        cluster_id = self.index.match(signature)
+        if cluster_id is not None:
+            cluster = self.clusters[cluster_id]
+            cluster[1] += 1
+            # ما دامت الدفعة مفتوحة يبقى الأطول ممثلاً (تفاصيل أكثر)
+            if not cluster[2] and len(text) > len(cluster[0]):
+                self._buffer_tokens += tokens - estimate_tokens(cluster[0])
+                cluster[0] = text
+            self.index.insert(signature, cluster_id)
+            return
+        if self._buffer and self._buffer_tokens + tokens > self.chunk_tokens:
+            self._seal()
+        cluster_id = len(self.clusters)
+        self.clusters.append([text, 1, False])
+        self.index.insert(signature, cluster_id)
+        self._buffer.append(cluster_id)
+        self._buffer_tokens += tokens
+
+    def repeat(self, text: str) -> bool:
+        """
+        تكرار حرفي لخبر: يرفع عدد ذكر قصته دون إضافة نص.
+        يعيد False إن لم تكن القصة في موجز هذه الساعة (وردت في ساعة سابقة)
+        ليُضاف الخبر من جديد بدل أن يختفي من الموجز.
+        """
+        cluster_id = self.index.match(minhash_signature(text))
+        if cluster_id is None:
+            return False
+        self.clusters[cluster_id][1] += 1
+        self.mentions += 1
+        self.raw_tokens += estimate_tokens(text)
+        return True
+
+    def _render(self, cluster_ids) -> str:
+        lines = []
+        for cluster_id in cluster_ids:
+            cluster = self.clusters[cluster_id]
+            cluster[2] = True
+            lines.append(f"[×{cluster[1]}] {cluster[0]}" if cluster[1] > 1 else cluster[0])
+        text = "\n".join(lines)
+        self.input_tokens += estimate_tokens(text)
+        return text
+
+    def _seal(self):
+        if not self._buffer:
+            return
+        tokens = self._buffer_tokens
+        chunk = self._render(self._buffer)
+        self._buffer = []
+        self._buffer_tokens = 0
+        index = len(self._maps) + 1
+        self._maps.append(asyncio.create_task(self._map(chunk, tokens, index)))
+
+    async def _map(self, chunk: str, tokens: int, index: int) -> str:
+        logging.info("🧩 موجز الساعة: تلخيص الدفعة %s (~%s رمز)", index, tokens)
+        try:
+            return await cached_complete(PROMPT_HOURLY_MAP, chunk, stage=f"موجز/دفعة {index}")
+        except Exception as e:
+            logging.warning("⚠️ فشل تلخيص الدفعة %s: %s...", index, str(e)[:100])
+            return chunk[:600]
+
+    def single_pass_text(self):
+        """إذا لم تمتلئ أي دفعة خلال الساعة يكفي طلب واحد على النص كاملاً."""
+        if self._maps:
+            return None
+        return self._render(self._buffer)
+
+    async def collect(self) -> list:
+        self._seal()
+        return list(await asyncio.gather(*self._maps))
+
+    def memory_bytes(self) -> int:
+        # نصوص الممثلين مشتركة مع سجلات hourly_queue فتُحسب هنا مرة واحدة
+        return len(self.index) * MINHASH_SIGNATURE_BYTES + sum(sys.getsizeof(cluster[0]) + 120 for cluster in self.clusters)
+
+    def compact(self, keep_chars: int = 150) -> int:
+        """
+        تقليص تحت ضغط الذاكرة: تُختم الدفعة المفتوحة (يبدأ تلخيصها الآن)، ويُقص كل ممثل
+        إلى ما يعرضه البديل المحلي، ويبقى توقيع واحد لكل قصة. يعيد عدد التوقيعات المحذوفة.
+        """
+        self._seal()
+        for cluster in self.clusters:
+            cluster[0] = cluster[0][:keep_chars]
+        return self.index.compact()
+
+    def top_stories(self, limit: int) -> list:
+        """أكثر القصص ذكرًا [(النص، العدد)] بترتيب تنازلي."""
+        ranked = sorted(self.clusters, key=lambda cluster: cluster[1], reverse=True)[:limit]
+        return [(cluster[0], cluster[1]) for cluster in ranked]
+
+    def report(self) -> str:
+        saved = 1 - self.input_tokens / self.raw_tokens if self.raw_tokens else 0.0
+        return (
+            f"{self.mentions} خبر في {len(self.clusters)} قصة — رموز الإدخال ~{self.input_tokens} "
+            f"بدل ~{self.raw_tokens} (توفير {saved * 100:.0f}%)"
+        )
+
+    def cancel(self):
+        for task in self._maps:
+            task.cancel()
+
+hourly_digest = RollingHourlyDigest(HOURLY_CHUNK_TOKENS)
+
+def reset_hourly_digest():
+    global hourly_digest
+    hourly_digest.cancel()
+    hourly_digest = RollingHourlyDigest(HOURLY_CHUNK_TOKENS)
+
+def add_hourly_record(record: QueueRecord, persist: bool = True):
+    hourly_queue.append(record, persist=persist)
+    hourly_digest.add(record.text)
 
 # ---------------- إنشاء موجز الساعة ----------------
 async def generate_hourly_summary(manual=False):
-    global publish_hourly
+    global publish_hourly, hourly_digest
     if not publish_hourly or not HOURLY_TARGET_ID:
         return
 
@@ -721,46 +3316,48 @@ async def generate_hourly_summary(manual=False):
         logging.info("📭 مكدس موجز الساعة فارغ — لن يتم النشر.")
         return
 
-    # جمع جميع الأخبار في نص واحد
-    combined_text = "\n".join(hourly_queue)
+    # فصل أخبار هذه الساعة؛ ما يصل أثناء التوليد يذهب للساعة التالية
+    records = list(hourly_queue)
     hourly_queue.clear()  # تفريغ المكدس
+    digest, hourly_digest = hourly_digest, RollingHourlyDigest(HOURLY_CHUNK_TOKENS)
+    signature = HOURLY_SIGNATURE
 
-    client_ai = openai_manager.get_client()
-    try:
-        response = client_ai.chat.completions.create(
-            model="gpt-5-nano",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "أنت محرر اقتصادي محترف في عام 2026. حيث ترمب هو رئيس اميركا"
-                        "لخص الأخبار التالية في موجز ساعة اقتصادي شامل بالعربية. "
-                        "ركز على التأثيرات الرئيسية، المؤشرات، وتصريحات المسؤولين. "
-                        "اجعله جذابًا ومختصرًا (لا يتجاوز 120 كلمة). "
-                        "ابدأ بعنوان جذاب مثل: '📊 موجز الساعة الاقتصادية'."
-                    )
-                },
-                {"role": "user", "content": combined_text}
-            ]
-            #temperature=0.6,
-        )
-        summary = response.choices[0].message.content.strip()
-    except Exception as e:
-        error_str = str(e)
-        logging.warning(f"⚠️ فشل في إنشاء موجز الساعة: {error_str[:100]}...")
-        if hasattr(client_ai, 'api_key'):
-            openai_manager.mark_failed(client_ai.api_key, error_str)
-        summary = f"📊 **موجز الساعة الاقتصادية**\n\nفشل في التوليد. الأصل:\n```{combined_text[:300]}...```"
+    async def summarize() -> str:
+        started = time.perf_counter()
+        combined_text = digest.single_pass_text()
+        try:
+            if combined_text is not None:
+                logging.info(f"🧮 موجز الساعة: طلب واحد — {digest.report()}")
+                summary = await cached_complete(PROMPT_HOURLY, combined_text, stage="موجز/مباشر")
+            else:
+                partials = await digest.collect()
+                combined_text = "\n\n".join(partials)
+                logging.info(
+                    f"🧮 موجز الساعة: {len(partials)} دفعة — {digest.report()} "
+                    f"→ دمج (~{estimate_tokens(combined_text)} رمز)"
+                )
+                summary = await cached_complete(PROMPT_HOURLY, combined_text, stage="موجز/دمج")
+        except Exception as e:
+            logging.warning(f"⚠️ فشل في إنشاء موجز الساعة: {str(e)[:100]}...")
+            original = "\n".join(record.text for record in records)
+            summary = f"📊 **موجز الساعة الاقتصادية**\n\nفشل في التوليد. الأصل:\n```{original[:300]}...```"
+        logging.info(f"⏱️ زمن توليد موجز الساعة: {time.perf_counter() - started:.1f} ثانية")
+        metrics.inc("ecopulse_hourly_input_tokens_total", digest.raw_tokens, kind="raw")
+        metrics.inc("ecopulse_hourly_input_tokens_total", digest.input_tokens, kind="sent")
+        return f"{summary}\n\n{signature}\n\n{CHANNEL_WATERMARK}"[:4000]
 
-    signature = HOURLY_SIGNATURE
-    final_text = f"{summary}\n\n{signature}\n\n{CHANNEL_WATERMARK}"[:4000]
+    # البديل المحلي عند تجاوز المهلة: أكثر القصص تكرارًا كما وردت
+    stories = "\n".join(
+        f"• {f'[×{count}] ' if count > 1 else ''}{text[:150]}" for text, count in digest.top_stories(8)
+    )
+    fallback = f"📊 **موجز الساعة الاقتصادية**\n\n{stories}\n\n{signature}\n\n{CHANNEL_WATERMARK}"[:4000]
 
     # إنشاء رسالة وهمية لاستخدامها في forward_or_send
     class FakeMessage:
         id = int(time.time())
     fake_msg = FakeMessage()
 
-    sent = await forward_or_send(fake_msg, final_text, "نشر موجز ساعة", target_channel=HOURLY_TARGET_ID)
+    sent = await publish_within_slo("hourly", fake_msg, summarize, fallback, "نشر موجز ساعة", HOURLY_TARGET_ID)
     if sent:
         logging.info("✅ تم نشر موجز الساعة بنجاح.")
 
@@ -777,97 +3374,1170 @@ async def hourly_scheduler():
             await generate_hourly_summary()
 
 # ---------------- النشر المجدول ----------------
+prefetched_texts = {}  # مفتاح العنصر -> مهمة التنسيق المسبق
+
+def _queue_item_key(record):
+    return record.key
+
+def _format_queue_item(record):
+    # عناصر المكدس تقبل انتظار التجميع (LLM_BATCH_ENABLED) بخلاف المسار الفوري
+    return format_final_text(record.text, record.emoji, batch=True)
+
+async def prefetcher():
+    """مرحلة التحضير: تبقي أول N عناصر من المكدس منسّقة مسبقًا أثناء انتظار بوابة المشاهدات."""
+    while True:
+        await asyncio.sleep(0.5)
+        if not bot_active or not publish_scheduled or PUBLISHER_PREFETCH_DEPTH <= 0:
+            continue
+        if llm_breaker.is_open:
+            continue  # التحضير الآن يعطي البديل المحلي فقط؛ publisher() يتولى المنشور البديل واستبداله
+        wanted = set()
+        for item in itertools.islice(translation_queue, PUBLISHER_PREFETCH_DEPTH):
+            key = _queue_item_key(item)
+            wanted.add(key)
+            if key not in prefetched_texts:
+                prefetched_texts[key] = asyncio.create_task(_format_queue_item(item))
+        # إلغاء التحضير لعناصر خرجت من المكدس (مسح، تخلّص، انتهاء صلاحية)؛ ما بقي فيه
+        # خارج الرأس (تنسيق استباقي لعنصر مؤجل، إعادة ترتيب) يُحتفظ به حتى يصل دوره
+        stale = [k for k in prefetched_texts if k not in wanted]
+        if stale:
+            queued = {_queue_item_key(item) for item in translation_queue}
+            for key in stale:
+                if key not in queued:
+                    prefetched_texts.pop(key).cancel()
+
+async def take_formatted(item, started: float = None):
+    """النص المنسّق للعنصر (من التحضير المسبق إن وُجد) تحت مهلة المسار المجدول؛ يعيد (النص، مهمة متأخرة)."""
+    task = prefetched_texts.pop(_queue_item_key(item), None)
+    if task is not None and task.done():
+        if task.cancelled() or task.exception() is not None:
+            if not task.cancelled():
+                logging.warning(f"⚠️ فشل التنسيق المسبق، إعادة التنسيق: {str(task.exception())[:100]}")
+            task = None
+        else:
+            logging.debug("⚡ استخدام نص منسّق مسبقًا")
+    fallback = fallback_text(item.text, item.emoji, pending=True)
+    return await await_within_slo("scheduled", lambda: _format_queue_item(item), fallback, started, task)
+
 async def publisher():
+    """مرحلة الإرسال: تنتظر بوابة المشاهدات لكل هدف من أهداف العنصر ثم ترسل النص المحضّر."""
     global bot_active, publish_scheduled
-    last_post_id = None
+    last_posts = {}  # قناة الهدف -> آخر منشور مجدول فيها
     while True:
         if not bot_active or not publish_scheduled:
             await asyncio.sleep(5)
             continue
-        try:
-            event, emoji, _, _ = translation_queue.popleft()
-        except IndexError:
+        head = next(iter(translation_queue), None)
+        if head is None:
             await asyncio.sleep(1)
             continue
-        if last_post_id:
+        routes = routing_table.news_routes(head.chat_id)
+        for route in routes:
+            last_post_id = last_posts.get(route.target)
+            if last_post_id and route.gate == GATE_VIEWS:
+                with metrics.timer("gate_wait", gate="scheduled"):
+                    await views_tracker.wait_for_views(last_post_id, MIN_VIEWS_FOR_NEXT, route.target)
+        # قد يتغير رأس المكدس أثناء الانتظار (أولوية أعلى، انتهاء صلاحية) فنعيد الفحص
+        if next(iter(translation_queue), None) is not head:
+            continue
+        item = translation_queue.popleft()
+        picked = time.monotonic()
+        (final_text, late), media = await asyncio.gather(
+            take_formatted(item, picked), fetch_source_media(item.chat_id, item.media_ids)
+        )
+        posts = []
+        for route in routes:
+            sent = await forward_or_send(item, final_text, "نشر مجدول", target_channel=route.target, media=media)
+            if not sent:
+                continue
+            posts.append((route.target, sent))
+            last_post_id = last_posts.get(route.target)
+            if last_post_id:
+                views_tracker.unwatch(last_post_id, route.target)
+            last_posts[route.target] = sent.id
+            views_tracker.watch(sent.id, route.target)
+        if late is not None:
+            if posts:
+                spawn_background(backfill_posts("scheduled", late, posts, final_text, picked))
+            else:
+                late.cancel()
+        if posts:
+            metrics.observe(METRIC_STAGE_SECONDS, max(0.0, time.time() - item.enqueued_at), stage="e2e", path="scheduled")
+        await asyncio.sleep(PUBLISHER_SEND_INTERVAL)
+
+# ---------------- ميزانية الذاكرة ----------------
+# تقديرات تقريبية لكلفة كل عنصر (بايت) دون نصه: الكائن + مدخل الحاوية + الأعداد المرافقة
+def _queue_record_bytes() -> int:
+    """
+    كلفة سجل المكدس دون نصه، مقيسة بـ sys.getsizeof على سجل نموذجي: الكائن (slots) وأعداده
+    ووقت إضافته، وصف (وقت، سجل) في مكدس الترجمة مع وقته، ومؤشر خانة deque.
+    الرمز والفئة ثوابت مشتركة بين السجلات فلا تُحسب.
+    """
+    record = QueueRecord(-1001234567890, 123456, "", EMOJI_SCHEDULED, time.time(), QUEUE_CLASS_NORMAL, (123456,))
+    entry = (time.time(), record)
+    return (
+        sys.getsizeof(record) + sys.getsizeof(record.chat_id) + sys.getsizeof(record.message_id)
+        + sys.getsizeof(record.enqueued_at) + sys.getsizeof(record.media_ids)
+        + sys.getsizeof(entry) + sys.getsizeof(entry[0]) + 8
+    )
+
+QUEUE_RECORD_BYTES = _queue_record_bytes()
+FINGERPRINT_ENTRY_BYTES = 150
+VIEWS_ENTRY_BYTES = 160
+LANE_JOB_BYTES = 600      # قائمة المهمة + دالة الطلب ومتغيراتها + المستقبل
+TASK_BYTES = 1024         # مهمة asyncio مع إطار الدالة المعلقة
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
+
+def process_rss_bytes() -> int:
+    """الذاكرة المقيمة الحالية من /proc (Linux/Render)؛ وإلا ذروتها من getrusage؛ 0 إن تعذر."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class MemoryBudget:
+    """
+    محاسبة تقريبية لحجم المخازن في الذاكرة مع ميزانية كلية وحصة لكل مخزن.
+    المخزن الذي يتجاوز حصته يُقلَّص وحده، وإذا تجاوز المجموع الميزانية تُقلَّص
+    المخازن بترتيب التسجيل حتى يعود تحتها. مخزن بلا دالة تقليص يُحسب فقط.
+    """
+
+    def __init__(self, budget_bytes: int, rss_limit_bytes: int = 0):
+        self.budget = budget_bytes
+        self.rss_limit = rss_limit_bytes
+        self.accounts = {}  # الاسم -> (دالة الحجم، دالة التقليص، الحصة بالبايت)
+        self.evicted = defaultdict(int)
+        self.enforcements = 0
+        self.trace_baseline = None
+        self.tracing_started = False  # التتبع بدأ بأمر التحكم (لا بـ MEMORY_TRACEMALLOC عند الإقلاع)
+
+    def register(self, name: str, size, shrink=None):
+        """size() تعيد الحجم بالبايت، وshrink(excess) تحرر ~excess بايت وتعيد عدد العناصر المُخلاة."""
+        self.accounts[name] = (size, shrink, int(self.budget * MEMORY_SHARES.get(name, 0)))
+
+    def sizes(self) -> dict:
+        sizes = {}
+        for name, (size, _, _) in self.accounts.items():
             try:
-                last_post = await client.get_messages(TARGET_CHANNEL_ID, ids=last_post_id)
-                views = last_post.views or 0
-                while views < MIN_VIEWS_FOR_NEXT:
-                    await asyncio.sleep(60)
-                    last_post = await client.get_messages(TARGET_CHANNEL_ID, ids=last_post_id)
-                    views = last_post.views or 0
-            except Exception:
-                pass
-        cleaned = clean_text(event.message.message or "")
-        final_text = await format_final_text(cleaned, emoji)
-        sent = await forward_or_send(event.message, final_text, "نشر مجدول")
-        if sent:
-            last_post_id = sent.id
-        await asyncio.sleep(10)
+                sizes[name] = size()
+            except Exception as e:
+                logging.debug("فشل حساب حجم %s: %s", name, e)
+                sizes[name] = 0
+        return sizes
+
+    def _shrink(self, name: str, excess: int, reason: str):
+        shrink = self.accounts[name][1]
+        excess = int(excess)
+        if shrink is None or excess <= 0:
+            return
+        evicted = shrink(excess)
+        if evicted:
+            self.evicted[name] += evicted
+            metrics.inc("ecopulse_memory_evictions_total", evicted, buffer=name)
+            logging.warning(
+                "🧠 %s: أُخلي %d عنصر من %s (~%s فوق الحد)", reason, evicted, name, format_bytes(excess),
+                extra={"stage": "memory"}
+            )
+
+    def enforce(self, pressure: float = 1.0):
+        """يطبّق الحصص ثم الميزانية؛ pressure < 1 يضيّقهما معًا (ضغط RSS)."""
+        sizes = self.sizes()
+        shrunk = False
+        for name, (size, _, quota) in self.accounts.items():
+            limit = quota * pressure
+            if quota and sizes[name] > limit:
+                self._shrink(name, sizes[name] - limit, "تجاوز الحصة")
+                sizes[name] = size()
+                shrunk = True
+        excess = sum(sizes.values()) - self.budget * pressure
+        for name, (size, shrink, _) in self.accounts.items():
+            if excess <= 0:
+                break
+            if shrink is None or not sizes[name]:
+                continue
+            self._shrink(name, min(excess, sizes[name]), "تجاوز الميزانية")
+            after = size()
+            excess -= sizes[name] - after
+            sizes[name] = after
+            shrunk = True
+        if shrunk:
+            self.enforcements += 1
+        return sizes
+
+    def start_tracing(self, boot: bool = False):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing_started = not boot
+        self.trace_baseline = tracemalloc.take_snapshot()
+
+    def stop_tracing(self) -> bool:
+        """يوقف التتبع إن بدأه start_tracing بأمر؛ تتبع الإقلاع (MEMORY_TRACEMALLOC) يبقى."""
+        self.trace_baseline = None
+        if not self.tracing_started:
+            return False
+        self.tracing_started = False
+        tracemalloc.stop()
+        return True
+
+    def trace_report(self, limit: int = TRACEMALLOC_TOP) -> str:
+        """أكبر limit سطر مصدري من حيث نمو التخصيصات منذ بدء التتبع."""
+        if not tracemalloc.is_tracing():
+            return "tracemalloc غير مفعّل"
+        ignored = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"))
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignored)
+        if self.trace_baseline is not None:
+            top = snapshot.compare_to(self.trace_baseline.filter_traces(ignored), "lineno")[:limit]
+            rows = [f"• {stat.traceback[0]}: {format_bytes(stat.size)} ({stat.size_diff:+,} B، {stat.count} كتلة)" for stat in top]
+        else:
+            top = snapshot.statistics("lineno")[:limit]
+            rows = [f"• {stat.traceback[0]}: {format_bytes(stat.size)} ({stat.count} كتلة)" for stat in top]
+        current, peak = tracemalloc.get_traced_memory()
+        return f"متتبَّع حاليًا {format_bytes(current)} | ذروة {format_bytes(peak)}\n" + "\n".join(rows)
+
+    def report(self) -> str:
+        sizes = self.sizes()
+        rss = process_rss_bytes()
+        lines = [
+            f"- RSS: {format_bytes(rss) if rss else 'غير متاح'}"
+            + (f" / حد {format_bytes(self.rss_limit)}" if self.rss_limit else ""),
+            f"- المخازن: {format_bytes(sum(sizes.values()))} / ميزانية {format_bytes(self.budget)} "
+            f"| مرات التقليص: {self.enforcements}",
+        ]
+        for name, (_, shrink, quota) in self.accounts.items():
+            line = f"  • {name}: {format_bytes(sizes[name])}"
+            if quota:
+                line += f" / {format_bytes(quota)}"
+            if shrink is None:
+                line += " (حساب فقط)"
+            if self.evicted[name]:
+                line += f" | أُخلي: {self.evicted[name]}"
+            lines.append(line)
+        lines.append(f"- tracemalloc: {'مفعّل' if tracemalloc.is_tracing() else 'معطّل'}")
+        return "\n".join(lines)
+
+memory_budget = MemoryBudget(int(MEMORY_BUDGET_MB * 1024 * 1024), int(MEMORY_RSS_LIMIT_MB * 1024 * 1024))
+
+def _records_bytes(records) -> int:
+    return sum(QUEUE_RECORD_BYTES + sys.getsizeof(record.text) for record in records)
+
+def _shrink_translation_queue(excess: int) -> int:
+    freed = evicted = 0
+    while freed < excess and translation_queue:
+        dropped = translation_queue.shed_oldest()
+        freed += QUEUE_RECORD_BYTES + sys.getsizeof(dropped.text)
+        evicted += 1
+        dispose_shed(dropped, reason="ميزانية الذاكرة")
+    return evicted
+
+def _dedup_bytes() -> int:
+    return (len(source_fingerprints) + len(posted_texts)) * FINGERPRINT_ENTRY_BYTES
+
+def _shrink_dedup(excess: int) -> int:
+    # بصمات المصادر هي الأكثر عددًا؛ نصيب كل فهرس بنسبة حجمه
+    count = -(-excess // FINGERPRINT_ENTRY_BYTES)
+    total = len(source_fingerprints) + len(posted_texts) or 1
+    from_posted = count * len(posted_texts) // total
+    return source_fingerprints.evict(count - from_posted) + posted_texts.evict(from_posted)
+
+def _hourly_bytes() -> int:
+    return len(hourly_queue) * QUEUE_RECORD_BYTES + hourly_digest.memory_bytes()
+
+def _shrink_hourly(excess: int) -> int:
+    """أولاً ضغط المجمّع دون فقد قصص، ثم إسقاط أقدم سجلات المكدس (تبقى قصصها في المجمّع)."""
+    before = _hourly_bytes()
+    evicted = hourly_digest.compact()
+    freed = before - _hourly_bytes()
+    while freed < excess and hourly_queue:
+        freed += QUEUE_RECORD_BYTES + sys.getsizeof(hourly_queue.popleft().text)
+        evicted += 1
+    return evicted
+
+def _prefetch_bytes() -> int:
+    size = 0
+    for task in prefetched_texts.values():
+        size += TASK_BYTES
+        if task.done() and not task.cancelled() and task.exception() is None:
+            size += sys.getsizeof(task.result())
+    return size
+
+def _views_bytes() -> int:
+    watched = sum(len(ids) for ids in views_tracker.watched.values())
+    return (watched + len(views_tracker._views)) * VIEWS_ENTRY_BYTES
+
+def _llm_keys_bytes() -> int:
+    if openai_manager is None:
+        return 0
+    stats_dicts = (openai_manager.usage_stats, openai_manager.error_stats, openai_manager.failed_keys)
+    return sum(sys.getsizeof(d) for d in stats_dicts)
+
+def register_memory_accounts():
+    """تسجيل المخازن بترتيب MEMORY_SHARES (ترتيب التقليص) ثم المخازن المحسوبة فقط."""
+    memory_budget.register("llm_cache", llm_cache.memory_bytes, llm_cache.shrink_memory)
+    memory_budget.register("dedup", _dedup_bytes, _shrink_dedup)
+    memory_budget.register("hourly", _hourly_bytes, _shrink_hourly)
+    memory_budget.register("translation_queue", lambda: _records_bytes(translation_queue), _shrink_translation_queue)
+    memory_budget.register("send_lanes", lambda: sum(len(lane.queue) for lane in outbox.lanes.values()) * LANE_JOB_BYTES)
+    memory_budget.register("prefetch", _prefetch_bytes)
+    memory_budget.register("views", _views_bytes)
+    memory_budget.register("llm_keys", _llm_keys_bytes)
+    memory_budget.register("background", lambda: len(background_tasks) * TASK_BYTES)
+
+async def memory_guard(interval: float = MEMORY_CHECK_INTERVAL):
+    """فحص دوري للميزانية؛ عند تجاوز حد RSS تُقلَّص المخازن إلى نصف حصصها ويُجمع المهمل."""
+    while True:
+        await asyncio.sleep(interval)
+        pressure = 1.0
+        if memory_budget.rss_limit:
+            rss = process_rss_bytes()
+            if rss > memory_budget.rss_limit:
+                pressure = 0.5
+                logging.warning(
+                    "🧠 RSS %s فوق الحد %s — تقليص المخازن إلى نصف حصصها",
+                    format_bytes(rss), format_bytes(memory_budget.rss_limit), extra={"stage": "memory"}
+                )
+        memory_budget.enforce(pressure)
+        if pressure < 1:
+            gc.collect()
+
+# ---------------- وضع العمليات المتعددة ----------------
+# استقبال (Telethon + تصنيف) → طابور SQLite → عمال LLM → ناشر واحد بقفل قيادة.
+# الاستقبال وحده يتلقى التحديثات بجلسة SESSION_STRING؛ الناشر يرسل بجلسته PUBLISHER_SESSION_STRING.
+# كل العمليات على جهاز واحد دون وسيط خارجي؛ الوضع الافتراضي single يبقى كما هو.
+BOT_ROLE = os.getenv("BOT_ROLE", "single")             # single | ingest | worker | publisher | cluster
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "2"))       # عدد عمليات العمال في وضع cluster
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+PUBLISHER_LOCK_PATH = os.getenv("PUBLISHER_LOCK_PATH", "publisher.lock")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))  # مهمة عامل متوقف تعود للطابور بعدها
+JOB_LEASE_RENEW = JOB_LEASE_SECONDS / 3  # العامل يجدد إيجار مهمته الجارية (سلسلة إعادة محاولات OpenAI قد تطول)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "3600"))  # ثوانٍ لحفظ المهام المنتهية قبل حذفها
+
+JOB_NEWS = "news"
+JOB_ANALYST = "analyst"
+JOB_HOURLY = "hourly"
+JOB_PENDING = "pending"
+JOB_CLAIMED = "claimed"
+JOB_READY = "ready"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_QUEUED = (JOB_PENDING, JOB_CLAIMED, JOB_READY)
+# أوامر تحكم تخص حالة الناشر (مكدس موجز الساعة) تصله عبر جدول commands
+COMMAND_HOURLY_NOW = "hourly_now"
+COMMAND_CLEAR_HOURLY = "clear_hourly"
+JOB_PRIORITIES = {CATEGORY_ECONOMIC: 0, JOB_ANALYST: 1, CATEGORY_MACRO: 2, CATEGORY_KEYWORD: 2}  # الباقي 3
+IMMEDIATE_CATEGORIES = (CATEGORY_MACRO, CATEGORY_KEYWORD)
+
+class Job(namedtuple("Job", "job_id kind category priority chat_id message_id target emoji gate text result created media posted")):
+    __slots__ = ()
+
+    @property
+    def id(self):
+        # يسمح بتمرير المهمة مكان الرسالة إلى forward_or_send
+        return self.message_id
+
+    @property
+    def media_ids(self) -> tuple:
+        return tuple(int(i) for i in self.media.split(",") if i) if self.media else ()
+
+class JobStore:
+    """
+    طابور مهام SQLite (WAL) مشترك بين العمليات. المطالبة بمهمة ذرّية
+    (BEGIN IMMEDIATE + UPDATE ... RETURNING) مع مهلة إيجار يجددها العامل ما دامت المهمة جارية،
+    فمهمة عامل متوقف تعود للطابور. جدول flags يحمل أوامر التحكم من عملية الاستقبال إلى الناشر،
+    وجدول commands أوامره المنفذة مرة واحدة، وجدول status أعداد الناشر التي تعرضها أوامر المراقبة.
+    العمال والناشر يستدعون الطابور عبر asyncio.to_thread، والقفل يسلسل الاتصال المشترك.
+    """
+
+    COLUMNS = "id, kind, category, priority, chat_id, message_id, target, emoji, gate, text, result, created, media, posted"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self.db is not None:
+            return
+        self.db = sqlite3.connect(self.path, isolation_level=None, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, category TEXT, priority INTEGER NOT NULL, "
+            "chat_id INTEGER, message_id INTEGER, target INTEGER, emoji TEXT, gate TEXT, text TEXT NOT NULL, "
+            "result TEXT, created REAL NOT NULL, status TEXT NOT NULL, worker TEXT, lease_until REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, updated REAL, media TEXT DEFAULT '', posted INTEGER)"
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        if "media" not in columns:  # طابور من نسخة سابقة
+            self.db.execute("ALTER TABLE jobs ADD COLUMN media TEXT DEFAULT ''")
+        if "posted" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN posted INTEGER")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, priority, id)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS flags (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS commands (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS status (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def put(self, kind: str, category: str, chat_id, message_id, route: Route, text: str, media_ids=()):
+        # أخبار موجز الساعة لا تحتاج عاملًا: تذهب مباشرة للناشر
+        status = JOB_READY if kind == JOB_HOURLY else JOB_PENDING
+        priority = JOB_PRIORITIES.get(kind, JOB_PRIORITIES.get(category, 3))
+        now = time.time()
+        with self._lock:
+            self.db.execute(
+                "INSERT INTO jobs (kind, category, priority, chat_id, message_id, target, emoji, gate, text, "
+                "created, status, updated, media) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, category, priority, chat_id, message_id, route.target, route.emoji, route.gate, text,
+                 now, status, now, ",".join(map(str, media_ids)))
+            )
+
+    def claim(self, worker: str):
+        now = time.time()
+        with self._lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute(
+                f"UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                f"WHERE id = (SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_until < ? AND attempts < ?) "
+                f"ORDER BY priority, id LIMIT 1) RETURNING {self.COLUMNS}",
+                (JOB_CLAIMED, worker, now + JOB_LEASE_SECONDS, now, JOB_PENDING, JOB_CLAIMED, now, JOB_MAX_ATTEMPTS)
+            ).fetchone()
+        return Job(*row) if row else None
+
+    def renew(self, job_id: int, worker: str) -> bool:
+        """يمدد إيجار مهمة جارية؛ False إن انتهى الإيجار وطالب بها عامل آخر."""
+        now = time.time()
+        with self._lock:
+            return self.db.execute(
+                "UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND status = ? AND worker = ?",
+                (now + JOB_LEASE_SECONDS, now, job_id, JOB_CLAIMED, worker)
+            ).rowcount > 0
+
+    # complete/fail مقيدتان بالعامل: عامل فقد الإيجار لا يكتب فوق مطالبة عامل آخر
+    def complete(self, job_id: int, worker: str, result: str):
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, result = ?, updated = ? WHERE id = ? AND status = ? AND worker = ?",
+                (JOB_READY, result, time.time(), job_id, JOB_CLAIMED, worker)
+            )
+
+    def fail(self, job_id: int, worker: str):
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, updated = ? "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (JOB_MAX_ATTEMPTS, JOB_FAILED, JOB_PENDING, time.time(), job_id, JOB_CLAIMED, worker)
+            )
+
+    def publishable(self, limit: int = 200) -> list:
+        """المهام الجاهزة، ومعها ما ينتظر عاملًا ولم يُنشر له بديل (قد تتجاوز مهلة مسارها فيُنشر البديل)."""
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT {self.COLUMNS} FROM jobs WHERE status = ? OR (status IN (?, ?) AND posted IS NULL) "
+                f"ORDER BY priority, id LIMIT ?",
+                (JOB_READY, JOB_PENDING, JOB_CLAIMED, limit)
+            ).fetchall()
+            return [Job(*row) for row in rows]
+
+    def mark_posted(self, job_id: int, post_id: int):
+        """نُشر البديل المحلي للمهمة؛ تبقى للعامل ويُعدَّل المنشور بنتيجته حين تجهز."""
+        with self._lock:
+            self.db.execute("UPDATE jobs SET posted = ?, updated = ? WHERE id = ?", (post_id, time.time(), job_id))
+
+    def finish(self, job_id: int, status: str = JOB_DONE):
+        with self._lock:
+            self.db.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ?", (status, time.time(), job_id))
+
+    def prune(self):
+        now = time.time()
+        with self._lock, self.db:
+            self.db.execute("BEGIN")
+            # مهام تجاوزت المحاولات وانتهى إيجارها
+            self.db.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (JOB_FAILED, now, JOB_CLAIMED, now, JOB_MAX_ATTEMPTS)
+            )
+            self.db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (JOB_DONE, JOB_FAILED, now - JOB_RETENTION)
+            )
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def queued(self, limit: int = 3) -> list:
+        """أول المهام التي لم تُنشر بعد (للمعاينة)."""
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT {self.COLUMNS} FROM jobs WHERE status IN (?, ?, ?) ORDER BY priority, id LIMIT ?",
+                (*JOB_QUEUED, limit)
+            ).fetchall()
+            return [Job(*row) for row in rows]
+
+    def clear_queued(self) -> int:
+        """يُسقط كل مهمة لم تُنشر؛ نتيجة عامل ما زال يعالج إحداها لن تُكتب (complete يشترط claimed)."""
+        with self._lock:
+            return self.db.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE status IN (?, ?, ?)",
+                (JOB_FAILED, time.time(), *JOB_QUEUED)
+            ).rowcount
+
+    def put_command(self, name: str):
+        with self._lock:
+            self.db.execute("INSERT INTO commands (name, created) VALUES (?, ?)", (name, time.time()))
+
+    def take_commands(self) -> list:
+        with self._lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = self.db.execute("DELETE FROM commands RETURNING id, name").fetchall()
+        return [name for _, name in sorted(rows)]
+
+    def save_status(self, values: dict):
+        with self._lock, self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT OR REPLACE INTO status VALUES (?, ?)", list(values.items()))
+
+    def load_status(self) -> dict:
+        with self._lock:
+            return dict(self.db.execute("SELECT name, value FROM status").fetchall())
+
+    def save_flags(self, flags: dict):
+        with self._lock, self.db:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR REPLACE INTO flags VALUES (?, ?)",
+                [(name, int(value)) for name, value in flags.items()]
+            )
+
+    def load_flags(self) -> dict:
+        with self._lock:
+            return {name: bool(value) for name, value in self.db.execute("SELECT name, value FROM flags")}
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+job_store = JobStore(JOBS_DB_PATH)
+
+CONTROL_FLAGS = (
+    "bot_active", "publish_immediate", "publish_economic", "publish_analysis",
+    "publish_scheduled", "publish_hourly", "dry_run_mode",
+)
+
+def control_flags() -> dict:
+    return {name: globals()[name] for name in CONTROL_FLAGS}
+
+def apply_control_flags(flags: dict):
+    globals().update({name: bool(value) for name, value in flags.items() if name in CONTROL_FLAGS})
+
+# --- عملية الاستقبال ---
+async def ingest_message(event, route: Route):
+    """تنظيف وفحص تكرار وتصنيف ثم كتابة مهمة؛ بلا LLM ولا إرسال."""
+    note_first_message("ingest")
+    if not bot_active:
+        return
+    message = event.message
+    if message.action:
+        return
+    cleaned = clean_text(message.message or "")
+    category = ""
+    if route.pipeline == PIPELINE_HOURLY:
+        if not publish_hourly or not is_meaningful_text(cleaned):
+            return
+        # الموجز في عملية النشر يُصفَّر عند الدقيقة 00: بصمة التكرار تخص ساعتها فقط
+        scope, kind = f"hourly:{datetime.now():%Y%m%d%H}", JOB_HOURLY
+    elif route.pipeline == PIPELINE_ANALYST:
+        if not publish_analysis or not route.target or not cleaned:
+            return
+        scope, kind = f"news:{route.target}", JOB_ANALYST
+    else:
+        if not cleaned:
+            return
+        scope, kind = f"news:{route.target}", JOB_NEWS
+    fingerprint = content_fingerprint(cleaned, scope)
+    if is_duplicate_analysis(cleaned, route.target) if kind == JOB_ANALYST else source_fingerprints.seen(fingerprint):
+        metrics.inc("ecopulse_duplicates_total", scope=scope.split(":")[0])
+        return
+    if kind == JOB_NEWS:
+        with metrics.timer("classify"):
+            category = classify_message(cleaned).category
+        metrics.inc("ecopulse_messages_total", category=category)
+        if category == CATEGORY_ECONOMIC and not publish_economic:
+            return
+    source_fingerprints.add(fingerprint)
+    # الوسائط تُحمل بمعرفات رسائلها فيجلبها الناشر بمراجع حديثة (fetch_source_media) كما في الوضع الفردي
+    media_ids = event_media(event)[1] if kind == JOB_NEWS else ()
+    await asyncio.to_thread(job_store.put, kind, category, event.chat_id, message.id, route, cleaned, media_ids)
+    logging.info("📥 مهمة %s ID=%s", kind, message.id, extra={"message_id": message.id, "stage": "ingest"})
+
+async def ingest_dispatch(event):
+    """مثل dispatch_message: تجميع الألبوم ثم كل مسارات المحادثة بالتوازي."""
+    routes = routing_table.routes.get(event.chat_id)
+    if not routes:
+        return
+    if MEDIA_PASSTHROUGH and getattr(event.message, "grouped_id", None):
+        event = await album_collector.collect(event)
+        if event is None:
+            return
+    results = await asyncio.gather(*(ingest_message(event, route) for route in routes), return_exceptions=True)
+    for route, result in zip(routes, results):
+        if isinstance(result, Exception):
+            logging.error("❌ فشل مسار %s → %s: %s", route.pipeline, route.target, result)
+
+async def ingest_control_handler(event):
+    # أوامر التحكم تُنفَّذ هنا وتُنشر حالتها للناشر عبر جدول flags؛ أوامر المكدسات تقرأ جدول المهام
+    await control_handler(event)
+    await asyncio.to_thread(job_store.save_flags, control_flags())
+
+def ingest_only_note() -> str:
+    """تنبيه لأوامر تعرض حالة العملية التي تستقبلها: في وضع العمليات المتعددة هي عملية الاستقبال وحدها."""
+    if BOT_ROLE != "ingest":
+        return ""
+    return "\n_(عملية الاستقبال فقط — قياسات الناشر والعمال على نقاط /metrics الخاصة بكل منهم)_"
+
+def jobs_queue_report() -> str:
+    """بديل «مكدس» في عملية الاستقبال: المهام من جدول jobs ومكدس موجز الساعة كما نشره الناشر."""
+    counts = job_store.counts()
+    hourly = job_store.load_status().get("hourly_queue", 0)
+    msg = (
+        f"📥 **طابور المهام**: {sum(counts.get(status, 0) for status in JOB_QUEUED)} مهمة\n"
+        f"   • بانتظار عامل: {counts.get(JOB_PENDING, 0)} | قيد المعالجة: {counts.get(JOB_CLAIMED, 0)} "
+        f"| جاهزة للنشر: {counts.get(JOB_READY, 0)} | فشلت: {counts.get(JOB_FAILED, 0)}\n"
+        f"🕗 **مكدس موجز الساعة** (في الناشر): {hourly} رسالة\n"
+    )
+    queued = job_store.queued()
+    if queued:
+        preview = "\n".join(f"{i+1}. {job.text[:30]}..." for i, job in enumerate(queued))
+        msg += f"\n**التالي**:\n{preview}"
+    return msg
+
+def jobs_status_report() -> str:
+    """بديل «حالة» في عملية الاستقبال: المفاتيح من هذه العملية والأعداد من جدول المهام."""
+    counts = job_store.counts()
+    return (
+        f"📊 **حالة البوت** (عمليات متعددة)\n"
+        f"- نشط: {'✅' if bot_active else '⛔'}\n"
+        f"- نشر فوري: {'✅' if publish_immediate else '⛔'}\n"
+        f"- اقتصادي: {'✅' if publish_economic else '⛔'}\n"
+        f"- تحليل: {'✅' if publish_analysis else '⛔'}\n"
+        f"- مجدول: {'✅' if publish_scheduled else '⛔'}\n"
+        f"- موجز ساعة: {'✅' if publish_hourly else '⛔'}\n"
+        f"- مهام لم تُنشر: {sum(counts.get(status, 0) for status in JOB_QUEUED)}\n"
+        f"- مكدس ساعة: {job_store.load_status().get('hourly_queue', 0)}\n"
+        f"- مكررات محجوبة: {source_fingerprints.duplicates}\n"
+        f"- وضع تجربة: {'🧪' if dry_run_mode else '🚀'}"
+    )
+
+async def run_ingest():
+    init_runtime()
+    job_store.open()
+    apply_control_flags(job_store.load_flags())
+    started = await start_telegram()
+    if started is None:
+        return
+    channel_inputs, from_cache = started
+    client.add_event_handler(ingest_control_handler, events.NewMessage(chats=[CONTROL_CHANNEL_ID]))
+    client.add_event_handler(ingest_dispatch, events.NewMessage())
+    logging.info(f"📡 عملية الاستقبال جاهزة بعد {time.monotonic() - STARTED_AT:.2f} ث")
+    register_memory_accounts()  # أمر «ذاكرة» يصل هنا فيعرض مخازن هذه العملية
+    await start_metrics_server()
+    background = [routing_table.watch(ROUTES_RELOAD_INTERVAL), memory_guard()]
+    if from_cache:
+        background.append(refresh_entity_cache({**channel_inputs, **routing_table.inputs}))
+    try:
+        await asyncio.gather(client.run_until_disconnected(), *background)
+    finally:
+        job_store.close()
+        entity_cache.save()
+
+# --- عمليات العمال ---
+async def keep_lease(job: Job, worker: str):
+    """يجدد إيجار المهمة كل JOB_LEASE_RENEW ثانية حتى تُلغى عند انتهائها."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_RENEW)
+        try:
+            renewed = await asyncio.to_thread(job_store.renew, job.job_id, worker)
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ تعذر تجديد إيجار المهمة {job.job_id}: {e}")
+            continue
+        if not renewed:
+            logging.warning(f"⚠️ فقد {worker} إيجار المهمة {job.job_id} — لن تُكتب نتيجته")
+            return
+
+async def work_jobs(worker: str):
+    while True:
+        job = await asyncio.to_thread(job_store.claim, worker)
+        if job is None:
+            await asyncio.sleep(0.2)
+            continue
+        lease = asyncio.create_task(keep_lease(job, worker))
+        try:
+            if job.kind == JOB_ANALYST:
+                result = await format_analysis(job.text, job.emoji)
+            else:
+                # ما سيُنشر فورًا لا ينتظر التجميع؛ الباقي يقبله (LLM_BATCH_ENABLED)
+                batch = job.category not in (CATEGORY_ECONOMIC,) + IMMEDIATE_CATEGORIES
+                result = await format_final_text(job.text, job.emoji, category=job.category, batch=batch)
+            await asyncio.to_thread(job_store.complete, job.job_id, worker, result)
+        except Exception as e:
+            logging.warning(f"⚠️ فشل المهمة {job.job_id} في {worker}: {str(e)[:100]}")
+            await asyncio.to_thread(job_store.fail, job.job_id, worker)
+        finally:
+            lease.cancel()
+
+async def run_worker(name: str):
+    init_runtime(telegram=False)
+    job_store.open()
+    register_gauges()
+    await start_metrics_server()
+    logging.info(f"🧠 العامل {name} جاهز ({LLM_MAX_CONCURRENCY} مهمة متزامنة)")
+    try:
+        await asyncio.gather(
+            llm_cache.run(LLM_CACHE_FLUSH_INTERVAL),
+            *(work_jobs(f"{name}:{index}") for index in range(LLM_MAX_CONCURRENCY))
+        )
+    finally:
+        await openai_manager.close()
+        llm_cache.close()
+        job_store.close()
+
+# --- عملية الناشر ---
+async def acquire_leader_lock(path: str):
+    """قفل fcntl حصري: ناشر واحد فقط يرسل، والنسخ الأخرى تنتظر احتياطًا ويحرر النظام القفل عند توقف القائد."""
+    import fcntl  # لينكس فقط؛ الوضع single لا يحتاجه
+
+    handle = open(path, "a+")
+    announced = False
+    while True:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not announced:
+                logging.info(f"⏸️ ناشر آخر يملك القفل ({path}) — في وضع الاحتياط")
+                announced = True
+            await asyncio.sleep(5)
+            continue
+        handle.seek(0)
+        handle.truncate()
+        handle.write(str(os.getpid()))
+        handle.flush()
+        logging.info(f"👑 قفل الناشر: {path} (pid {os.getpid()})")
+        return handle
+
+def run_job_command(name: str):
+    """ينفذ أمر تحكم أرسلته عملية الاستقبال على حالة الناشر."""
+    if name == COMMAND_HOURLY_NOW:
+        logging.info("📨 طلب موجز الساعة يدويًا من عملية الاستقبال")
+        spawn_background(generate_hourly_summary(manual=True))
+    elif name == COMMAND_CLEAR_HOURLY:
+        count = len(hourly_queue)
+        hourly_queue.clear()
+        reset_hourly_digest()
+        logging.info(f"🧹 تم مسح {count} رسالة من مكدس موجز الساعة بطلب من عملية الاستقبال")
+    else:
+        logging.warning(f"⚠️ أمر تحكم غير معروف: {name}")
+
+def job_slo_path(job: Job, immediate: bool = True) -> str:
+    if job.kind == JOB_ANALYST:
+        return "analyst"
+    if job.category == CATEGORY_ECONOMIC:
+        return "economic"
+    return "immediate" if immediate and job.category in IMMEDIATE_CATEGORIES else "scheduled"
+
+def job_fallback(job: Job, path: str, started: float):
+    """البديل المحلي لمهمة بلا نتيجة تجاوزت مهلة مسارها منذ started، وإلا None (تنتظر العامل)."""
+    if time.time() - started < SLO_DEADLINES.get(path, LLM_REQUEST_TIMEOUT):
+        return None
+    metrics.inc("ecopulse_slo_total", path=path, result="deadline")
+    logging.warning("⏰ المهمة %s تجاوزت مهلة المسار %s — نشر البديل المحلي والاستبدال لاحقًا", job.job_id, path, extra={"stage": "slo"})
+    if job.kind == JOB_ANALYST:
+        return compose_analysis(job.text, job.emoji)
+    return fallback_text(job.text, job.emoji, job.category or None, pending=True)
+
+async def backfill_job(job: Job, target, sent=None):
+    """مثل backfill_posts: يستبدل البديل المنشور للمهمة بنتيجة العامل (sent يضيع عند إعادة تشغيل الناشر)."""
+    path = job_slo_path(job)
+    if not job.result or dry_run_mode or time.time() - job.created > SLO_BACKFILL_MAX_AGE:
+        metrics.inc("ecopulse_slo_backfill_total", path=path, result="skipped")
+        return
+    if sent is not None:
+        text = post_text_for(sent, job.result)
+    else:
+        text = clip_caption(job.result) if job.media_ids else job.result
+    await asyncio.gather(submit_edit(target, job.posted, text), return_exceptions=True)
+    posted_texts.check_and_add(content_fingerprint(job.result, str(target)))
+    metrics.inc("ecopulse_slo_backfill_total", path=path, result="edited")
+    metrics.observe(METRIC_STAGE_SECONDS, max(0.0, time.time() - job.created), stage="backfill", path=path)
+    logging.info("🔁 استُبدل المنشور البديل للمهمة %s (%s)", job.job_id, path, extra={"stage": "slo"})
+
+async def publish_jobs():
+    """
+    يرسل المهام الجاهزة بنفس بوابات الوضع الفردي: فوري، ثم مجدول بمشاهدات لكل هدف.
+    مهمة تجاوزت مهلة مسارها (SLO_DEADLINES) قبل أن ينهيها عامل يُنشر بديلها المحلي،
+    ويُعدَّل المنشور بنتيجة العامل حين تجهز (كما في await_within_slo/backfill_posts).
+    """
+    last_posts = {}          # قناة الهدف -> آخر منشور مجدول
+    next_scheduled_at = {}   # قناة الهدف -> أقرب وقت للنشر المجدول التالي
+    deferred = set()         # مهام فورية لم تتحقق بوابتها فصارت مجدولة (كما في الوضع الفردي)
+    picked_at = {}           # مهمة مجدولة بلغت دورها بلا نتيجة -> بداية مهلتها
+    fallback_posts = {}      # مهمة نُشر بديلها -> المنشور (لتعديله بنتيجة العامل)
+    last_prune = 0.0
+    published_status = None
+
+    async def settle(job: Job, sent, path: str):
+        if job.result is not None:
+            metrics.inc("ecopulse_slo_total", path=path, result="ok")
+        if job.result is not None or not sent:
+            await asyncio.to_thread(job_store.finish, job.job_id)
+            return
+        await asyncio.to_thread(job_store.mark_posted, job.job_id, sent.id)
+        fallback_posts[job.job_id] = sent
+
+    while True:
+        apply_control_flags(await asyncio.to_thread(job_store.load_flags))
+        for name in await asyncio.to_thread(job_store.take_commands):
+            run_job_command(name)
+        status = {"hourly_queue": len(hourly_queue)}
+        if status != published_status:
+            await asyncio.to_thread(job_store.save_status, status)
+            published_status = status
+        if time.monotonic() - last_prune > 60:
+            await asyncio.to_thread(job_store.prune)
+            last_prune = time.monotonic()
+        if not bot_active:
+            await asyncio.sleep(2)
+            continue
+        for job in await asyncio.to_thread(job_store.publishable):
+            if job.kind == JOB_HOURLY:
+                add_hourly_record(QueueRecord(job.chat_id, job.message_id, job.text, EMOJI_HOURLY, job.created))
+                await asyncio.to_thread(job_store.finish, job.job_id)
+                continue
+            target = job.target or TARGET_CHANNEL_ID
+            if job.posted is not None:
+                # البديل منشور والنتيجة جاهزة الآن
+                await backfill_job(job, target, fallback_posts.pop(job.job_id, None))
+                await asyncio.to_thread(job_store.finish, job.job_id)
+                continue
+            if job.kind == JOB_ANALYST:
+                now = time.time()
+                if now - analyst_last_post_time.get(target, 0) < ANALYST_POST_INTERVAL:
+                    await asyncio.to_thread(job_store.finish, job.job_id, JOB_FAILED)  # نفس سلوك الوضع الفردي: يُتجاهل داخل الفترة
+                    continue
+                text = job.result if job.result is not None else job_fallback(job, "analyst", job.created)
+                if text is None:
+                    continue
+                sent = await forward_or_send(job, text, "نشر تحليل", target_channel=target)
+                if sent:
+                    analyst_last_post_time[target] = now
+                await settle(job, sent, "analyst")
+                continue
+
+            immediate = job.category == CATEGORY_ECONOMIC
+            if not immediate and publish_immediate and job.category in IMMEDIATE_CATEGORIES and job.job_id not in deferred:
+                immediate = job.gate == GATE_NONE or can_publish_immediate(target)
+                if not immediate:
+                    deferred.add(job.job_id)
+            if immediate:
+                path = job_slo_path(job)
+                text = job.result if job.result is not None else job_fallback(job, path, job.created)
+                if text is None:
+                    continue
+                task_name = "نشر فوري (اقتصادي)" if job.category == CATEGORY_ECONOMIC else "نشر فوري"
+                media = await fetch_source_media(job.chat_id, job.media_ids)
+                sent = await forward_or_send(job, text, task_name, target_channel=target, media=media)
+                if sent:
+                    note_immediate_post(sent, target)
+                    metrics.observe(METRIC_STAGE_SECONDS, max(0.0, time.time() - job.created), stage="e2e", path=path)
+                await settle(job, sent, path)
+                continue
+
+            # مجدول (أو فوري مؤجل): منشور واحد لكل هدف بعد بلوغ مشاهدات المنشور السابق
+            if not publish_scheduled or time.monotonic() < next_scheduled_at.get(target, 0):
+                continue
+            last_post_id = last_posts.get(target)
+            if last_post_id and job.gate == GATE_VIEWS:
+                if not views_tracker.gate_passed(last_post_id, MIN_VIEWS_FOR_NEXT, target):
+                    continue
+            text = job.result
+            if text is None:
+                # مهلة المجدول تبدأ حين يبلغ دوره، كما في take_formatted
+                text = job_fallback(job, "scheduled", picked_at.setdefault(job.job_id, time.time()))
+                if text is None:
+                    continue
+            picked_at.pop(job.job_id, None)
+            media = await fetch_source_media(job.chat_id, job.media_ids)
+            sent = await forward_or_send(job, text, "نشر مجدول", target_channel=target, media=media)
+            await settle(job, sent, "scheduled")
+            deferred.discard(job.job_id)
+            next_scheduled_at[target] = time.monotonic() + PUBLISHER_SEND_INTERVAL
+            if sent:
+                metrics.observe(METRIC_STAGE_SECONDS, max(0.0, time.time() - job.created), stage="e2e", path="scheduled")
+                if last_post_id:
+                    views_tracker.unwatch(last_post_id, target)
+                last_posts[target] = sent.id
+                views_tracker.watch(sent.id, target)
+        await asyncio.sleep(0.5)
+
+async def run_publisher():
+    """
+    الناشر يرسل ويقرأ المشاهدات فقط: عميله بجلسة PUBLISHER_SESSION_STRING ودون استقبال تحديثات
+    (receive_updates=False)، فعملية الاستقبال وحدها تتلقى رسائل المصادر ولا يُستخدم مفتاح جلستها مرتين.
+    """
+    global client
+    check_multiprocess_config()
+    lock = await acquire_leader_lock(PUBLISHER_LOCK_PATH)
+    client = TelegramClient(StringSession(PUBLISHER_SESSION_STRING), API_ID, API_HASH, receive_updates=False)
+    init_runtime()
+    job_store.open()
+    apply_control_flags(job_store.load_flags())
+    started = await start_telegram()
+    if started is None:
+        return
+    restore_queues()  # مكدس موجز الساعة، بعد حل هدفه
+    register_gauges()
+    register_memory_accounts()
+    await start_metrics_server()
+    try:
+        await asyncio.gather(
+            publish_jobs(),
+            views_tracker.run(),
+            queue_store.run(QUEUE_FLUSH_INTERVAL),
+            llm_cache.run(LLM_CACHE_FLUSH_INTERVAL),
+            memory_guard(),
+            hourly_scheduler(),
+            routing_table.watch(ROUTES_RELOAD_INTERVAL),
+            client.disconnected
+        )
+    finally:
+        await openai_manager.close()
+        llm_cache.close()
+        queue_store.close()
+        job_store.close()
+        lock.close()
+
+# --- المشرف ---
+def check_multiprocess_config():
+    """إعدادات لا يدعمها وضع العمليات المتعددة: يرفض التشغيل بدل تجاهلها بصمت."""
+    if not PUBLISHER_SESSION_STRING:
+        logging.critical("❌ PUBLISHER_SESSION_STRING مفقود — الناشر يحتاج جلسة غير جلسة الاستقبال (SESSION_STRING)")
+        raise SystemExit(1)
+    if LLM_STREAM_ENABLED:
+        # العامل ينتج النص كاملًا في جدول المهام؛ لا مسار لأجزاء البث إلى الناشر
+        logging.critical("❌ LLM_STREAM_ENABLED غير مدعوم في وضع العمليات المتعددة — اضبطه على 0 أو استخدم الوضع single")
+        raise SystemExit(1)
+
+def run_cluster(workers: int):
+    """يشغّل الاستقبال والناشر وN عاملًا كعمليات فرعية ويعيد تشغيل ما يتوقف منها (مع تأخير متزايد)."""
+    children = [("ingest", "ingest"), ("publisher", "publisher")]
+    children += [(f"worker{index + 1}", "worker") for index in range(max(1, workers))]
+    procs, started_at = {}, {}
+    restarts, next_start = defaultdict(int), defaultdict(float)
+
+    def spawn(index: int, name: str, role: str):
+        env = dict(os.environ, METRICS_PORT=str(METRICS_PORT + index) if METRICS_PORT > 0 else "0")
+        if role == "worker":
+            # حدود المفاتيح لكل عملية: تُقسم الميزانية على العمال حتى لا يتجاوز مجموعهم حد OpenAI
+            env["OPENAI_KEY_RPM"] = str(max(1, OPENAI_KEY_RPM // workers))
+            env["OPENAI_KEY_TPM"] = str(max(1, OPENAI_KEY_TPM // workers))
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--role", role, "--name", name], env=env)
+
+    check_multiprocess_config()
+    logging.info(f"🧩 وضع العمليات المتعددة: {', '.join(name for name, _ in children)}")
+    try:
+        while True:
+            now = time.monotonic()
+            for index, (name, role) in enumerate(children):
+                proc = procs.get(name)
+                if proc is not None:
+                    if proc.poll() is None:
+                        if now - started_at[name] > 60:
+                            restarts[name] = 0  # عملية مستقرة
+                        continue
+                    logging.warning(f"⚠️ توقفت العملية {name} (رمز {proc.returncode}) — إعادة التشغيل")
+                    procs[name] = None
+                    restarts[name] += 1
+                    next_start[name] = now + min(60, 2 ** restarts[name])
+                if now >= next_start[name]:
+                    procs[name] = spawn(index, name, role)
+                    started_at[name] = now
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs.values():
+            if proc is not None and proc.poll() is None:
+                proc.terminate()
+        for proc in procs.values():
+            if proc is not None:
+                with contextlib.suppress(subprocess.TimeoutExpired):
+                    proc.wait(timeout=10)
 
 # ---------------- التشغيل ----------------
-async def main():
-    global SOURCE_CHANNEL_ID, SOURCE_CHANNEL_2_ID, TARGET_CHANNEL_ID, ANALYST_TARGET_ID, ANALYST_SOURCE_ID, CONTROL_CHANNEL_ID, HOURLY_SOURCE_ID, HOURLY_TARGET_ID
-    
+def register_gauges():
+    metrics.gauge("ecopulse_queue_depth", lambda: (
+        [({"queue": name}, translation_queue.depth(name)) for name in translation_queue.classes]
+        + [({"queue": "hourly"}, len(hourly_queue))]
+    ))
+    metrics.gauge("ecopulse_send_lane_depth", lambda: [({"lane": lane.name}, len(lane.queue)) for lane in outbox.lanes.values()])
+    metrics.gauge("ecopulse_llm_in_flight", lambda: [({}, openai_manager.in_flight)])
+    metrics.gauge("ecopulse_llm_breaker_open", lambda: [({}, int(llm_breaker.is_open))])
+    metrics.gauge("ecopulse_background_tasks", lambda: [({}, len(background_tasks))])
+    metrics.gauge("ecopulse_memory_bytes", lambda: [({"buffer": name}, size) for name, size in memory_budget.sizes().items()])
+    metrics.gauge("ecopulse_process_rss_bytes", lambda: [({}, process_rss_bytes())])
+
+def init_runtime(telegram: bool = True):
+    """بناء الكائنات الثقيلة عند التشغيل: عميل Telegram، مدير OpenAI، قواعد SQLite، ذاكرة القنوات."""
+    global client, openai_manager
+    if telegram and client is None:
+        client = TelegramClient(StringSession(SESSION_STRING), API_ID, API_HASH)
+    if openai_manager is None:
+        openai_manager = OpenAIManager(API_KEYS)
+    queue_store.open()
+    llm_cache.open()
+    if not telegram:
+        return
+    entity_cache.load()
+    seeded = entity_cache.seed(client.session) if entity_cache.entries else 0
+    if seeded:
+        logging.info(f"🗂️ ذاكرة القنوات: {seeded} كيان من {entity_cache.path}")
+
+async def start_telegram():
+    """الاتصال ثم حل القنوات الثابتة وجدول المسارات بالتوازي؛ يعيد (مدخلات القنوات، من الذاكرة؟) أو None."""
+    global TARGET_CHANNEL_ID, ANALYST_TARGET_ID, CONTROL_CHANNEL_ID, HOURLY_TARGET_ID
+    if client.session.auth_key is None:
+        logging.critical("❌ SESSION_STRING مفقود في .env — لا يمكن تشغيل البوت على الخادم!")
+        raise SystemExit(1)
+
     await client.start()
-    me = await client.get_me()
-    logging.info(f"✅ تسجيل الدخول باسم: {me.first_name}")
-    
-    # ✅ تهيئة جميع القنوات من .env (ثابتة)
+
+    # ✅ تهيئة القنوات الثابتة وجدول المسارات بالتوازي، مع اعتماد المعرفات المخزنة
+    channel_inputs = {
+        "control": CONTROL_CHANNEL,
+        "target": TARGET_CHANNEL,
+        "analyst_target": ANALYST_TARGET,
+        "hourly_target": HOURLY_TARGET,
+    }
+    from_cache = bool(entity_cache.entries)
+    resolve_started = time.monotonic()
     try:
-        CONTROL_CHANNEL_ID = await resolve_channel(CONTROL_CHANNEL)
-        SOURCE_CHANNEL_ID = await resolve_channel(SOURCE_CHANNEL)
-        SOURCE_CHANNEL_2_ID = await resolve_channel(SOURCE_CHANNEL_2)
-        TARGET_CHANNEL_ID = await resolve_channel(TARGET_CHANNEL)
-        if ANALYST_SOURCE:
-            ANALYST_SOURCE_ID = await resolve_channel(ANALYST_SOURCE)
-        if ANALYST_TARGET:
-            ANALYST_TARGET_ID = await resolve_channel(ANALYST_TARGET)
-        if HOURLY_SOURCE:
-            HOURLY_SOURCE_ID = await resolve_channel(HOURLY_SOURCE)
-        if HOURLY_TARGET:
-            HOURLY_TARGET_ID = await resolve_channel(HOURLY_TARGET)
-        
-        logging.info(f"✅ القنوات جاهزة: تحكم={CONTROL_CHANNEL_ID}")
+        resolved, me, _ = await asyncio.gather(
+            resolve_channels(channel_inputs), client.get_me(), routing_table.load()
+        )
     except Exception as e:
         logging.critical(f"❌ فشل تهيئة القنوات: {e}")
+        return None
+    CONTROL_CHANNEL_ID = resolved["control"]
+    TARGET_CHANNEL_ID = resolved["target"]
+    ANALYST_TARGET_ID = resolved.get("analyst_target")
+    HOURLY_TARGET_ID = HOURLY_TARGET_ID or resolved.get("hourly_target")
+    entity_cache.save()
+    logging.info(f"✅ تسجيل الدخول باسم: {me.first_name}")
+    logging.info(
+        f"✅ القنوات جاهزة: تحكم={CONTROL_CHANNEL_ID} "
+        f"({(time.monotonic() - resolve_started) * 1000:.0f} ms، {'من الذاكرة' if from_cache else 'من الشبكة'})"
+    )
+    return channel_inputs, from_cache
+
+async def main():
+    if MEMORY_TRACEMALLOC:
+        memory_budget.start_tracing(boot=True)
+    init_runtime()
+
+    started = await start_telegram()
+    if started is None:
         return
-    
+    channel_inputs, from_cache = started
+
+    # ✅ استعادة المكدسات بعد حل الأهداف (سياسة الموجز تحتاج HOURLY_TARGET_ID، ودفعاته تستدعي LLM)
+    # وقبل ربط الموزّع، فتسبق المحفوظاتُ الرسائلَ الجديدة
+    restore_queues()
+
     # ✅ ربط ثابت بقناة التحكم (من .env فقط)
     client.add_event_handler(control_handler, events.NewMessage(chats=[CONTROL_CHANNEL_ID]))
     
-    # ✅ ربط المصادر
-    client.add_event_handler(lambda e: handle_source(e, EMOJI_IMMEDIATE), events.NewMessage(chats=[SOURCE_CHANNEL_ID]))
-    client.add_event_handler(lambda e: handle_source(e, EMOJI_SCHEDULED), events.NewMessage(chats=[SOURCE_CHANNEL_2_ID]))
-    
-    # ✅ ربط قناة التحليل
-    if ANALYST_SOURCE_ID and ANALYST_TARGET_ID:
-        client.add_event_handler(
-            analyst_handler,
-            events.NewMessage(chats=[ANALYST_SOURCE_ID])
-        )
-    
-    # ✅ ربط مصدر موجز الساعة
-    if HOURLY_SOURCE_ID:
-        client.add_event_handler(handle_hourly_source, events.NewMessage(chats=[HOURLY_SOURCE_ID]))
+    # ✅ موزّع واحد لكل المصادر (المسارات تُقرأ من الجدول عند كل رسالة فتُحدَّث دون إعادة ربط)
+    client.add_event_handler(dispatch_message, events.NewMessage())
+
+    startup_seconds = time.monotonic() - STARTED_AT
+    metrics.observe(METRIC_STAGE_SECONDS, startup_seconds, stage="startup")
+    logging.info(f"🤖 EcoPulse Bot جاهز بعد {startup_seconds:.2f} ث — في انتظار الأوامر في قناة التحكم.")
+
+    # ✅ نقطة القياسات المحلية
+    register_gauges()
+    register_memory_accounts()
+    await start_metrics_server()
+
+    # ✅ تحديث المعرفات المخزنة في الخلفية (لا يؤخر استقبال الرسائل)
+    background = [routing_table.watch(ROUTES_RELOAD_INTERVAL)]
+    if from_cache:
+        background.append(refresh_entity_cache({**channel_inputs, **routing_table.inputs}))
 
-    logging.info("🤖 EcoPulse Bot جاهز — في انتظار الأوامر في قناة التحكم.")
     # تشغيل الجدولة والمراقبة بالتوازي
-    await asyncio.gather(
-        publisher(),
-        hourly_scheduler(),
-        client.run_until_disconnected()
-    )
+    try:
+        await asyncio.gather(
+            publisher(),
+            prefetcher(),
+            views_tracker.run(),
+            queue_store.run(QUEUE_FLUSH_INTERVAL),
+            llm_cache.run(LLM_CACHE_FLUSH_INTERVAL),
+            memory_guard(),
+            hourly_scheduler(),
+            client.run_until_disconnected(),
+            *background
+        )
+    finally:
+        await openai_manager.close()
+        llm_cache.close()
+        queue_store.close()
+        entity_cache.save()
+
+def parse_args():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="EcoPulse Bot")
+    parser.add_argument("--role", default=BOT_ROLE, choices=("single", "ingest", "worker", "publisher", "cluster"))
+    parser.add_argument("--name", default="", help="اسم العملية (للسجلات والعمال)")
+    parser.add_argument("--workers", type=int, default=LLM_WORKERS, help="عدد العمال في وضع cluster")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
+    name = args.name or args.role
+    if args.role == "single":
+        setup_logging()
+    else:
+        log_root, log_ext = os.path.splitext(LOG_FILE)
+        setup_logging(f"{log_root}.{name}{log_ext}" if LOG_FILE else "")
+    entry = {
+        "single": main,
+        "ingest": run_ingest,
+        "worker": lambda: run_worker(name),
+        "publisher": run_publisher,
+    }
     try:
-        asyncio.run(main())
+        if args.role == "cluster":
+            run_cluster(args.workers)
+        else:
+            asyncio.run(entry[args.role]())
     except KeyboardInterrupt:
         logging.info("🛑 تم إيقاف البوت يدوياً.")
     except Exception as e:
         logging.critical(f"💥 خطأ فادح: {e}", exc_info=True)
-
-
-
-
@@ -0,0 +1,141 @@
+"""
+EcoPulse — مصنّف الرسائل
+تصنيف كل رسالة في مرور واحد خطي الزمن:
+✅ كلمات مفتاحية عبر آلة Aho-Corasick (بدون حلقة any() على القائمة)
+✅ أنماط البيانات الاقتصادية مترجمة مرة واحدة عند الاستيراد وبدون تراجع كارثي
+✅ النتيجة: فئة (economic / macro / keyword / other) + الخصائص المطابقة
+"""
+
+import re
+from collections import namedtuple
+
+CATEGORY_ECONOMIC = "economic"
+CATEGORY_MACRO = "macro"
+CATEGORY_KEYWORD = "keyword"
+CATEGORY_OTHER = "other"
+
+Classification = namedtuple("Classification", "category features")
+
+# ---------------- أنماط البيانات الاقتصادية ----------------
+# "رأس" يدل على بيانات، يجب أن يتبعه على نفس السطر "ذيل" (حقل/رقم/M/B/K).
+# كل نمط ينتهي عند أول دليل رقمي، والكميات المتغيرة محدودة، فالتكلفة خطية.
+_DATA_FIELDS = r"ACT(?:UAL)?|FORECAST|EST(?:IMATED)?|PREV(?:IOUS)?|REVISED?"
+_INDICATORS = (
+    r"PMI|ISM|JOLTS|CPI|GDP|NFP|NONFARM|JOBS?|ORDERS?|DURABLE|FACTORY|IVES?|PRICES?|"
+    r"EMPLOYMENT|NEW\s+ORDERS?"
+)
+
+ECONOMIC_HEAD_RE = re.compile(
+    rf"""
+    (?P<field>\b(?:{_DATA_FIELDS})\b[:=;]?\s*[-+]?\d)
+    | (?P<versus>[-+]?\d+(?:\.\d+)?%?\s+(?:VS|VERSUS)\.?\s+[-+]?\d)
+    | (?P<indicator>\b(?:{_INDICATORS})\b[^\n]{{0,50}}?\d)
+    | (?P<amount>\b\d+(?:\.\d+)?[MBK](?:ILLION)?\b)
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+# مجموعة بين قوسين تحتوي حقل بيانات يليه رقم، مثل "(ACT 2.1 / EST 2.0)"
+PAREN_GROUP_RE = re.compile(r"\([^)]{0,400}\)")
+PAREN_DATA_RE = re.compile(r"(?:ACT(?:UAL)?|FORECAST|EST|PREV|REVISED?)\D*\d", re.IGNORECASE)
+ECONOMIC_TAIL_RE = re.compile(r"ACT|FORECAST|EST|PREV|REVISE|\d|[MBK]", re.IGNORECASE)
+
+
+def _has_tail(text: str, pos: int) -> bool:
+    line_end = text.find("\n", pos)
+    if line_end < 0:
+        line_end = len(text)
+    return ECONOMIC_TAIL_RE.search(text, pos, line_end) is not None
+
+
+def economic_features(text: str) -> list:
+    """يعيد خصائص البيانات الاقتصادية المطابقة (قائمة فارغة = ليست بيانات)."""
+    features = []
+    for match in ECONOMIC_HEAD_RE.finditer(text):
+        if _has_tail(text, match.end()):
+            features.append(f"{match.lastgroup}:{match.group().strip()[:40]}")
+            break
+    for match in PAREN_GROUP_RE.finditer(text):
+        if PAREN_DATA_RE.search(match.group()) and _has_tail(text, match.end()):
+            features.append(f"paren:{match.group()[:40]}")
+            break
+    return features
+
+
+# ---------------- آلة الكلمات المفتاحية ----------------
+class KeywordAutomaton:
+    """آلة Aho-Corasick: تجد كل الكلمات المفتاحية في مرور واحد O(n + المطابقات)."""
+
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if not keyword:
+                continue
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            if keyword not in self._out[state]:
+                self._out[state] = self._out[state] + (keyword,)
+
+        # روابط الفشل بالعرض أولاً
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text_lower: str) -> set:
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text_lower:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+# ---------------- المصنّف ----------------
+class MessageClassifier:
+    """مصنّف واحد مترجم مسبقًا يستبدل is_economic_data + فحص KEYWORDS_LIST + فحص MACRO."""
+
+    def __init__(self, keywords, macro_keyword: str = "macro"):
+        self.macro_keyword = macro_keyword.lower()
+        self.automaton = KeywordAutomaton(list(keywords) + [self.macro_keyword])
+
+    def classify(self, text: str) -> Classification:
+        if not text:
+            return Classification(CATEGORY_OTHER, ())
+        features = economic_features(text)
+        if features:
+            return Classification(CATEGORY_ECONOMIC, tuple(features))
+        keywords = self.automaton.find_all(text.lower())
+        if self.macro_keyword in keywords:
+            return Classification(CATEGORY_MACRO, tuple(sorted(keywords)))
+        if keywords:
+            return Classification(CATEGORY_KEYWORD, tuple(sorted(keywords)))
+        return Classification(CATEGORY_OTHER, ())
+
+    def is_economic_data(self, text: str) -> bool:
+        return bool(text) and bool(economic_features(text))
@@ -0,0 +1,211 @@
+"""
+EcoPulse — منسّق البيانات الاقتصادية المحلي
+استخراج البيان الاقتصادي من نص الخبر وتعبئة قالب "صدر الآن" دون طلب LLM:
+✅ الدولة من علم الدولة أو اسمها، والمؤشر عبر قاموس عربي (مع الفترة: سنوي/شهري/ربعي)
+✅ الحالي / التقدير / السابق من صيغ الوكالات الشائعة (ACT: ... EST ... PREV ... / X vs Y est / prior revised to Z)
+✅ حكم بقواعد ثابتة: أعلى/أدنى من التوقعات وأثره على العملة
+✅ عند ضعف الثقة (مؤشر غير معروف، لا قيمة حالية، لا مرجع للمقارنة) يعيد None ليُستخدم LLM
+"""
+
+import re
+from collections import namedtuple
+
+Release = namedtuple("Release", "country indicator period actual forecast previous verdict")
+
+# ---------------- الدول والعملات ----------------
+# (العلم، أنماط الاسم، الاسم العربي، "لـ" + العملة)
+_COUNTRIES = (
+    ("🇺🇸", r"US|U\.S\.|USA|UNITED STATES|AMERICAN?", "الولايات المتحدة", "للدولار"),
+    ("🇪🇺", r"EUROZONE|EURO\s+AREA|EU|EZ", "منطقة اليورو", "لليورو"),
+    ("🇩🇪", r"GERMANY|GERMAN", "ألمانيا", "لليورو"),
+    ("🇫🇷", r"FRANCE|FRENCH", "فرنسا", "لليورو"),
+    ("🇮🇹", r"ITALY|ITALIAN", "إيطاليا", "لليورو"),
+    ("🇬🇧", r"UK|U\.K\.|BRITAIN|BRITISH|ENGLAND", "المملكة المتحدة", "للجنيه الإسترليني"),
+    ("🇯🇵", r"JAPAN|JAPANESE|TOKYO", "اليابان", "للين"),
+    ("🇨🇳", r"CHINA|CHINESE|CAIXIN", "الصين", "لليوان"),
+    ("🇨🇦", r"CANADA|CANADIAN", "كندا", "للدولار الكندي"),
+    ("🇦🇺", r"AUSTRALIA|AUSTRALIAN|RBA", "أستراليا", "للدولار الأسترالي"),
+    ("🇳🇿", r"NEW\s+ZEALAND|RBNZ", "نيوزيلندا", "للدولار النيوزيلندي"),
+    ("🇨🇭", r"SWITZERLAND|SWISS|SNB", "سويسرا", "للفرنك"),
+)
+_COUNTRY_BY_FLAG = {flag: (name, currency) for flag, _, name, currency in _COUNTRIES}
+_COUNTRY_NAME_RE = [
+    (re.compile(rf"(?<![\w.])(?:{pattern})(?![\w])"), name, currency)
+    for _, pattern, name, currency in _COUNTRIES
+]
+_US = _COUNTRY_BY_FLAG["🇺🇸"]
+
+# ---------------- قاموس المؤشرات ----------------
+# (النمط، الاسم العربي، القطبية، دولة افتراضية، الأثر على غير العملة)
+# القطبية +1: القراءة الأعلى إيجابية للعملة (نمو، تضخم يدعم التشديد)؛ -1: الأعلى سلبية (بطالة، طلبات إعانة).
+# الترتيب مهم: الأنماط الأخص قبل الأعم.
+_INDICATORS = (
+    (r"CORE\s+CPI|CPI\s+EX[-\s]FRESH|CPI\s+EX[-\s]FOOD", "مؤشر أسعار المستهلك الأساسي", 1, None, None),
+    (r"CPI|CONSUMER\s+PRICE\s+INDEX|INFLATION\s+RATE", "مؤشر أسعار المستهلك", 1, None, None),
+    (r"CORE\s+PCE", "نفقات الاستهلاك الشخصي الأساسية", 1, _US, None),
+    (r"PCE", "نفقات الاستهلاك الشخصي", 1, _US, None),
+    (r"PPI|PRODUCER\s+PRICE", "مؤشر أسعار المنتجين", 1, None, None),
+    (r"NONFARM\s+PAYROLLS?|NON-FARM\s+PAYROLLS?|NFP", "الوظائف غير الزراعية", 1, _US, None),
+    (r"ADP", "وظائف القطاع الخاص ADP", 1, _US, None),
+    (r"EMPLOYMENT\s+CHANGE", "التغير في التوظيف", 1, None, None),
+    (r"UNEMPLOYMENT\s+RATE", "معدل البطالة", -1, None, None),
+    (r"(?:INITIAL\s+)?JOBLESS\s+CLAIMS|INITIAL\s+CLAIMS", "طلبات إعانة البطالة الأولية", -1, _US, None),
+    (r"JOLTS", "فرص العمل JOLTS", 1, _US, None),
+    (r"ISM\s+SERVICES(?:\s+PMI)?|ISM\s+NON-MANUFACTURING", "مؤشر ISM للخدمات", 1, _US, None),
+    (r"ISM\s+MANUFACTURING(?:\s+PMI)?", "مؤشر ISM الصناعي", 1, _US, None),
+    (r"SERVICES\s+PMI", "مؤشر مديري المشتريات الخدمي", 1, None, None),
+    (r"MANUFACTURING\s+PMI", "مؤشر مديري المشتريات الصناعي", 1, None, None),
+    (r"COMPOSITE\s+PMI", "مؤشر مديري المشتريات المركب", 1, None, None),
+    (r"GDP", "الناتج المحلي الإجمالي", 1, None, None),
+    (r"RETAIL\s+SALES", "مبيعات التجزئة", 1, None, None),
+    (r"DURABLE\s+GOODS(?:\s+ORDERS)?", "طلبيات السلع المعمرة", 1, _US, None),
+    (r"FACTORY\s+ORDERS", "طلبيات المصانع", 1, None, None),
+    (r"INDUSTRIAL\s+PRODUCTION", "الإنتاج الصناعي", 1, None, None),
+    (r"ZEW(?:\s+ECONOMIC)?\s+SENTIMENT", "مؤشر ZEW للثقة الاقتصادية", 1, None, None),
+    (r"IFO(?:\s+BUSINESS\s+CLIMATE)?", "مؤشر IFO لمناخ الأعمال", 1, None, None),
+    (r"CONSUMER\s+CONFIDENCE", "ثقة المستهلك", 1, None, None),
+    (r"TRADE\s+BALANCE", "الميزان التجاري", 1, None, None),
+    (r"HOUSING\s+STARTS", "بدء إنشاء المساكن", 1, None, None),
+    (r"BUILDING\s+PERMITS", "تصاريح البناء", 1, None, None),
+    (r"CASH\s+RATE(?:\s+TARGET)?|INTEREST\s+RATE\s+DECISION|RATE\s+DECISION", "قرار سعر الفائدة", 1, None, None),
+    (r"CRUDE\s+OIL\s+INVENTORIES|CRUDE\s+INVENTORIES", "مخزونات النفط الخام", -1, _US, "للنفط"),
+)
+_INDICATOR_RES = [
+    (re.compile(rf"(?<![\w])(?:{pattern})(?![\w])"), name, polarity, default, subject)
+    for pattern, name, polarity, default, subject in _INDICATORS
+]
+
+_PERIODS = (
+    (re.compile(r"(?<![\w])(?:YOY|Y/Y)(?![\w])"), "سنوي"),
+    (re.compile(r"(?<![\w])(?:MOM|M/M)(?![\w])"), "شهري"),
+    (re.compile(r"(?<![\w])(?:QOQ|Q/Q)(?![\w])"), "ربعي"),
+)
+
+# ---------------- القيم ----------------
+ACTUAL, FORECAST, PREVIOUS = "actual", "forecast", "previous"
+
+# لا حرف ولا رقم بعد الرقم إلا لاحقة الكمية: "2ND" و"3MONTH" ليستا قيمتين
+_NUMBER_RE = re.compile(r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?:%|[KMBT])?(?![A-Za-z0-9])")
+_YEAR_RE = re.compile(r"(?:19|20)\d\d")
+_VERSUS_RE = re.compile(r"\s*(?:(?:YOY|Y/Y|MOM|M/M|QOQ|Q/Q)\s*)?(?:VS|VERSUS)(?![\w])")
+# وسم قبل الرقم مباشرة: "ACT: 3.2" / "(EST 53.3" / "PRIOR REVISED TO 220K"
+_LABEL_BEFORE_RE = re.compile(
+    r"(?<![\w])(?:(?P<actual>ACT(?:UAL)?)"
+    r"|(?P<forecast>FORECAST|EST(?:IMATED?)?|EXPECTED|CONSENSUS)"
+    r"|(?P<previous>(?:PREV(?:IOUS)?|PRIOR)(?:\s+REVISED(?:\s+(?:TO|FROM))?)?|REVISED(?:\s+TO)?))"
+    r"\s*[:=]?\s*\(?$"
+)
+# وسم بعد الرقم مباشرة: "0.2% EST" / "15.5 EXPECTED"
+_LABEL_AFTER_RE = re.compile(r"\s*(?:FORECAST|EST(?:IMATED?|IMATE)?|EXPECTED|CONSENSUS)(?![\w])")
+_AS_EXPECTED_RE = re.compile(r"(?<![\w])(?:AS|IN\s+LINE\s+WITH)\s+(?:EXPECTED|ESTIMATES?|FORECAST)(?![\w])")
+_SCALE = {"K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12}
+
+
+def _to_float(raw: str) -> float:
+    value = raw.rstrip("%")
+    scale = _SCALE.get(value[-1:], 1.0)
+    if scale != 1.0:
+        value = value[:-1]
+    return float(value) * scale
+
+
+def _country(text: str, upper: str, default):
+    for flag, info in _COUNTRY_BY_FLAG.items():
+        if flag in text:
+            return info
+    for pattern, name, currency in _COUNTRY_NAME_RE:
+        if pattern.search(upper):
+            return name, currency
+    return default
+
+
+def _values(upper: str, start: int) -> dict:
+    """
+    يعيد {actual/forecast/previous: النص الخام} من الأرقام الواقعة بعد اسم المؤشر.
+    الرقم غير الموسوم يُعد القراءة الفعلية فقط إذا سبق "VS" أو كان المرشح الوحيد،
+    والسنوات (19xx/20xx بلا وحدة) ليست مرشحة؛ وإلا لا قراءة فعلية فيعود النص إلى LLM.
+    """
+    values = {}
+    unlabeled = []
+    versus = None
+    for match in _NUMBER_RE.finditer(upper, start):
+        raw = match.group()
+        before = _LABEL_BEFORE_RE.search(upper, max(start, match.start() - 40), match.start())
+        if before is not None:
+            label = before.lastgroup
+            # التعديل ("REVISED") يحل محل القراءة السابقة الأصلية
+            if label == PREVIOUS or label not in values:
+                values[label] = raw
+        elif _LABEL_AFTER_RE.match(upper, match.end()):
+            values.setdefault(FORECAST, raw)
+        elif _YEAR_RE.fullmatch(raw):
+            continue
+        else:
+            unlabeled.append(raw)
+            if versus is None and _VERSUS_RE.match(upper, match.end()):
+                versus = raw
+    if ACTUAL not in values:
+        if versus is not None:
+            values[ACTUAL] = versus
+        elif len(unlabeled) == 1:
+            values[ACTUAL] = unlabeled[0]
+    if FORECAST not in values and ACTUAL in values and _AS_EXPECTED_RE.search(upper, start):
+        values[FORECAST] = values[ACTUAL]
+    return values
+
+
+def _verdict(actual: str, reference: str, polarity: int, subject: str, expected: bool) -> str:
+    difference = _to_float(actual) - _to_float(reference)
+    if abs(difference) < 1e-9:
+        return "مطابق للتوقعات" if expected else "دون تغيير عن القراءة السابقة"
+    direction = "أعلى" if difference > 0 else "أدنى"
+    against = "التوقعات" if expected else "القراءة السابقة"
+    effect = "إيجابي" if (difference > 0) == (polarity > 0) else "سلبي"
+    return f"{direction} من {against} — {effect} {subject}"
+
+
+def parse_release(text: str):
+    """يستخرج البيان الاقتصادي من النص، أو None عند ضعف الثقة."""
+    if not text:
+        return None
+    upper = text.upper()
+    for pattern, indicator, polarity, default_country, subject in _INDICATOR_RES:
+        match = pattern.search(upper)
+        if match:
+            break
+    else:
+        return None
+
+    country = _country(text, upper[:match.start()] + " " + upper[match.end():], default_country)
+    if country is None:
+        return None
+    values = _values(upper, match.end())
+    actual = values.get(ACTUAL)
+    forecast, previous = values.get(FORECAST), values.get(PREVIOUS)
+    if actual is None or (forecast is None and previous is None):
+        return None
+
+    period = next((name for period_re, name in _PERIODS if period_re.search(upper)), "")
+    reference = forecast if forecast is not None else previous
+    verdict = _verdict(actual, reference, polarity, subject or country[1], forecast is not None)
+    return Release(country[0], indicator, period, actual, forecast, previous, verdict)
+
+
+def render_release(release: Release, note: str = "") -> str:
+    """القالب نفسه الذي تطلبه تعليمات PROMPT_ECONOMIC، مع تعليق اختياري."""
+    indicator = f"{release.indicator} ({release.period})" if release.period else release.indicator
+    lines = [
+        "🔴 صدر الآن :",
+        "",
+        f"💠 {release.country}",
+        f"🔵 {indicator}",
+        "",
+        f"🕒 السابق : {release.previous or '—'}",
+        f"🕒 التقدير : {release.forecast or '—'}",
+        f"🕓 الحالي : {release.actual}",
+        "",
+        f"👈 النتيجة : {release.verdict}",
+    ]
+    if note:
+        lines.append(f"💬 {note}")
+    return "\n".join(lines)